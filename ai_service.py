@@ -1,219 +1,185 @@
-from typing import List, Dict, Any
-
-import httpx
+import logging
+from typing import List, Dict, Any, Optional
 
 import config
-from rag_client import chroma_query
+from answer_cache import answer_key, get_answer, store_answer
+from context_packer import CONTEXT_TOKEN_BUDGET, pack_entries
+from db import get_entries_page
+from llm_client import LLMError, LLMUnavailable, PartialCallback, get_groq
+from prompt_cache import build_messages, full_name_of, get_compiled_prompt
+from retrieval import retrieve_context
+from summaries import select_summaries
+
+logger = logging.getLogger(__name__)
+
+
+# Bitta javob uchun bazadan o'qiladigan eng ko'p kundalik yozuvlari soni
+DIARY_ENTRY_LIMIT: int = getattr(config, "AI_DIARY_ENTRY_LIMIT", 50)
+# Groq javobini SSE oqimi orqali bo'lakma-bo'lak olish
+AI_STREAMING: bool = getattr(config, "AI_STREAMING", True)
+
 
+def fallback_reply(full_name: str) -> str:
+    """Groq javob bera olmaganda foydalanuvchiga ko'rsatiladigan qisqa javob.
 
-async def generate_reply_stub(profile: Dict[str, Any], entries: List[Dict[str, Any]], user_message: str) -> str:
+    Xato tafsilotlari va kundalik bo'laklari faqat logga yoziladi, foydalanuvchiga emas.
+    """
+    return (
+        f"Men {full_name}man. Hozir fikrlarimni jamlay olmayapman, "
+        "birozdan keyin shu savolni yana bir bor so'rab ko'r."
+    )
+
+
+async def generate_reply_stub(
+    profile: Dict[str, Any],
+    entries: Optional[List[Dict[str, Any]]],
+    user_message: str,
+    on_partial: Optional[PartialCallback] = None,
+) -> str:
     """Profil va kundalik yozuvlari asosida javob generatsiya qiladi.
 
     Agar AI_MODE = "ollama" bo'lsa, lokal Ollama modeliga murojaat qiladi.
     Aks holda oddiy stub (profil + kundalik matni) qaytaradi.
+
+    entries=None bo'lsa, yozuvlar bazadan o'qiladi: faqat oxirgi DIARY_ENTRY_LIMIT
+    ta yozuv, shuning uchun kundalik o'sgani sari har bir xabarning xotira va
+    vaqt sarfi o'smaydi.
+
+    on_partial berilsa va AI_STREAMING yoqilgan bo'lsa, Groq javobi oqim bilan
+    olinadi va har bir yangi bo'lakda on_partial(hozirgacha yig'ilgan matn)
+    chaqiriladi. Qaytariladigan qiymat baribir to'liq javob matni.
+
+    Groq rejimida bir profilga kundalikning bir xil holatida berilgan bir xil
+    savolga javob answer_cache'dan olinadi: prompt yig'ilmaydi va API chaqirilmaydi.
     """
 
-    name = profile.get("name", "Noma'lum")
-    surname = profile.get("surname", "")
-    nick = profile.get("nick", "")
+    ai_mode = getattr(config, "AI_MODE", "stub").lower()
+    profile_id = profile.get("id") if isinstance(profile, dict) else None
+    use_groq = ai_mode == "groq" and bool(getattr(config, "GROQ_API_KEY", "").strip())
+
+    cache_key = None
+    if use_groq and profile_id is not None:
+        cache_key = await answer_key(int(profile_id), user_message)
+        if cache_key is not None:
+            cached = await get_answer(cache_key)
+            if cached is not None:
+                return cached
+
+    if entries is None:
+        entries = (
+            await get_entries_page(int(profile_id), limit=DIARY_ENTRY_LIMIT)
+            if profile_id is not None
+            else []
+        )
+
+    full_name = full_name_of(profile)
 
-    intro_parts: List[str] = []
-    if name:
-        intro_parts.append(name)
-    if surname:
-        intro_parts.append(surname)
-    full_name = " ".join(intro_parts) if intro_parts else nick or "Profil egasi"
+    # Groq uchun profilning o'zgarmas prefiksi (qoidalar, shaxs, kundalik dayjesti)
+    # keshdan olinadi; har bir xabarda faqat savolga bog'liq qism yig'iladi
+    compiled = await get_compiled_prompt(profile) if use_groq and profile_id is not None else None
 
-    # Kundalikdan faqat haqiqiy yozuvlarni olamiz (suhbat loglarini chiqarib tashlaymiz)
-    if entries:
+    # Vektor, leksik (FTS5) va eng so'nggi yozuvlarni RRF bilan birlashtirib,
+    # dublikatlarsiz eng mos bo'laklarni olamiz
+    if entries and profile_id is not None:
+        candidates = await retrieve_context(int(profile_id), user_message, recent_entries=entries)
+    else:
+        candidates = []
+    budget = CONTEXT_TOKEN_BUDGET
+    summaries: List[Dict[str, Any]] = []
+    if compiled is not None:
+        # Dayjestda bor yozuvlar prefiksda allaqachon turibdi
+        digest_ids = compiled.digest_ids
+        candidates = [c for c in candidates if c.get("id") not in digest_ids]
+        # Uzoq tarixni savolga mos bir nechta oylik xulosa qoplaydi; xom bo'laklar
+        # qolgan byudjetga sig'diriladi, shuning uchun prompt hajmi kundalik
+        # o'sgani bilan o'smaydi
+        summaries = await select_summaries(int(profile_id), user_message)
+        used = compiled.digest_tokens + sum(s["tokens"] for s in summaries)
+        budget = max(CONTEXT_TOKEN_BUDGET - used, CONTEXT_TOKEN_BUDGET // 4)
+
+    if candidates:
         diary_texts: List[str] = []
-        for e in entries:
-            text_val = (e.get("text") or "").strip()
-            if not text_val:
-                continue
-            # Suhbat loglari "Suhbat:" bilan boshlanadi, ular AI kontekstiga kirmasin
-            if text_val.lower().startswith("suhbat:"):
-                continue
-
-            created_raw = (e.get("created_at") or "").strip()
+        for c in candidates:
+            created_raw = (c.get("created_at") or "").strip()
             created_date = created_raw[:10] if created_raw else ""
             if created_date:
-                formatted = f"[{created_date}] {text_val}"
+                formatted = f"[{created_date}] {c['text']}"
             else:
-                formatted = text_val
-
+                formatted = c["text"]
             diary_texts.append(formatted)
 
         if diary_texts:
-            # Asosiy holatda barcha bo'laklarni raqamlab beramiz
-            numbered_lines = [f"[{idx}] {item}" for idx, item in enumerate(diary_texts, start=1)]
-            base_block = (
+            # Bo'laklarni RRF reytingi bo'yicha token byudjetiga sig'guncha tanlaymiz
+            packed = pack_entries(
+                candidates,
+                user_message,
+                budget_tokens=budget,
+                formatted=diary_texts,
+                scores=[c["score"] for c in candidates],
+            )
+            logger.info(
+                "Kontekst: %d ta yozuv (~%d token) olindi, %d ta (~%d token) sig'madi",
+                len(packed.entries),
+                packed.used_tokens,
+                packed.dropped_count,
+                packed.dropped_tokens,
+            )
+            packed_texts = [diary_texts[i] for i in packed.indices]
+
+            # Tanlangan bo'laklarni raqamlab beramiz
+            numbered_lines = [f"[{idx}] {item}" for idx, item in enumerate(packed_texts, start=1)]
+            diary_block = (
                 "Quyida mening kundaligimdan raqamlangan bo'laklar berilgan. "
                 "Javob yozayotganda faqat savolga eng mos 3-5 ta bo'lakka tayangan holda gapir, "
                 "lekin raqamlarni tilga olma:\n"
                 + "\n".join(numbered_lines)
                 + "\n\n"
             )
-
-            # Agar Chroma servisi sozlangan bo'lsa, savol bo'yicha eng mos bo'laklarni so'rab olamiz
-            user_id_val = profile.get("id") if isinstance(profile, dict) else None
-            chroma_hits: List[Dict[str, Any]] = []
-            if user_id_val is not None and user_message.strip():
-                chroma_hits = await chroma_query(int(user_id_val), user_message, top_k=5)
-
-            if chroma_hits:
-                selected_lines: List[str] = []
-                for hit in chroma_hits:
-                    text_val = (hit.get("text") or "").strip()
-                    if text_val:
-                        selected_lines.append(f"- {text_val}")
-
-                diary_block = (
-                    "Kundalikdan eng mos deb topilgan parchalar (Chroma orqali):\n"
-                    + "\n".join(selected_lines)
-                    + "\n\n"
-                )
-            else:
-                diary_block = base_block
         else:
-            diary_block = "Kundalik hali bo'sh yoki faqat suhbat loglari bor.\n\n"
+            diary_block = "Kundalik hali bo'sh yoki kamroq ma'lumot bor.\n\n"
+    elif compiled is not None and compiled.digest:
+        diary_block = ""
     else:
         diary_block = "Kundalik hali bo'sh yoki kamroq ma'lumot bor.\n\n"
 
-    ai_mode = getattr(config, "AI_MODE", "stub").lower()
-
     # Agar Groq rejimi yoqilgan bo'lsa, Groq chat/completions API'ga yuboramiz
     if ai_mode == "groq":
-        api_base = getattr(
-            config,
-            "GROQ_API_BASE",
-            "https://api.groq.com/openai/v1/chat/completions",
-        )
-        api_key = getattr(config, "GROQ_API_KEY", "").strip()
-        model_name = getattr(
-            config,
-            "GROQ_MODEL",
-            "mixtral-8x7b-32768",
-        )
-
-        if not api_key:
-            # API key bo'lmasa, oddiy stubga qaytamiz
+        if compiled is None:
+            # API key bo'lmasa (yoki profil aniqlanmasa), oddiy stubga qaytamiz
             return (
                 f"{full_name}.\n\n" + diary_block +
                 "(Groq API_KEY qo'yilmagan, faqat stub javob ko'rsatilmoqda.)"
             )
 
-        # Barcha profillar uchun umumiy qoidalar
-        base_system_msg = (
-            "Sen faqat bitta odamning raqamli nusxasisan. Senga shu odamning o'ziga tegishli matnlar va profili beriladi. "
-            "HAR DOIM shu odamning o'zi bo'lib, birinchi shaxsda ('men', 'menga', 'mening') gapir. Hech qachon o'zing haqida "
-            "uchinchi shaxsda ('u', 'u haqida') gapirma va o'zingni ChatGPT, AI yoki bot deb tanishtirma. 'Bu mening botim emas' "
-            "kabi iboralarni ham ishlatma, o'zingni doim shu odamning ichki ovozi sifatida tut.\n\n"
-
-            "Senga berilgan barcha matnlarni xuddi o'zing yozgan eski xotiralar va fikrlar sifatida tasavvur qil. Ularni "
-            "tarmoq-tarmoq o'qib, odam kabi umumiy ma'no chiqar va har bir savolga mos, tirik inson gapiga o'xshash javob tuz. "
-            "Hech qachon 'kundalik', 'matn', 'bu yerda yozilgan', 'shu yerda shunday deyilgan' kabi so'zlarni tilga olma. Faqat "
-            "o'zingning xotiralaringni aytayotgandek javob ber. Masalan: 'men shunday deb o'ylayman', 'men uchun bu juda muhim', "
-            "'meni aynan shu narsa quvontirgan' kabi iboralar normal.\n\n"
-
-            "Javoblar doim sodda, ravon va mantiqli bo'lsin. Biror narsa haqida aniq ma'lumot bo'lmasa, uydirma to'qib chiqma. "
-            "Bunday holatda: 'buni aniq eslay olmayman', 'hozircha bu haqda aniq gap ayta olmayman' de. Tug'ilgan sana, manzil, "
-            "telefon, parol va shunga o'xshash maxfiy ma'lumotlarni hech qachon ochiq aytma, hatto matnlarda bo'lsa ham.\n\n"
-
-            "Agar foydalanuvchi 'o'zing haqingda gapir', 'kim bo'lgansan?', 'qanday hayot kechgansan?' desa, senga berilgan "
-            "matnlardan ma'no chiqarib, hikoya qilayotgandek gapir: 'men shunaqa oilada ulg'ayganman', 'ko'p vaqtimni mana shu "
-            "narsalarga bag'ishlaganman' va hokazo. Hech qachon 'kundalikda yozganman' yoki 'matnda shunday deyilgan' deb aytma. "
-            "Faqat natijaviy xulosani insoniy tilda yetkaz.\n\n"
-
-            "So'kinma va qo'pol so'zlarni ishlatma, hatto foydalanuvchi shunday yozsa ham. Ohang samimiy, hurmatli va ozgina "
-            "shaxsiy bo'lsin: xuddi yaqin inson bilan gaplashayotgandek. Har bir javob odatda 2–5 gapdan oshmasin. Biror so'zni "
-            "yoki iborani ketma-ket bir necha marta takrorlama, 'menimcha, menimcha, menimcha' kabi looplar qilma. Savolga aniq, "
-            "tinch va qisqa javob ber, romandek uzun matn yozma. Agar kundalik bo'laklari ko'p bo'lsa, faqat savolga eng mos 3-5 "
-            "xotiraga tayangan holda javob tuz, qolganlarini e'tiborsiz qoldir."
-        )
-
-        # Faqat ma'lum profillar (masalan, otaning niki) uchun ota-qiz ohangini qo'shamiz
-        nick_lower = (nick or "").lower()
-        is_father_profile = nick_lower in {"olim", "olimjon"}
-
-        extra_father_msg = ""
-        if is_father_profile:
-            extra_father_msg = (
-                "\n\nAgar kimdir 'dada bu sizmi?', 'men sizning qizingizman', 'men Lolaxonman' yoki 'men kimman?' desa, javoblaring "
-                "yumshoq va samimiy bo'lsin. Matnlarda qizlaring yoki oilang haqida gaplar bo'lsa, ota sifatida gapir: masalan, "
-                "'ha, qizim, qalaysan?', 'ha, Lolaxon, yaxshimisan?' kabi. Lekin baribir ichki ohangda ehtiyotkor bo'l, mutlaq hukm "
-                "bermagandek gapir: 'buni aniq ayta olmayman, lekin agar sen shunday deb yozayotgan bo'lsang, bu menga yoqimli' kabi "
-                "jumlalarni ishlat."
+        summary_block = ""
+        if summaries:
+            summary_block = (
+                "Hayotimning turli davrlari haqida qisqa xulosalar:\n"
+                + "\n".join(s["text"] for s in summaries)
+                + "\n\n"
             )
 
-        system_msg = base_system_msg + extra_father_msg
-
-        # Taxallusni (nickname) avval ko'rsatamiz, so'ng ism-familiyani
-        if nick:
-            identity_desc = f"Taxallus (nickname): *{nick}*."
-            if full_name:
-                identity_desc += f" Ism: {full_name}."
-        else:
-            identity_desc = f"Ism: {full_name}." if full_name else "Profil egasi."
-
-        # Profil va kundalikni birga beramiz, shunda model kontekstdan 'o'zi'ni his qiladi
-        profile_msg = (
-            identity_desc
-            + "\nBu odamning kundalikdan olingan ba'zi yozuvlari:\n"
-            + diary_block
+        # Barqaror prefiks birinchi (system) xabarda, savolga bog'liq qism esa undan keyin
+        messages = build_messages(
+            compiled, summary_block + diary_block + f"Foydalanuvchi savoli: {user_message}"
         )
 
-        messages = [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": profile_msg},
-            {"role": "user", "content": f"Foydalanuvchi savoli: {user_message}"},
-        ]
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-
-        try:
-            async with httpx.AsyncClient(timeout=60) as client:
-                resp = await client.post(
-                    api_base,
-                    headers=headers,
-                    json={
-                        "model": model_name,
-                        "messages": messages,
-                        "max_tokens": 768,
-                        "temperature": 0.5,
-                    },
-                )
-                # Agar 4xx/5xx bo'lsa, body tekstini ham ko'rishimiz uchun alohida saqlaymiz
-                text_body = resp.text
-                resp.raise_for_status()
-                data = resp.json()
-        except httpx.HTTPStatusError as e:  # noqa: BLE001
-            # Status xatosida ham HTTP kodni, ham serverdan kelgan body ni ko'rsatamiz
-            return (
-                f"{full_name} profili uchun Groq javobini olishda xato: {e.response.status_code} {e.response.reason_phrase}.\n"
-                f"Server javobi: {e.response.text}\n\n"
-                "Quyidagi ma'lumotlar asosida o'zingiz xulosa qilishingiz mumkin:\n\n"
-                + diary_block
-            )
-        except Exception as e:  # boshqa xatolar uchun umumiy fallback
-            return (
-                f"{full_name} profili uchun Groq javobini olishda xato: {e}.\n"
-                "Quyidagi ma'lumotlar asosida o'zingiz xulosa qilishingiz mumkin:\n\n"
-                + diary_block
-            )
-
         try:
-            choices = data.get("choices") or []
-            content = (
-                choices[0]["message"]["content"]
-                if choices and "message" in choices[0]
-                else ""
+            # Limitlar, qayta urinishlar va circuit breaker llm_client ichida
+            content = await get_groq().chat(
+                messages,
+                profile_id=profile_id,
+                max_tokens=768,
+                temperature=0.5,
+                on_partial=on_partial if AI_STREAMING else None,
             )
-        except Exception:  # noqa: BLE001
-            content = ""
+        except LLMUnavailable as e:
+            # Groq nosoz yoki limitga yetilgan: so'rov yubormasdan qisqa javob qaytaramiz
+            logger.warning("Groq hozir mavjud emas (profil %s): %s", profile_id, e)
+            return fallback_reply(full_name)
+        except LLMError as e:
+            logger.error("Groq javobini olishda xato (profil %s): %s", profile_id, e)
+            return fallback_reply(full_name)
 
         if not content:
             # Agar model bo'sh javob qaytarsa ham, oddiy, lekin shaxsga mos javob beramiz
@@ -223,7 +189,10 @@ async def generate_reply_stub(profile: Dict[str, Any], entries: List[Dict[str, A
                 f"Savolingga hozircha shuncha javob bera olaman.\n{short_diary}"
             )
 
-        return content.strip()
+        content = content.strip()
+        if cache_key is not None:
+            await store_answer(cache_key, content)
+        return content
 
     # Stub (oddiy) rejim: hech qanday modelga ulanishsiz matn qaytaramiz
     result = f"{full_name}.\n\n" + diary_block + "(AI rejimi o'chirilgan, bu oddiy stub javob.)"
@@ -0,0 +1,139 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from context_packer import tokenize
+from db import (
+    add_entries_listener,
+    add_entry_listener,
+    add_user_listener,
+    delete_cached_answers,
+    get_cached_answer,
+    get_diary_version,
+    put_cached_answer,
+)
+from ttl_cache import TTLCache
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# Tayyor javob qancha vaqt yaroqli (soniya) va xotirada nechta javob saqlanadi
+ANSWER_CACHE_TTL: float = getattr(config, "ANSWER_CACHE_TTL", 86400) if config is not None else 86400
+ANSWER_CACHE_SIZE: int = getattr(config, "ANSWER_CACHE_SIZE", 2000) if config is not None else 2000
+# Javoblarni SQLite'dagi answer_cache jadvalida ham saqlash (qayta ishga tushganda ham yo'qolmaydi)
+ANSWER_CACHE_PERSIST: bool = getattr(config, "ANSWER_CACHE_PERSIST", True) if config is not None else True
+
+_answers = TTLCache(maxsize=ANSWER_CACHE_SIZE, default_ttl=ANSWER_CACHE_TTL)
+# Profil kundaligi versiyasi; yozuv qo'shilganda listener uni o'chiradi va keyingi
+# so'rovda bazadan qayta o'qiladi
+_versions: Dict[int, str] = {}
+# Har bir bekor qilishda oshadi: bazadan versiya o'qilayotganda yozuv qo'shilsa,
+# eskirgan versiya _versions ga yozilmaydi
+_invalidations = 0
+_listener_registered = False
+
+
+def normalize_question(question: str) -> str:
+    """Savolni kesh kaliti uchun soddalashtiradi.
+
+    Katta-kichik harf, tutuq belgilari (o'/oʻ) va tinish belgilari farq qilmaydi:
+    "O'zing haqingda gapir!" va "ozing haqingda gapir" bitta kalit beradi.
+    """
+    return " ".join(tokenize(question))
+
+
+def _on_entry_added(user_id: int, entry_id: int, text: str) -> None:
+    global _invalidations
+    _invalidations += 1
+    _versions.pop(user_id, None)
+    _answers.invalidate_matching(lambda key: key[0] == user_id)
+
+
+def _on_user_changed(user_id: int, nick: str) -> None:
+    # Bazadagi javoblarni delete_user_by_id o'zi o'chiradi, bu yerda faqat xotira
+    _on_entry_added(user_id, 0, "")
+
+
+def _on_entries_changed(user_id: int, entry_ids: List[int]) -> None:
+    _on_entry_added(user_id, 0, "")
+
+
+def _ensure_listener() -> None:
+    global _listener_registered
+    if not _listener_registered:
+        add_entry_listener(_on_entry_added)
+        add_entries_listener(_on_entries_changed)
+        add_user_listener(_on_user_changed)
+        _listener_registered = True
+
+
+async def _diary_version(profile_id: int) -> str:
+    version = _versions.get(profile_id)
+    if version is None:
+        seen = _invalidations
+        version = await get_diary_version(profile_id)
+        if seen == _invalidations:
+            _versions[profile_id] = version
+    return version
+
+
+AnswerKey = Tuple[int, str, str]
+
+
+async def answer_key(profile_id: int, question: str) -> Optional[AnswerKey]:
+    """(profil, normallashtirilgan savol, kundalik versiyasi) kaliti; savol bo'sh bo'lsa None.
+
+    Kalitni javob generatsiyasidan oldin oling: generatsiya paytida yangi yozuv
+    qo'shilsa, javob eski versiya kaliti bilan saqlanadi va boshqa topilmaydi.
+    """
+    _ensure_listener()
+    question_key = normalize_question(question)
+    if not question_key:
+        return None
+    return profile_id, question_key, await _diary_version(profile_id)
+
+
+async def get_answer(key: AnswerKey) -> Optional[str]:
+    """Shu kalit bo'yicha saqlangan javobni qaytaradi (avval xotiradan, keyin SQLite'dan)."""
+    answer = _answers.get(key)
+    if answer is not None or not ANSWER_CACHE_PERSIST:
+        return answer
+    try:
+        answer = await get_cached_answer(*key, max_age=ANSWER_CACHE_TTL)
+    except Exception:
+        logger.exception("answer_cache jadvalidan o'qib bo'lmadi")
+        return None
+    if answer is not None:
+        _answers.set(key, answer)
+    return answer
+
+
+async def store_answer(key: AnswerKey, answer: str) -> None:
+    """Model javobini keshga yozadi. Xato yoki bo'sh javoblarni chaqiruvchi saqlamasligi kerak."""
+    if not answer:
+        return
+    _answers.set(key, answer)
+    if ANSWER_CACHE_PERSIST:
+        try:
+            await put_cached_answer(
+                *key, answer=answer, max_age=ANSWER_CACHE_TTL, max_rows=ANSWER_CACHE_SIZE * 5
+            )
+        except Exception:
+            logger.exception("answer_cache jadvaliga yozib bo'lmadi")
+
+
+async def invalidate_profile(profile_id: int) -> None:
+    """Profil o'chirilganda yoki kundaligi tozalanganda uning barcha javoblarini bekor qiladi."""
+    global _invalidations
+    _invalidations += 1
+    _versions.pop(profile_id, None)
+    _answers.invalidate_matching(lambda key: key[0] == profile_id)
+    if ANSWER_CACHE_PERSIST:
+        await delete_cached_answers(profile_id)
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    return _answers.stats()
@@ -0,0 +1,231 @@
+import asyncio
+import gzip
+import hmac
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from db import DB_PATH
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# /download-db uchun maxfiy token; bo'sh bo'lsa endpoint o'chiq
+BACKUP_TOKEN: str = getattr(config, "BACKUP_TOKEN", "") if config is not None else ""
+# Snapshotlar saqlanadigan katalog (standart: baza yonidagi backups/)
+BACKUP_DIR: str = (getattr(config, "BACKUP_DIR", "") if config is not None else "") or os.path.join(
+    os.path.dirname(os.path.abspath(DB_PATH)), "backups"
+)
+# Davriy snapshot oralig'i (soat, 0 - o'chiq) va saqlanadigan snapshotlar soni
+BACKUP_INTERVAL_HOURS: float = getattr(config, "BACKUP_INTERVAL_HOURS", 24.0) if config is not None else 24.0
+BACKUP_KEEP: int = getattr(config, "BACKUP_KEEP", 7) if config is not None else 7
+# Fayl o'qish/yuborish bo'lagi (bayt): xotira bazaning hajmiga bog'liq emas
+BACKUP_CHUNK_SIZE: int = getattr(config, "BACKUP_CHUNK_SIZE", 256 * 1024) if config is not None else 256 * 1024
+
+_SNAPSHOT_PREFIX = "database-"
+_SNAPSHOT_SUFFIX = ".db.gz"
+_snapshot_lock = asyncio.Lock()
+
+
+def check_backup_token(provided: Optional[str]) -> bool:
+    """Token sozlangan va berilgan qiymatga mos bo'lsa True (vaqt bo'yicha xavfsiz solishtirish)."""
+    if not BACKUP_TOKEN or not provided:
+        return False
+    return hmac.compare_digest(provided.encode(), BACKUP_TOKEN.encode())
+
+
+def _vacuum_into(src: str, dest: str) -> None:
+    # VACUUM INTO bitta o'qish tranzaksiyasida izchil nusxa yozadi. WAL rejimida
+    # yozuvchilarni to'xtatmaydi va online backup API kabi har yozuvda qayta boshlanmaydi.
+    conn = sqlite3.connect(src, timeout=30)
+    try:
+        conn.execute("VACUUM INTO ?", (dest,))
+    finally:
+        conn.close()
+
+
+def _gzip_file(src: str, dest: str, chunk_size: int) -> None:
+    with open(src, "rb") as fin, gzip.open(dest, "wb", compresslevel=6) as fout:
+        shutil.copyfileobj(fin, fout, chunk_size)
+
+
+async def create_raw_snapshot(dest: str, db_path: str = DB_PATH) -> str:
+    """Bazaning izchil (siqilmagan) nusxasini dest ga yozadi; ish alohida thread'da bajariladi."""
+    async with _snapshot_lock:
+        if os.path.exists(dest):
+            os.remove(dest)
+        await asyncio.to_thread(_vacuum_into, db_path, dest)
+    return dest
+
+
+async def create_snapshot(directory: str = BACKUP_DIR, db_path: str = DB_PATH) -> str:
+    """directory ichida yangi siqilgan snapshot (database-YYYYmmdd-HHMMSS.db.gz) yaratadi."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    final = os.path.join(directory, f"{_SNAPSHOT_PREFIX}{stamp}{_SNAPSHOT_SUFFIX}")
+    raw = final + ".tmp.db"
+    partial = final + ".part"
+    try:
+        await create_raw_snapshot(raw, db_path=db_path)
+        await asyncio.to_thread(_gzip_file, raw, partial, BACKUP_CHUNK_SIZE)
+        # Yarim yozilgan fayl hech qachon snapshot ro'yxatiga tushmasin
+        os.replace(partial, final)
+    finally:
+        for path in (raw, partial):
+            if os.path.exists(path):
+                os.remove(path)
+    return final
+
+
+def list_snapshots(directory: str = BACKUP_DIR) -> List[Dict[str, Any]]:
+    """Saqlangan snapshotlar, yangilari birinchi."""
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for name in os.listdir(directory):
+        if name.startswith(_SNAPSHOT_PREFIX) and name.endswith(_SNAPSHOT_SUFFIX):
+            st = os.stat(os.path.join(directory, name))
+            result.append({"name": name, "path": os.path.join(directory, name), "size": st.st_size, "mtime": st.st_mtime})
+    result.sort(key=lambda s: s["name"], reverse=True)
+    return result
+
+
+def prune_snapshots(keep: int = BACKUP_KEEP, directory: str = BACKUP_DIR) -> int:
+    """Eng yangi keep tasidan tashqari snapshotlarni o'chiradi va o'chirilganlar sonini qaytaradi."""
+    removed = 0
+    for snapshot in list_snapshots(directory)[max(1, keep):]:
+        try:
+            os.remove(snapshot["path"])
+            removed += 1
+        except OSError:
+            logger.warning("Eski snapshotni o'chirib bo'lmadi: %s", snapshot["path"])
+    return removed
+
+
+def _db_mtime(db_path: str) -> float:
+    mtimes = [os.path.getmtime(p) for p in (db_path, db_path + "-wal") if os.path.exists(p)]
+    return max(mtimes) if mtimes else 0.0
+
+
+def iter_file(path: str, chunk_size: int = BACKUP_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_gzip(path: str, chunk_size: int = BACKUP_CHUNK_SIZE) -> Iterator[bytes]:
+    """Faylni o'qish davomida gzip qilib, bo'lak-bo'lak qaytaradi."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in iter_file(path, chunk_size):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class BackupScheduler:
+    """BACKUP_INTERVAL_HOURS da bir snapshot oladi va eskilarini BACKUP_KEEP gacha tozalaydi.
+
+    Baza oxirgi snapshotdan beri o'zgarmagan bo'lsa, yangi snapshot olinmaydi.
+    """
+
+    def __init__(self, directory: str = BACKUP_DIR, db_path: str = DB_PATH) -> None:
+        self.directory = directory
+        self.db_path = db_path
+        self._task: Optional[asyncio.Task] = None
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_snapshot: Optional[str] = None
+        self.last_duration: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="db-backups")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        interval = BACKUP_INTERVAL_HOURS * 3600
+        while True:
+            snapshots = list_snapshots(self.directory)
+            last = snapshots[0]["mtime"] if snapshots else 0.0
+            await asyncio.sleep(max(0.0, last + interval - time.time()))
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception("Davriy snapshot olinmadi")
+                await asyncio.sleep(min(interval, 600.0))
+
+    async def run_once(self) -> Optional[str]:
+        snapshots = list_snapshots(self.directory)
+        if snapshots and _db_mtime(self.db_path) <= snapshots[0]["mtime"]:
+            self.skipped += 1
+            # Keyingi tekshiruv yana bir oraliqdan keyin bo'lsin
+            os.utime(snapshots[0]["path"])
+            return None
+        started = time.monotonic()
+        path = await create_snapshot(self.directory, db_path=self.db_path)
+        self.last_duration = time.monotonic() - started
+        self.last_snapshot = os.path.basename(path)
+        self.created += 1
+        removed = await asyncio.to_thread(prune_snapshots, BACKUP_KEEP, self.directory)
+        logger.info("Snapshot %s olindi (%.1fs), %d ta eskisi o'chirildi", self.last_snapshot, self.last_duration, removed)
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "created": self.created,
+            "skipped_unchanged": self.skipped,
+            "failed": self.failed,
+            "last_snapshot": self.last_snapshot,
+            "last_duration_seconds": self.last_duration,
+            "stored": len(list_snapshots(self.directory)),
+        }
+
+
+_scheduler: Optional[BackupScheduler] = None
+
+
+def start_backups() -> None:
+    """Davriy snapshotlarni ishga tushiradi (BACKUP_INTERVAL_HOURS = 0 bo'lsa hech narsa qilmaydi)."""
+    global _scheduler
+    if BACKUP_INTERVAL_HOURS <= 0:
+        return
+    if _scheduler is None:
+        _scheduler = BackupScheduler()
+    _scheduler.start()
+
+
+async def stop_backups() -> None:
+    if _scheduler is not None:
+        await _scheduler.stop()
+
+
+def backup_stats() -> Dict[str, Any]:
+    if _scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **_scheduler.stats()}
@@ -0,0 +1,136 @@
+"""ConnectionPool va har bir chaqiruvda yangi aiosqlite.connect() ni solishtiradi.
+
+1) Bitta so'rov kechikishi: get_user_profile ketma-ket N marta (p50/p95, ms).
+2) Handler o'tkazuvchanligi: C ta parallel "handler", har biri profilni o'qiydi,
+   yozuv qo'shadi va oxirgi yozuvlarni o'qiydi (kundalikka yozish oqimi).
+
+"connect" yo'li pul'dan oldingi kodni takrorlaydi: har bir chaqiruv o'z ulanishini
+(yangi thread va SQLite handle) ochadi, busy_timeout qo'yadi va yopadi.
+
+    python benchmarks/bench_db_pool.py --queries 2000 --handlers 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+async def _connect(db_path):
+    conn = await aiosqlite.connect(db_path)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute(f"PRAGMA busy_timeout = {int(db.DB_BUSY_TIMEOUT_MS)}")
+    return conn
+
+
+async def _profile_connect(db_path, user_id):
+    conn = await _connect(db_path)
+    try:
+        async with conn.execute(f"SELECT {db.PROFILE_COLUMNS} FROM users WHERE id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+    finally:
+        await conn.close()
+
+
+async def _add_entry_connect(db_path, user_id, text):
+    conn = await _connect(db_path)
+    try:
+        cursor = await conn.execute("INSERT INTO entries (user_id, text) VALUES (?, ?)", (user_id, text))
+        await conn.commit()
+        return cursor.lastrowid
+    finally:
+        await conn.close()
+
+
+async def _page_connect(db_path, user_id):
+    conn = await _connect(db_path)
+    try:
+        async with conn.execute(
+            "SELECT id, text, created_at FROM entries WHERE user_id = ? ORDER BY created_at DESC LIMIT 10", (user_id,)
+        ) as cursor:
+            return [dict(r) for r in await cursor.fetchall()]
+    finally:
+        await conn.close()
+
+
+async def _handler(db_path, user_id, pooled):
+    if pooled:
+        await db.get_user_profile(user_id, db_path=db_path)
+        await db.add_entry(user_id, "bugun yaxshi kun edi", db_path=db_path)
+        await db.get_entries_page(user_id, limit=10, db_path=db_path)
+    else:
+        await _profile_connect(db_path, user_id)
+        await _add_entry_connect(db_path, user_id, "bugun yaxshi kun edi")
+        await _page_connect(db_path, user_id)
+
+
+async def _latency(db_path, user_id, queries, pooled):
+    samples = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        if pooled:
+            await db.get_user_profile(user_id, db_path=db_path)
+        else:
+            await _profile_connect(db_path, user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+    }
+
+
+async def _throughput(db_path, user_ids, handlers, concurrency, pooled):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await _handler(db_path, user_ids[i % len(user_ids)], pooled)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(handlers)))
+    return round(handlers / (time.perf_counter() - started))
+
+
+async def run(queries, handlers, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        await db.init_db(db_path)
+        for i in range(20):
+            await db.create_user(i, f"Ism{i}", f"Familiya{i}", f"nik{i}", "hash", db_path=db_path)
+        user_ids = [int((await db.get_user_profile_by_nick(f"nik{i}", db_path=db_path))["id"]) for i in range(20)]
+        results = []
+        for pooled in (False, True):
+            results.append(
+                {
+                    "path": "pool" if pooled else "connect_per_call",
+                    **await _latency(db_path, user_ids[0], queries, pooled),
+                    "handlers_per_s": await _throughput(db_path, user_ids, handlers, concurrency, pooled),
+                }
+            )
+        await db.close_db()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--handlers", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    for row in asyncio.run(run(args.queries, args.handlers, args.concurrency)):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Har bir so'rovda yangi httpx.AsyncClient va umumiy (pool'li) klientni solishtiradi.
+
+Lokal stub HTTP/1.1 server keep-alive'ni qo'llaydi. Yangi ulanishda u
+`--connect-delay` kutadi - bu Groq/Chroma'gacha TCP+TLS handshake vaqtini
+taqlid qiladi (0 bo'lsa, faqat lokal TCP va klient yaratish narxi qoladi).
+Ketma-ket so'rovlar kechikishi (p50/p95) va parallel so'rovlar o'tkazuvchanligi
+o'lchanadi.
+
+    python benchmarks/bench_http_clients.py --requests 300 --concurrency 10 --connect-delay 0.03
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_clients  # noqa: E402
+
+
+async def _serve(connect_delay):
+    stats = {"connections": 0}
+
+    async def handle(reader, writer):
+        stats["connections"] += 1
+        if connect_delay:
+            await asyncio.sleep(connect_delay)
+        while True:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1], stats
+
+
+async def _request(url, pooled):
+    if pooled:
+        response = await http_clients.get_client("groq").get(url)
+    else:
+        # Pool'dan oldingi kod: har bir chaqiruv o'z klientini ochib yopadi
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.get(url)
+    response.raise_for_status()
+
+
+async def _measure(url, requests, concurrency, pooled):
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        await _request(url, pooled)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await _request(url, pooled)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "parallel_req_per_s": round(requests / (time.perf_counter() - started)),
+    }
+
+
+async def run(requests, concurrency, connect_delay):
+    results = []
+    for pooled in (False, True):
+        server, port, stats = await _serve(connect_delay)
+        try:
+            row = await _measure(f"http://127.0.0.1:{port}/", requests, concurrency, pooled)
+        finally:
+            await http_clients.close_http_clients()
+            server.close()
+            await server.wait_closed()
+        results.append({"client": "pooled" if pooled else "per_request", **row, "connections": stats["connections"]})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--connect-delay", type=float, nargs="+", default=[0.0, 0.03])
+    args = parser.parse_args()
+    for delay in args.connect_delay:
+        for row in asyncio.run(run(args.requests, args.concurrency, delay)):
+            print(json.dumps({"connect_delay_s": delay, **row}))
+
+
+if __name__ == "__main__":
+    main()
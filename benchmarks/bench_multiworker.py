@@ -0,0 +1,111 @@
+"""Ko'p jarayonli rejim o'tkazuvchanligi: 1, 2 va 4 jarayon bitta navbatni bo'shatadi.
+
+Navbatga N ta update (ko'p chatlar bo'yicha) yoziladi, keyin P ta jarayon
+ProcessCoordinator + UpdateDispatcher bilan ularni bajaradi. Handler Telegram/LLM
+javobini `--delay` soniyalik uyqu bilan taqlid qiladi. Har bir update uchun
+uchta yozuv tranzaksiyasi bor (enqueue_update, claim_updates, ack_updates) va
+ular bitta WAL qulfini bo'lishadi - natija shu narxni ham ko'rsatadi.
+
+    python benchmarks/bench_multiworker.py --updates 3000 --delay 0.02 --workers 8
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+def _worker(db_path, slots, workers, delay, start_event):
+    import multiworker
+    from update_dispatcher import UpdateDispatcher
+
+    multiworker.UPDATE_QUEUE_POLL = 0.02
+
+    async def main():
+        async def process(update):
+            await asyncio.sleep(delay)
+
+        dispatcher = UpdateDispatcher(process, workers=workers, queue_size=2000)
+        dispatcher.start()
+
+        async def handle(payload, done):
+            chat, update_id = json.loads(payload)
+            update = SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat), effective_user=None)
+            await dispatcher.put(update, on_done=done)
+
+        coordinator = multiworker.ProcessCoordinator(handle, slots=slots, db_path=db_path)
+        while not start_event.is_set():
+            await asyncio.sleep(0.01)
+        await coordinator.start()
+        while await db.count_queued_updates(db_path=db_path):
+            await asyncio.sleep(0.05)
+        await coordinator.stop()
+        await dispatcher.stop()
+        await coordinator.release_updates()
+        await db.close_db()
+
+    asyncio.run(main())
+
+
+async def _fill(db_path, slots, updates, chats):
+    await db.init_db(db_path)
+    started = time.perf_counter()
+    for update_id in range(updates):
+        chat = update_id % chats
+        await db.enqueue_update(chat % slots, json.dumps([chat, update_id]), db_path=db_path)
+    elapsed = time.perf_counter() - started
+    await db.close_db()
+    return elapsed
+
+
+def run_once(processes, updates, chats, workers, delay):
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        enqueue_seconds = asyncio.run(_fill(db_path, processes, updates, chats))
+        start_event = ctx.Event()
+        procs = [
+            ctx.Process(target=_worker, args=(db_path, processes, workers, delay, start_event))
+            for _ in range(processes)
+        ]
+        for proc in procs:
+            proc.start()
+        # Jarayonlar import va ishga tushishni tugatsin, o'lchovga kirmasin
+        time.sleep(2.0)
+        started = time.perf_counter()
+        start_event.set()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - started
+    return {
+        "processes": processes,
+        "updates": updates,
+        "enqueue_per_s": round(updates / enqueue_seconds),
+        "drain_seconds": round(elapsed, 2),
+        "updates_per_s": round(updates / elapsed),
+        "ideal_per_s": round(processes * workers / delay) if delay else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=8, help="har bir jarayondagi UpdateDispatcher workerlari")
+    parser.add_argument("--delay", type=float, default=0.02, help="bitta update'ni bajarish vaqti (soniya)")
+    args = parser.parse_args()
+    for processes in args.processes:
+        print(json.dumps(run_once(processes, args.updates, args.chats, args.workers, args.delay)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Application.process_update o'tkazuvchanligi: SQLitePersistence bilan va usiz.
+
+Har bir update ConversationHandler holatini va user_data'ni o'zgartiradi
+(bot'dagi ro'yxatdan o'tish oqimiga o'xshab). Persistence yoqilganda
+o'zgarishlar PERSISTENCE_INTERVAL/FLUSH_DELAY bo'yicha bazaga yoziladi;
+o'lchov oxirgi flush'ni ham o'z ichiga oladi.
+
+    python benchmarks/bench_persistence.py --updates 100000 --users 200 --interval 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update, User  # noqa: E402
+from telegram.ext import (  # noqa: E402
+    ApplicationBuilder,
+    CommandHandler,
+    ConversationHandler,
+    ExtBot,
+    MessageHandler,
+    filters,
+)
+
+import db  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+
+
+async def _no_network(self):
+    # Telegram'ga get_me yuborilmasin
+    self._bot_user = User(id=1, is_bot=True, first_name="Bot", username="bench_bot")
+    self._initialized = True
+
+
+ExtBot.initialize = _no_network
+
+
+def _build(db_path, with_persistence, interval):
+    async def start(update, context):
+        context.user_data["step"] = 0
+        return 1
+
+    async def step(update, context):
+        context.user_data["step"] = context.user_data.get("step", 0) + 1
+        context.user_data["last"] = update.message.text
+        return 2 if context.user_data["step"] % 2 else 1
+
+    builder = ApplicationBuilder().token("123:BENCH").updater(None)
+    if with_persistence:
+        builder = builder.persistence(SQLitePersistence(db_path=db_path, update_interval=interval))
+    app = builder.build()
+    text = filters.TEXT & ~filters.COMMAND
+    app.add_handler(
+        ConversationHandler(
+            name="main_conversation",
+            persistent=with_persistence,
+            entry_points=[CommandHandler("start", start)],
+            states={1: [MessageHandler(text, step)], 2: [MessageHandler(text, step)]},
+            fallbacks=[],
+        )
+    )
+    return app
+
+
+def _update(app, update_id, user_id, text):
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else []
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+                "text": text,
+                "entities": entities,
+            },
+        },
+        app.bot,
+    )
+
+
+async def run_once(with_persistence, updates, users, interval):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        app = _build(db_path, with_persistence, interval)
+        await app.initialize()
+        await app.start()
+        batch = [
+            _update(app, i, 1000 + i % users, "/start" if i < users else f"matn {i}") for i in range(updates)
+        ]
+        started = time.perf_counter()
+        for update in batch:
+            await app.process_update(update)
+            # Persistence sikli (update_interval) ham ishlashi uchun loop'ga navbat beramiz
+            await asyncio.sleep(0)
+        if with_persistence:
+            await app.update_persistence()
+            await app.persistence.flush()
+        elapsed = time.perf_counter() - started
+        metrics = app.persistence.metrics() if with_persistence else None
+        await app.stop()
+        await app.shutdown()
+        await db.close_db()
+    return {
+        "persistence": with_persistence,
+        "updates": updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_s": round(updates / elapsed),
+        "persistence_metrics": metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.05, help="PTB persistence update_interval (soniya)")
+    args = parser.parse_args()
+    for with_persistence in (False, True):
+        print(json.dumps(asyncio.run(run_once(with_persistence, args.updates, args.users, args.interval))))
+
+
+if __name__ == "__main__":
+    main()
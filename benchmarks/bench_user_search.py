@@ -0,0 +1,88 @@
+"""search_users_by_name_or_nick kechikishi: N ta tasodifiy profil ichida har xil so'rovlar.
+
+So'rovlar: aniq nik, xato yozilgan nik, familiya, 1-2 harfli so'z boshi va hech
+narsa topilmaydigan so'rov. Har biri uchun p50/p95 (ms) chiqariladi; indekssiz
+skan 100k profilda bir necha yuz ms oladi.
+
+    python benchmarks/bench_user_search.py --profiles 100000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+QUERIES = ("olmas", "olmsa", "karimov", "ol", "o", "zzzzqx")
+
+
+async def _fill(db_path, profiles, seed):
+    rnd = random.Random(seed)
+
+    def word(size):
+        return "".join(rnd.choice(string.ascii_lowercase) for _ in range(size))
+
+    people = [(i, word(rnd.randint(3, 8)), word(rnd.randint(4, 9)), f"{word(5)}{i}") for i in range(1, profiles + 1)]
+    people[profiles // 2] = (profiles // 2 + 1, "Olmas", "Karimov", "olmas")
+    async with db._writer(db_path) as conn:
+        await conn.executemany(
+            "INSERT INTO users (id, telegram_id, name, surname, nick, password_hash) VALUES (?, ?, ?, ?, ?, 'x')",
+            [(i, i, name, surname, nick) for i, name, surname, nick in people],
+        )
+        docs = [(i, db._user_search_doc(name, surname, nick)) for i, name, surname, nick in people]
+        await conn.executemany("INSERT INTO users_search (rowid, doc) VALUES (?, ?)", docs)
+        await conn.executemany(
+            "INSERT INTO users_search_prefix (prefix, user_id) VALUES (?, ?)",
+            [(prefix, i) for i, doc in docs for prefix in db._user_search_prefixes(doc)],
+        )
+        await conn.commit()
+
+
+async def run(profiles, repeat, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        await db.init_db(db_path)
+        await _fill(db_path, profiles, seed)
+        results = []
+        for query in QUERIES:
+            # Birinchi chaqiruv sahifalarni keshga yuklaydi
+            found = await db.search_users_by_name_or_nick(query, db_path=db_path)
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                await db.search_users_by_name_or_nick(query, db_path=db_path)
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            results.append(
+                {
+                    "query": query,
+                    "profiles": profiles,
+                    "found": len(found),
+                    "p50_ms": round(statistics.median(samples), 3),
+                    "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)], 3),
+                }
+            )
+        await db.close_db()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    for row in asyncio.run(run(args.profiles, args.repeat, args.seed)):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import asyncio
 import logging
+import os
+import tempfile
+import time
 from typing import Dict, Any, Optional
 
 from telegram import (
@@ -20,26 +23,34 @@ from telegram.ext import (
     CallbackQueryHandler,
     filters,
 )
+from telegram.error import BadRequest, RetryAfter, TelegramError
 
 from db import (
     init_db,
+    close_db,
     create_user,
-    get_user_by_nick,
-    get_user_by_id,
+    get_password_hash,
     add_entry,
-    get_entries_for_user,
+    add_chat_log,
     search_users_by_name_or_nick,
     delete_user_by_id,
-    count_users,
-    count_entries,
-    get_last_entry_time,
-    get_avg_entries_per_user,
-    get_last_user,
-    get_top_writer,
-    count_today_entries,
-    count_today_active_users,
+    get_stats_snapshot,
+    verify_stats_counters,
 )
-from ai_service import generate_reply_stub
+from ai_service import fallback_reply, generate_reply_stub
+from answer_cache import answer_cache_stats, invalidate_profile as invalidate_profile_answers
+from bulk_import import format_progress, import_file, make_job_id, resolve_user
+from chroma_sync import start_chroma_sync, stop_chroma_sync
+from http_clients import start_http_clients, close_http_clients
+from llm_client import reply_metrics
+from prompt_cache import full_name_of, invalidate_prompt
+from passwords import hash_password, verify_password, shutdown_password_hasher
+from persistence import build_persistence
+from ttl_cache import TTLCache
+from retrieval import start_retrieval, stop_retrieval
+from summaries import start_summaries, stop_summaries
+from backup import start_backups, stop_backups
+from user_cache import get_profile, get_profile_by_nick, invalidation_count, prime_profiles, user_cache_stats
 
 try:
     import config  # type: ignore
@@ -55,6 +66,19 @@ logger = logging.getLogger(__name__)
 # Iltimos config.py ichida: ADMIN_TELEGRAM_ID = 7718149728 kabi o'rnating
 ADMIN_ID = getattr(config, "ADMIN_TELEGRAM_ID", None) if config is not None else None
 
+# Kanal obunasi tekshiruvi keshi: obuna bo'lganlar uzoqroq, obuna bo'lmaganlar qisqa vaqt saqlanadi
+SUBSCRIPTION_TTL = getattr(config, "SUBSCRIPTION_CACHE_TTL", 600) if config is not None else 600
+SUBSCRIPTION_NEGATIVE_TTL = getattr(config, "SUBSCRIPTION_NEGATIVE_TTL", 30) if config is not None else 30
+subscription_cache = TTLCache(
+    maxsize=getattr(config, "SUBSCRIPTION_CACHE_SIZE", 10000) if config is not None else 10000,
+    default_ttl=SUBSCRIPTION_TTL,
+)
+
+# Oqimli javobda bitta xabarni ikki marta tahrirlash orasidagi eng qisqa vaqt (soniya)
+STREAM_EDIT_INTERVAL = getattr(config, "STREAM_EDIT_INTERVAL", 1.5) if config is not None else 1.5
+# Telegram xabar matnining eng katta uzunligi
+TELEGRAM_TEXT_LIMIT = 4096
+
 # Conversation states
 (
     MAIN_MENU,
@@ -119,11 +143,36 @@ def reg_start_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
 
-async def ensure_subscribed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+async def _check_channel_member(context: ContextTypes.DEFAULT_TYPE, channel_id: Any, user_id: int) -> Optional[bool]:
+    """Telegram'dan obunani so'raydi. Xato bo'lsa None (natija keshga yozilmaydi)."""
+    try:
+        member = await context.bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+    except Exception as e:
+        logger.warning("Obuna tekshiruvda xato: %s", e)
+        return None
+    return member.status in ("member", "administrator", "creator")
+
+
+def _subscription_ttl(subscribed: Optional[bool]) -> Optional[float]:
+    if subscribed is None:
+        return None
+    return SUBSCRIPTION_TTL if subscribed else SUBSCRIPTION_NEGATIVE_TTL
+
+
+async def ensure_subscribed(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, recheck_negative: bool = False
+) -> bool:
     """Foydalanuvchi kanalga obuna bo'lganmi-yo'qligini tekshiradi.
 
     config.REQUIRED_CHANNEL_ID da ko'rsatilgan kanalga obuna bo'lmagan
     bo'lsa, obuna bo'lish uchun linkni yuboradi va False qaytaradi.
+
+    Natija subscription_cache'da saqlanadi, shuning uchun har bir menyu
+    bosilishida get_chat_member chaqirilmaydi; bitta foydalanuvchi uchun
+    bir vaqtda kelgan tekshiruvlar bitta so'rovga birlashtiriladi.
+    recheck_negative=True bo'lsa (masalan, /start), keshdagi "obuna emas"
+    natijasiga ishonmay qayta so'raladi: foydalanuvchi endigina obuna
+    bo'lgan bo'lishi mumkin.
     """
 
     channel_id = getattr(config, "REQUIRED_CHANNEL_ID", None) if config is not None else None
@@ -135,14 +184,19 @@ async def ensure_subscribed(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not user:
         return False
 
-    try:
-        member = await context.bot.get_chat_member(chat_id=channel_id, user_id=user.id)
-        if member.status in ("member", "administrator", "creator"):
-            return True
-    except Exception as e:
-        logger.warning("Obuna tekshiruvda xato: %s", e)
+    if recheck_negative and subscription_cache.peek(user.id) is False:
+        subscription_cache.invalidate(user.id)
+
+    subscribed = await subscription_cache.get_or_load(
+        user.id,
+        lambda: _check_channel_member(context, channel_id, user.id),
+        ttl_for=_subscription_ttl,
+    )
+    if subscribed is None:
         # Agar xatolik bo'lsa, foydalanuvchini to'sib qo'ymaslik uchun ruxsat beramiz
         return True
+    if subscribed:
+        return True
 
     # Obuna bo'lmagan foydalanuvchiga kanalga obuna bo'lishni so'raymiz
     channel_username = str(channel_id)
@@ -176,8 +230,8 @@ async def ensure_subscribed(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    # Avval kanalga obuna bo'lganini tekshiramiz
-    if not await ensure_subscribed(update, context):
+    # Avval kanalga obuna bo'lganini tekshiramiz (obuna bo'lib qaytgan bo'lsa, qayta so'raymiz)
+    if not await ensure_subscribed(update, context, recheck_negative=True):
         # Obuna bo'lmasa, asosiy menyu holatida qolamiz, lekin menyuni ko'rsatmaymiz
         return MAIN_MENU
 
@@ -247,8 +301,8 @@ async def howto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(text, reply_markup=main_menu_keyboard())
 
 
-async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Faqat admin uchun statistik ma'lumotlar."""
+async def _ensure_admin(update: Update) -> bool:
+    """Buyruqni faqat admin ishlata oladi; aks holda foydalanuvchiga sababini yozadi."""
     user = update.effective_user
     user_id = user.id if user else None
 
@@ -258,25 +312,40 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "Admin ID sozlanmagan. Iltimos config.py ichida ADMIN_TELEGRAM_ID ni o'rnating.",
             reply_markup=main_menu_keyboard(),
         )
-        return
+        return False
 
     # Faqat bitta aniq admin uchun ruxsat beramiz
     if user_id != ADMIN_ID:
         await update.message.reply_text(
             "Bu buyruq faqat admin uchun.", reply_markup=main_menu_keyboard()
         )
-        return
+        return False
+    return True
 
-    total_users = await count_users()
-    total_entries = await count_entries()
-    last_entry_time = await get_last_entry_time()
-    avg_entries = await get_avg_entries_per_user()
 
-    last_user = await get_last_user()
-    top_writer = await get_top_writer()
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Faqat admin uchun statistik ma'lumotlar."""
+    if not await _ensure_admin(update):
+        return
 
-    today_entries = await count_today_entries()
-    today_active_users = await count_today_active_users()
+    # Barcha ko'rsatkichlar tayyor hisoblagichlardan bitta so'rovda olinadi
+    snapshot = await get_stats_snapshot()
+    total_users = snapshot["users"]
+    total_entries = snapshot["entries"]
+    last_entry_time = snapshot["last_entry_at"]
+    avg_entries = snapshot["avg_entries_per_user"]
+
+    last_user = snapshot["last_user"]
+    top_writer = snapshot["top_writer"]
+
+    today_entries = snapshot["today_entries"]
+    today_active_users = snapshot["today_active_users"]
+    sub_stats = subscription_cache.stats()
+    ai_stats = reply_metrics()
+    answer_stats = answer_cache_stats()
+    user_stats = user_cache_stats()
+    ttft = ai_stats["ttft_seconds"]
+    ttft_text = f"p50 {ttft['p50']:.2f}s / p95 {ttft['p95']:.2f}s" if ttft["p50"] is not None else "hali yo'q"
 
     # Vaqt bo'sh bo'lsa, foydalanuvchi hali yozuv kiritmagan bo'lishi mumkin
     last_entry_text = last_entry_time if last_entry_time else "hali yozuvlar yo'q"
@@ -299,12 +368,126 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"- Bugungi yozuvlar soni: {today_entries}\n"
         f"- Bugun faol bo'lgan foydalanuvchilar: {today_active_users}\n"
         f"- Oxirgi qo'shilgan foydalanuvchi: {last_user_text}\n"
-        f"- Eng ko'p yozgan foydalanuvchi: {top_writer_text}"
+        f"- Eng ko'p yozgan foydalanuvchi: {top_writer_text}\n"
+        f"- Obuna keshi: {sub_stats['size']} ta, hit {sub_stats['hits']} / miss {sub_stats['misses']} "
+        f"({sub_stats['hit_ratio'] * 100:.0f}%)\n"
+        f"- AI birinchi token vaqti: {ttft_text}\n"
+        f"- Groq: breaker {ai_stats['breaker']}, qayta urinishlar {ai_stats['retries']}, "
+        f"xatolar {ai_stats['failures']}, rad etilgan {ai_stats['rejected']}\n"
+        f"- Javoblar keshi: {answer_stats['size']} ta, hit {answer_stats['hits']} / miss {answer_stats['misses']} "
+        f"({answer_stats['hit_ratio'] * 100:.0f}%)\n"
+        f"- Profillar keshi: {user_stats['by_id']['size']} ta, hit {user_stats['by_id']['hits'] + user_stats['by_nick']['hits']} "
+        f"/ miss {user_stats['by_id']['misses'] + user_stats['by_nick']['misses']} ({user_stats['hit_ratio'] * 100:.0f}%)"
     )
 
     await update.message.reply_text(text, reply_markup=main_menu_keyboard())
 
 
+async def stats_check(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin uchun: statistika hisoblagichlarini tekshiradi va kerak bo'lsa noldan qayta quradi."""
+    if not await _ensure_admin(update):
+        return
+
+    result = await verify_stats_counters(repair=True)
+    if result["repaired"]:
+        text = (
+            "⚠️ Hisoblagichlar mos emas edi va qayta qurildi:\n"
+            f"- Umumiy: {result['totals']}\n"
+            f"- Foydalanuvchilar bo'yicha: {result['user_entry_counts']}\n"
+            f"- Kunlar bo'yicha: {result['daily_entry_counts']}"
+        )
+    else:
+        text = "✅ Statistika hisoblagichlari bazaga mos."
+    await update.message.reply_text(text, reply_markup=main_menu_keyboard())
+
+
+# Import jarayonida holat xabari shu oraliqdan (soniya) tez-tez tahrirlanmaydi
+IMPORT_PROGRESS_INTERVAL = 5.0
+_import_tasks: "set[asyncio.Task]" = set()
+
+
+async def _run_import(profile: Dict[str, Any], path: str, job_id: str, status_message, cleanup: bool) -> None:
+    last_edit = 0.0
+
+    async def progress(report: Dict[str, Any]) -> None:
+        nonlocal last_edit
+        if time.monotonic() - last_edit < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status_message.edit_text(format_progress(report))
+        except TelegramError:
+            pass
+
+    try:
+        report = await import_file(int(profile["id"]), path, job_id=job_id, progress=progress)
+        text = f"✅ {format_progress(report)}\nProfil: *{profile['nick']}*"
+    except Exception as e:
+        logger.exception("Import %s xato bilan to'xtadi", job_id)
+        text = (
+            f"⚠️ Import to'xtadi: {e}\n"
+            "Qaytadan yuborsangiz, saqlangan joydan davom etadi."
+        )
+    finally:
+        if cleanup:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    try:
+        await status_message.edit_text(text)
+    except TelegramError:
+        await status_message.reply_text(text)
+
+
+async def import_entries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin uchun: kundalik yozuvlarini JSONL/TXT fayldan profilga ommaviy import qiladi.
+
+    Fayl "/import <nick>" izohi bilan hujjat sifatida yuboriladi yoki (Telegram
+    yuklab beradigan 20 MB dan katta fayllar uchun) serverdagi yo'l beriladi:
+    "/import <nick> <yo'l>". Import fonda ishlaydi va holat xabari yangilanib boradi.
+    """
+    if not await _ensure_admin(update):
+        return
+
+    message = update.message
+    args = (message.caption or message.text or "").split()[1:]
+    document = message.document
+    if not args or (document is None and len(args) < 2):
+        await message.reply_text(
+            "Foydalanish: faylni \"/import <nick>\" izohi bilan yuboring yoki /import <nick> <serverdagi yo'l>.",
+            reply_markup=main_menu_keyboard(),
+        )
+        return
+
+    profile = await resolve_user(args[0])
+    if profile is None:
+        await message.reply_text("Bunday profil topilmadi.", reply_markup=main_menu_keyboard())
+        return
+
+    if document is not None:
+        suffix = os.path.splitext(document.file_name or "")[1] or ".txt"
+        fd, path = tempfile.mkstemp(prefix="import-", suffix=suffix)
+        os.close(fd)
+        tg_file = await document.get_file()
+        await tg_file.download_to_drive(path)
+        # Bir xil fayl qayta yuborilsa, import oxirgi saqlangan joydan davom etadi
+        job_id = f"tg-{profile['id']}-{document.file_unique_id}"
+        cleanup = True
+    else:
+        path = " ".join(args[1:])
+        if not os.path.isfile(path):
+            await message.reply_text("Fayl topilmadi.", reply_markup=main_menu_keyboard())
+            return
+        job_id = make_job_id(int(profile["id"]), path)
+        cleanup = False
+
+    status_message = await message.reply_text(f"Import boshlandi ({job_id})...")
+    task = asyncio.create_task(_run_import(profile, path, job_id, status_message, cleanup))
+    _import_tasks.add(task)
+    task.add_done_callback(_import_tasks.discard)
+
+
 async def main_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text_raw = (update.message.text or "").strip()
     text = text_raw.lower()
@@ -405,8 +588,6 @@ async def reg_nick(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 async def reg_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    import bcrypt
-
     text = (update.message.text or "").strip()
     if "ortga" in text.lower():
         # Bir qadam ortga: taxallus so'rash bosqichiga qaytamiz
@@ -424,7 +605,8 @@ async def reg_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     surname = context.user_data.get("reg_surname")
     nick = context.user_data.get("reg_nick")
 
-    password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    # Hashlash thread pool'da bajariladi, event loop boshqa update'larni qayta ishlashda davom etadi
+    password_hash = await hash_password(password)
 
     created = await create_user(
         telegram_id=update.effective_user.id,
@@ -468,8 +650,6 @@ async def login_nick(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    import bcrypt
-
     text = (update.message.text or "").strip()
     if "ortga" in text.lower():
         await update.message.reply_text(
@@ -480,16 +660,13 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     nick = context.user_data.get("login_nick")
     password = text
 
-    user = await get_user_by_nick(nick)
+    user = await get_profile_by_nick(nick or "")
     if not user:
         await update.message.reply_text("Bunday nik topilmadi.", reply_markup=main_menu_keyboard())
         return MAIN_MENU
 
-    stored_hash = user.get("password_hash", "")
-    try:
-        valid = bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("utf-8"))
-    except ValueError:
-        valid = False
+    # Parol hashi keshlanmaydi: har bir tekshiruvda bazadan o'qiladi
+    valid = await verify_password(password, await get_password_hash(user["id"]) or "")
 
     if not valid:
         await update.message.reply_text("Parol noto'g'ri.", reply_markup=main_menu_keyboard())
@@ -504,8 +681,6 @@ async def login_password(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def delete_account_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    import bcrypt
-
     text = (update.message.text or "").strip()
     if "ortga" in text.lower():
         # Bir qadam ortga: profil menyusiga qaytamiz
@@ -528,18 +703,14 @@ async def delete_account_password(update: Update, context: ContextTypes.DEFAULT_
         )
         return MAIN_MENU
 
-    user = await get_user_by_id(user_id)
-    if not user:
+    password_hash = await get_password_hash(user_id)
+    if password_hash is None:
         await update.message.reply_text(
             "Hisob topilmadi.", reply_markup=main_menu_keyboard()
         )
         return MAIN_MENU
 
-    stored_hash = user.get("password_hash", "")
-    try:
-        valid = bcrypt.checkpw(text.encode("utf-8"), stored_hash.encode("utf-8"))
-    except ValueError:
-        valid = False
+    valid = await verify_password(text, password_hash)
 
     if not valid:
         await update.message.reply_text(
@@ -549,6 +720,8 @@ async def delete_account_password(update: Update, context: ContextTypes.DEFAULT_
         return DELETE_ACCOUNT_PASSWORD
 
     await delete_user_by_id(user_id)
+    await invalidate_profile_answers(user_id)
+    invalidate_prompt(user_id)
     context.user_data.pop("profile_user_id", None)
     await update.message.reply_text(
         "Hisobingiz va barcha kundalik yozuvlaringiz o'chirildi.",
@@ -643,7 +816,10 @@ async def search_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         return MAIN_MENU
 
     query = text
+    seen = invalidation_count()
     results = await search_users_by_name_or_nick(query)
+    # Natijalardan biri tanlanganda profil bazadan qayta o'qilmaydi
+    prime_profiles(results, seen)
 
     if not results:
         await update.message.reply_text(
@@ -672,9 +848,78 @@ async def search_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     return SEARCH_QUERY
 
 
+class StreamingMessage:
+    """AI javobini bitta Telegram xabarida bosqichma-bosqich ko'rsatadi.
+
+    Avval "yozmoqda" belgisi bilan vaqtinchalik xabar yuboriladi, so'ng javob
+    kelgani sari u tahrirlanadi. Tahrirlar STREAM_EDIT_INTERVAL dan tez-tez
+    bo'lmaydi; Telegram RetryAfter qaytarsa, shu muddat tahrirlar o'tkazib yuboriladi.
+    """
+
+    PLACEHOLDER = "✍️ ..."
+    CURSOR = " ▌"
+
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL) -> None:
+        self._source = message
+        self._interval = interval
+        self._message = None
+        self._last_edit = 0.0
+        self._shown = ""
+        self._paused_until = 0.0
+
+    async def start(self, reply_markup=None) -> None:
+        self._message = await self._source.reply_text(self.PLACEHOLDER, reply_markup=reply_markup)
+        self._last_edit = time.monotonic()
+
+    async def _edit(self, text: str) -> None:
+        text = text[:TELEGRAM_TEXT_LIMIT]
+        if self._message is None or not text or text == self._shown:
+            return
+        try:
+            await self._message.edit_text(text)
+            self._shown = text
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            self._paused_until = time.monotonic() + float(retry_after)
+        except BadRequest as e:
+            # "Message is not modified" va shunga o'xshashlar zararsiz
+            logger.debug("Xabarni tahrirlab bo'lmadi: %s", e)
+        except TelegramError as e:
+            # Oraliq tahrir (TimedOut, NetworkError) muhim emas: yakuniy matn finish() da chiqadi
+            logger.warning("Oraliq tahrir bajarilmadi: %s", e)
+        self._last_edit = time.monotonic()
+
+    async def update(self, text: str) -> None:
+        now = time.monotonic()
+        if now < self._paused_until or now - self._last_edit < self._interval:
+            return
+        await self._edit(text.rstrip() + self.CURSOR)
+
+    async def finish(self, text: str, reply_markup=None) -> None:
+        """Yakuniy matnni ko'rsatadi. Tahrirlab bo'lmasa yoki matn uzun bo'lsa, yangi xabar yuboradi."""
+        if self._message is not None and len(text) <= TELEGRAM_TEXT_LIMIT:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                if text != self._shown:
+                    await self._message.edit_text(text)
+                return
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return
+                logger.warning("Yakuniy javobni tahrirlab bo'lmadi: %s", e)
+            except TelegramError as e:
+                logger.warning("Yakuniy javobni tahrirlab bo'lmadi: %s", e)
+        for start in range(0, len(text), TELEGRAM_TEXT_LIMIT):
+            await self._source.reply_text(text[start:start + TELEGRAM_TEXT_LIMIT], reply_markup=reply_markup)
+
+
 async def chat_with_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    # Profil tanlangan, endi har bir xabarni AI ga yuboramiz
-    profile = context.user_data.get("chat_profile")
+    # Profil tanlangan, endi har bir xabarni AI ga yuboramiz. user_data'da faqat id
+    # saqlanadi, profilning o'zi keshdan olinadi (o'chirilgan bo'lsa None qaytadi)
+    profile_id = context.user_data.get("chat_profile_id")
+    profile = await get_profile(profile_id) if profile_id else None
     if not profile:
         await update.message.reply_text(
             "Profil topilmadi. /start bilan qaytadan boshlang.",
@@ -682,7 +927,6 @@ async def chat_with_profile(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return MAIN_MENU
 
-    entries = await get_entries_for_user(profile["id"], limit=100)
     user_message = (update.message.text or "").strip()
 
     lower_msg = user_message.lower()
@@ -692,14 +936,29 @@ async def chat_with_profile(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return MAIN_MENU
 
-    reply = await generate_reply_stub(profile, entries, user_message)
+    # Vaqtinchalik xabar darhol chiqadi va Groq javobi kelgani sari tahrirlanadi,
+    # shuning uchun foydalanuvchi butun javobni emas, faqat birinchi bo'lakni kutadi
+    streaming = StreamingMessage(update.message)
+    await streaming.start(reply_markup=chat_menu_keyboard())
+
+    # Kundalik yozuvlarini generate_reply_stub o'zi kerakli miqdorda o'qiydi
+    try:
+        reply = await generate_reply_stub(profile, None, user_message, on_partial=streaming.update)
+    except Exception:
+        # Vaqtinchalik xabar "..." holida qolib ketmasin va suhbat logi yozilsin
+        logger.exception("Profil %s uchun javob olinmadi", profile["id"])
+        reply = fallback_reply(full_name_of(profile))
 
-    await update.message.reply_text(reply, reply_markup=chat_menu_keyboard())
+    await streaming.finish(reply, reply_markup=chat_menu_keyboard())
 
-    # Suhbatdan ham ozgina "xotira" sifatida foydalanish uchun savol+javobni ham saqlab qo'yamiz
+    # Savol+javobni kundalikka emas, alohida chat_logs jadvaliga yozib qo'yamiz
     try:
-        log_text = f"Suhbat: foydalanuvchi savoli: {user_message}\nMening javobim: {reply}"
-        await add_entry(user_id=profile["id"], text=log_text)
+        await add_chat_log(
+            profile_id=profile["id"],
+            question=user_message,
+            answer=reply,
+            asker_telegram_id=update.effective_user.id if update.effective_user else None,
+        )
     except Exception:
         # Agar yozib bo'lmasa, butun chatni to'xtatmaymiz
         pass
@@ -723,7 +982,7 @@ async def choose_profile_callback(update: Update, context: ContextTypes.DEFAULT_
         )
         return MAIN_MENU
 
-    profile = await get_user_by_id(user_id)
+    profile = await get_profile(user_id)
     if not profile:
         await query.message.reply_text(
             "Profil topilmadi. /start bilan qaytadan urinib ko'ring.",
@@ -731,7 +990,8 @@ async def choose_profile_callback(update: Update, context: ContextTypes.DEFAULT_
         )
         return MAIN_MENU
 
-    context.user_data["chat_profile"] = profile
+    context.user_data.pop("chat_profile", None)
+    context.user_data["chat_profile_id"] = profile["id"]
 
     await query.message.reply_text(
         f"Endi siz *{profile['nick']}* ({profile['name']} {profile['surname']}) bilan gaplashyapsiz. Savolingizni yozing.",
@@ -758,7 +1018,23 @@ async def non_text_warning(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
 
 async def post_init(application: Application) -> None:
+    # init_db baza ulanishlari pul'ini ham ochadi, ular bot ishlagan davomida ochiq turadi
     await init_db()
+    await start_http_clients()
+    start_chroma_sync()
+    await start_retrieval()
+    start_summaries()
+    start_backups()
+
+
+async def post_shutdown(application: Application) -> None:
+    await stop_retrieval()
+    await stop_backups()
+    await stop_summaries()
+    await stop_chroma_sync()
+    await close_http_clients()
+    shutdown_password_hasher()
+    await close_db()
 
 
 def build_application(token: str) -> Application:
@@ -768,14 +1044,22 @@ def build_application(token: str) -> Application:
     qayta ishlatiladi.
     """
 
-    application = (
+    builder = (
         ApplicationBuilder()
         .token(token)
         .post_init(post_init)
-        .build()
+        .post_shutdown(post_shutdown)
     )
+    # user_data va suhbat holati SQLite'da saqlanadi: qayta ishga tushganda
+    # foydalanuvchilar /start ga qaytib ketmaydi
+    persistence = build_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
 
     conv_handler = ConversationHandler(
+        name="main_conversation",
+        persistent=persistence is not None,
         entry_points=[CommandHandler("start", start)],
         states={
             MAIN_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu_handler)],
@@ -803,7 +1087,12 @@ def build_application(token: str) -> Application:
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("about", about))
     application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("stats_check", stats_check))
     application.add_handler(CommandHandler("howto", howto))
+    application.add_handler(CommandHandler("import", import_entries))
+    application.add_handler(
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import(@\w+)?\b"), import_entries)
+    )
     # Matn bo'lmagan barcha xabarlar uchun umumiy ogohlantirish handleri
     application.add_handler(MessageHandler(~filters.TEXT, non_text_warning))
 
@@ -0,0 +1,309 @@
+"""Kundalik yozuvlarini katta fayldan ommaviy import qilish.
+
+Fayl oqim sifatida o'qiladi (butunlay xotiraga yuklanmaydi), yozuvlar
+IMPORT_BATCH_SIZE lik partiyalarda bitta tranzaksiya bilan qo'shiladi va
+har bir partiya bilan birga import_jobs dagi fayl pozitsiyasi saqlanadi.
+Import to'xtab qolsa, xuddi shu job_id bilan qayta ishga tushiring - u
+oxirgi saqlangan joydan davom etadi.
+
+Formatlar:
+  jsonl - har qatorda {"text": "...", "created_at": "2021-03-05 21:10:00"}
+          ("entry"/"content" va "date" kalitlari ham qabul qilinadi);
+  txt   - bo'sh qator bilan ajratilgan bo'laklar; bo'lak "2021-03-05" yoki
+          "2021-03-05 21:10" sanasi bilan boshlansa, u created_at bo'ladi.
+
+CLI:  python bulk_import.py <nick yoki id> <fayl> [--format jsonl|txt] [--job ID]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from db import (
+    DB_PATH,
+    add_entries_bulk,
+    close_db,
+    finish_import_job,
+    get_user_profile,
+    get_user_profile_by_nick,
+    init_db,
+    start_import_job,
+)
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# Bitta tranzaksiyadagi yozuvlar soni
+IMPORT_BATCH_SIZE: int = getattr(config, "IMPORT_BATCH_SIZE", 1000) if config is not None else 1000
+# Bitta yozuvning eng ko'p uzunligi (belgi); uzunroq bo'laklar gaplar chegarasida bo'linadi
+IMPORT_MAX_ENTRY_CHARS: int = getattr(config, "IMPORT_MAX_ENTRY_CHARS", 4000) if config is not None else 4000
+
+_DATE_PREFIX_RE = re.compile(r"^\s*(\d{4}-\d{2}-\d{2})(?:[ T](\d{2}:\d{2})(:\d{2})?)?\s*[-—:|]?\s*")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+# make_job_id uchun fayl boshidan o'qiladigan bayt soni
+_JOB_ID_HEAD_BYTES = 64 * 1024
+
+# (bo'laklar, created_at, manba yozuvidan keyingi bayt pozitsiyasi)
+ParsedEntry = Tuple[List[str], Optional[str], int]
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def detect_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "txt"
+
+
+def _normalize_date(value: Any) -> Optional[str]:
+    """Sanani bazadagi CURRENT_TIMESTAMP ko'rinishiga ("YYYY-MM-DD HH:MM:SS") keltiradi."""
+    if not isinstance(value, str):
+        return None
+    match = _DATE_PREFIX_RE.match(value)
+    if not match:
+        return None
+    day, hm, sec = match.groups()
+    return f"{day} {hm or '00:00'}{sec or ':00'}"
+
+
+def split_long_text(text: str, max_chars: int = IMPORT_MAX_ENTRY_CHARS) -> List[str]:
+    """Juda uzun matnni gaplar chegarasida max_chars dan oshmaydigan bo'laklarga ajratadi."""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    parts: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text):
+        while len(sentence) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _iter_lines(f, start: int) -> Iterator[Tuple[bytes, int]]:
+    f.seek(start)
+    position = start
+    for raw in f:
+        position += len(raw)
+        yield raw, position
+
+
+def iter_jsonl(f, start: int = 0, errors: Optional[List[int]] = None) -> Iterator[ParsedEntry]:
+    """JSONL faylining har bir qatori uchun ParsedEntry."""
+    for raw, position in _iter_lines(f, start):
+        line = raw.decode("utf-8", errors="replace").strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = None
+        text = None
+        if isinstance(item, dict):
+            text = item.get("text") or item.get("entry") or item.get("content")
+        elif isinstance(item, str):
+            text = item
+        if not isinstance(text, str) or not text.strip():
+            if errors is not None:
+                errors.append(position)
+            continue
+        created_at = _normalize_date(item.get("created_at") or item.get("date")) if isinstance(item, dict) else None
+        yield split_long_text(text), created_at, position
+
+
+def iter_txt(f, start: int = 0, errors: Optional[List[int]] = None) -> Iterator[ParsedEntry]:
+    """Bo'sh qator bilan ajratilgan matnning har bir bo'lagi uchun ParsedEntry."""
+    lines: List[str] = []
+
+    def flush(position: int) -> Iterator[ParsedEntry]:
+        block = "\n".join(lines).strip()
+        lines.clear()
+        if not block:
+            return
+        created_at = None
+        match = _DATE_PREFIX_RE.match(block)
+        if match:
+            created_at = _normalize_date(block)
+            block = block[match.end():].strip()
+        yield split_long_text(block), created_at, position
+
+    position = start
+    for raw, position in _iter_lines(f, start):
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            yield from flush(position)
+    yield from flush(position)
+
+
+def make_job_id(user_id: int, path: str) -> str:
+    """Bir xil fayl bir xil profilga qayta berilsa, import davom ettiriladi.
+
+    Fayl nomi va hajmidan tashqari boshidagi _JOB_ID_HEAD_BYTES bayt ham hisobga
+    olinadi: nomi va hajmi bir xil, lekin mazmuni boshqa fayl eski importning
+    pozitsiyasidan davom ettirilmaydi.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = hashlib.sha1(f.read(_JOB_ID_HEAD_BYTES)).hexdigest()
+    digest = hashlib.sha1(f"{user_id}:{os.path.basename(path)}:{size}:{head}".encode()).hexdigest()[:16]
+    return f"u{user_id}-{digest}"
+
+
+async def import_file(
+    user_id: int,
+    path: str,
+    fmt: Optional[str] = None,
+    job_id: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress: Optional[ProgressCallback] = None,
+    db_path: str = DB_PATH,
+) -> Dict[str, Any]:
+    """Faylni user_id profiliga import qiladi va yakuniy hisobotni qaytaradi.
+
+    progress(report) har bir partiya commit qilingandan keyin chaqiriladi.
+    Fayl o'qish va JSON tahlili alohida thread'da bajariladi, event loop to'silmaydi.
+    """
+    fmt = fmt or detect_format(path)
+    job_id = job_id or make_job_id(user_id, path)
+    job = await start_import_job(job_id, user_id, os.path.basename(path), db_path=db_path)
+    report: Dict[str, Any] = {
+        "job_id": job_id,
+        "status": job["status"],
+        "total_bytes": os.path.getsize(path),
+        "position": int(job["position"]),
+        "imported": int(job["imported"]),
+        "skipped": int(job["skipped"]),
+        "resumed": int(job["position"]) > 0,
+    }
+    if job["status"] == "done":
+        return report
+
+    started = time.monotonic()
+    errors: List[int] = []
+    with open(path, "rb") as f:
+        parse = iter_jsonl if fmt == "jsonl" else iter_txt
+        entries = parse(f, int(job["position"]), errors)
+
+        def next_batch() -> Tuple[List[Tuple[str, Optional[str]]], Optional[int]]:
+            rows: List[Tuple[str, Optional[str]]] = []
+            position = None
+            # Bitta manba yozuvining bo'laklari bitta partiyaga tushadi: pozitsiya doim
+            # to'liq qo'shilgan yozuvdan keyingi joyni ko'rsatadi
+            for parts, created_at, position in entries:
+                rows.extend((text, created_at) for text in parts)
+                if len(rows) >= batch_size:
+                    break
+            return rows, position
+
+        try:
+            while True:
+                rows, position = await asyncio.to_thread(next_batch)
+                if position is None and not errors:
+                    break
+                skipped = len(errors)
+                # Faqat noto'g'ri qatorlar bo'lsa ham pozitsiyani oldinga suramiz
+                position = max(position or 0, errors[-1] if errors else 0)
+                errors.clear()
+                ids = await add_entries_bulk(
+                    user_id, rows, job_id=job_id, position=position, skipped=skipped, db_path=db_path
+                )
+                report["position"] = position
+                report["imported"] += len(ids)
+                report["skipped"] += skipped
+                elapsed = max(time.monotonic() - started, 1e-6)
+                report["rate_per_sec"] = (report["imported"] - int(job["imported"])) / elapsed
+                if progress is not None:
+                    await progress(dict(report))
+                if not rows:
+                    break
+        except BaseException:
+            await finish_import_job(job_id, status="paused", db_path=db_path)
+            report["status"] = "paused"
+            raise
+
+    await finish_import_job(job_id, db_path=db_path)
+    report["status"] = "done"
+    report["position"] = report["total_bytes"]
+    return report
+
+
+def format_progress(report: Dict[str, Any]) -> str:
+    total = report.get("total_bytes") or 1
+    percent = min(100.0, 100.0 * report.get("position", 0) / total)
+    rate = report.get("rate_per_sec")
+    rate_text = f", {rate:.0f} ta/s" if rate else ""
+    return (
+        f"Import {report['job_id']}: {percent:.0f}% — {report['imported']} ta yozuv qo'shildi, "
+        f"{report['skipped']} ta qator o'tkazib yuborildi{rate_text}"
+    )
+
+
+async def resolve_user(ref: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """Profilni id yoki nick bo'yicha topadi."""
+    if ref.isdigit():
+        profile = await get_user_profile(int(ref), db_path=db_path)
+        if profile is not None:
+            return profile
+    return await get_user_profile_by_nick(ref.lstrip("@"), db_path=db_path)
+
+
+async def _cli(args: argparse.Namespace) -> int:
+    await init_db(args.db)
+    try:
+        profile = await resolve_user(args.user, db_path=args.db)
+        if profile is None:
+            print(f"Profil topilmadi: {args.user}")
+            return 1
+
+        async def progress(report: Dict[str, Any]) -> None:
+            print(format_progress(report), flush=True)
+
+        report = await import_file(
+            int(profile["id"]),
+            args.path,
+            fmt=args.format,
+            job_id=args.job,
+            batch_size=args.batch,
+            progress=progress,
+            db_path=args.db,
+        )
+        print(format_progress(report))
+        print(f"Holat: {report['status']}")
+        return 0
+    finally:
+        await close_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kundalik yozuvlarini fayldan ommaviy import qilish")
+    parser.add_argument("user", help="profil nicki yoki id si")
+    parser.add_argument("path", help="JSONL yoki TXT fayl")
+    parser.add_argument("--format", choices=("jsonl", "txt"), default=None, help="fayl kengaytmasidan aniqlanadi")
+    parser.add_argument("--job", default=None, help="davom ettiriladigan import id si")
+    parser.add_argument("--batch", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--db", default=DB_PATH)
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(asyncio.run(_cli(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+from db import (
+    DB_PATH,
+    add_entry_listener,
+    ack_chroma_outbox,
+    get_chroma_outbox_batch,
+    get_chroma_outbox_next_due,
+    retry_chroma_outbox,
+)
+from rag_client import chroma_enabled, chroma_upsert
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# Bitta POST /upsert_entries so'rovidagi eng ko'p yozuvlar soni
+CHROMA_SYNC_BATCH_SIZE: int = getattr(config, "CHROMA_SYNC_BATCH_SIZE", 64) if config is not None else 64
+# Yangi yozuv kelgach, partiya to'planishi uchun kutiladigan vaqt (soniya)
+CHROMA_SYNC_BATCH_WINDOW: float = getattr(config, "CHROMA_SYNC_BATCH_WINDOW", 2.0) if config is not None else 2.0
+# Qayta urinishlar orasidagi kutish: 2, 4, 8 ... soniya, eng ko'pi bilan shuncha
+CHROMA_SYNC_MAX_BACKOFF: float = getattr(config, "CHROMA_SYNC_MAX_BACKOFF", 600.0) if config is not None else 600.0
+# Navbatda hech narsa bo'lmasa ham vaqti-vaqti bilan tekshirib turamiz
+_IDLE_POLL_SECONDS = 60.0
+
+
+class ChromaSyncWorker:
+    """chroma_outbox navbatini fon rejimida Chroma'ga partiyalab yuboruvchi indeksator.
+
+    add_entry yozuvni outbox'ga qo'yadi va listener orqali shu workerni uyg'otadi.
+    Worker partiya to'planishi uchun CHROMA_SYNC_BATCH_WINDOW kutadi, keyin
+    navbatni CHROMA_SYNC_BATCH_SIZE lik bo'laklarda yuboradi. Xato bo'lsa,
+    yozuvlar exponential backoff bilan keyinroq qayta yuboriladi.
+    """
+
+    def __init__(self, db_path: str = DB_PATH) -> None:
+        self.db_path = db_path
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self, *_args) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="chroma-sync")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        # Ishga tushganda avvalgi jarayondan qolgan navbatni ham yuboramiz
+        self._wakeup.set()
+        while True:
+            timeout = await self._next_timeout()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                # Partiya to'planishi uchun biroz kutamiz
+                await asyncio.sleep(CHROMA_SYNC_BATCH_WINDOW)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chroma sync navbatini yuborishda kutilmagan xato")
+
+    async def _next_timeout(self) -> float:
+        try:
+            next_due = await get_chroma_outbox_next_due(db_path=self.db_path)
+        except Exception:
+            return _IDLE_POLL_SECONDS
+        if next_due is None:
+            return _IDLE_POLL_SECONDS
+        return min(_IDLE_POLL_SECONDS, max(0.0, next_due - time.time()))
+
+    async def flush(self) -> int:
+        """Vaqti kelgan barcha yozuvlarni yuboradi va yuborilganlar sonini qaytaradi."""
+        sent = 0
+        while True:
+            batch = await get_chroma_outbox_batch(CHROMA_SYNC_BATCH_SIZE, db_path=self.db_path)
+            if not batch:
+                return sent
+
+            docs = [
+                {
+                    "id": f"user_{row['user_id']}_{row['entry_id']}",
+                    "user_id": row["user_id"],
+                    "text": row["text"],
+                    "created_at": row["created_at"],
+                }
+                for row in batch
+            ]
+            ids = [row["entry_id"] for row in batch]
+
+            if await chroma_upsert(docs):
+                await ack_chroma_outbox(ids, db_path=self.db_path)
+                sent += len(ids)
+                continue
+
+            attempts = max(row["attempts"] for row in batch)
+            delay = min(CHROMA_SYNC_MAX_BACKOFF, 2.0 ** (attempts + 1)) * random.uniform(0.8, 1.2)
+            await retry_chroma_outbox(ids, delay, error="upsert_entries failed", db_path=self.db_path)
+            logger.warning(
+                "Chroma'ga %d ta yozuv yuborilmadi, %.0f soniyadan keyin qayta urinamiz", len(ids), delay
+            )
+            return sent
+
+
+_worker: Optional[ChromaSyncWorker] = None
+
+
+def start_chroma_sync() -> None:
+    """Fon indeksatorni ishga tushiradi (Chroma sozlanmagan bo'lsa hech narsa qilmaydi)."""
+    global _worker
+    if not chroma_enabled():
+        return
+    if _worker is None:
+        _worker = ChromaSyncWorker()
+        add_entry_listener(_worker.notify)
+    _worker.start()
+
+
+async def stop_chroma_sync() -> None:
+    if _worker is not None:
+        await _worker.stop()
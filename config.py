@@ -16,6 +16,12 @@ except ValueError:
 # Kanal majburiy obuna uchun ID yoki @username, masalan: "@asralashm" yoki "-100..."
 REQUIRED_CHANNEL_ID: str = os.getenv("REQUIRED_CHANNEL_ID", "@asralashm")
 
+# Obuna tekshiruvi keshi: obuna bo'lganlar uchun TTL, obuna bo'lmaganlar uchun qisqaroq TTL
+# (soniyalarda) va keshdagi eng ko'p foydalanuvchilar soni
+SUBSCRIPTION_CACHE_TTL: int = int(os.getenv("SUBSCRIPTION_CACHE_TTL", "600"))
+SUBSCRIPTION_NEGATIVE_TTL: int = int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "30"))
+SUBSCRIPTION_CACHE_SIZE: int = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000"))
+
 # AI rejimi: "stub" yoki "groq" (default: groq)
 AI_MODE: str = os.getenv("AI_MODE", "groq")
 
@@ -23,9 +29,151 @@ AI_MODE: str = os.getenv("AI_MODE", "groq")
 # Railway uchun /data ichiga volume ulab, DATABASE_PATH ni /data/database.db qilib ishlatish tavsiya etiladi.
 DATABASE_PATH: str = os.getenv("DATABASE_PATH", "/data/database.db")
 
+# SQLite ulanishlar pul'i: nechta o'quvchi ulanish ochiq turadi (yozuvchi doim bitta).
+DB_POOL_READERS: int = int(os.getenv("DB_POOL_READERS", "4"))
+
+# SQLite PRAGMA sozlamalari (WAL rejimi doim yoqiladi).
+DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE", "-16000"))
+DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+
+# Suhbat loglari (chat_logs jadvali) saqlash siyosati, 0 - cheklovsiz.
+CHAT_LOG_RETENTION_DAYS: int = int(os.getenv("CHAT_LOG_RETENTION_DAYS", "180"))
+CHAT_LOG_MAX_PER_PROFILE: int = int(os.getenv("CHAT_LOG_MAX_PER_PROFILE", "2000"))
+
+# Parollar: bcrypt cost factor va bir vaqtda ishlaydigan hash/verify thread'lar soni
+BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Webhook update'larini bir vaqtda qayta ishlovchi workerlar soni, navbatning umumiy
+# hajmi va bitta chat uchun navbatdagi update'lar chegarasi
+WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "64"))
+WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "2000"))
+WEBHOOK_CHAT_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_CHAT_QUEUE_SIZE", "100"))
+
+# Ko'p jarayonli rejim: uvicorn --workers soni (Procfile WEB_CONCURRENCY dan oladi). 1 dan
+# katta bo'lsa, update'lar SQLite navbati orqali chat id bo'yicha jarayonlarga taqsimlanadi,
+# keshlar esa change_events jurnali orqali barcha jarayonlarda bekor qilinadi.
+# UPDATE_QUEUE_POLL - bo'sh navbatni tekshirish oralig'i, WORKER_SLOT_TTL - jarayon shu vaqt
+# heartbeat bermasa uning shard'lari boshqasiga o'tadi, CHANGE_EVENTS_POLL - jurnalni o'qish oralig'i
+WORKER_PROCESSES: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+UPDATE_QUEUE_POLL: float = float(os.getenv("UPDATE_QUEUE_POLL", "0.2"))
+WORKER_SLOT_TTL: float = float(os.getenv("WORKER_SLOT_TTL", "30"))
+CHANGE_EVENTS_POLL: float = float(os.getenv("CHANGE_EVENTS_POLL", "1"))
+
 # Groq API sozlamalari (OpenAI chat/completions formatida)
 GROQ_API_BASE: str = os.getenv(
     "GROQ_API_BASE", "https://api.groq.com/openai/v1/chat/completions"
 )
 GROQ_API_KEY: str = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL: str = os.getenv("GROQ_MODEL", "openai/gpt-oss-20b")
+
+# Groq javobini oqim (SSE) bilan olib, Telegram xabarini bosqichma-bosqich tahrirlash.
+# STREAM_EDIT_INTERVAL - ikki tahrir orasidagi eng qisqa vaqt (soniya); Telegram
+# bitta chatda xabarlarni tez-tez tahrirlashni cheklaydi.
+AI_STREAMING: bool = os.getenv("AI_STREAMING", "1").lower() not in ("0", "false", "no")
+STREAM_EDIT_INTERVAL: float = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+# Takroriy savollar uchun tayyor javoblar keshi: amal qilish muddati (soniya),
+# xotiradagi javoblar soni va SQLite'da ham saqlash (qayta ishga tushganda yo'qolmaydi)
+ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_PERSIST: bool = os.getenv("ANSWER_CACHE_PERSIST", "1").lower() not in ("0", "false", "no")
+
+# Profil uchun oldindan yig'ilgan system prompt (prompt_cache): keshdagi profillar soni,
+# yashash muddati (soniya) va prefiksdagi so'nggi yozuvlar dayjesti uchun token byudjeti
+PROMPT_CACHE_SIZE: int = int(os.getenv("PROMPT_CACHE_SIZE", "500"))
+PROMPT_CACHE_TTL: float = float(os.getenv("PROMPT_CACHE_TTL", "3600"))
+PROMPT_DIGEST_TOKEN_BUDGET: int = int(os.getenv("PROMPT_DIGEST_TOKEN_BUDGET", "600"))
+
+# Foydalanuvchi profillari keshi (user_cache): xotiradagi profillar soni va yashash
+# muddati (soniya). Keshda parol hashi saqlanmaydi.
+USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "5000"))
+USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "3600"))
+# Profil qidiruvida xato yozilgan so'rov uchun eng kam o'xshashlik (0..1): umumiy
+# trigrammalar ulushi yoki so'z bilan tahrir masofasidan olingan o'xshashlik
+USER_SEARCH_MIN_SIMILARITY: float = float(os.getenv("USER_SEARCH_MIN_SIMILARITY", "0.5"))
+
+# Ommaviy import (bulk_import.py, /import): bitta tranzaksiyadagi yozuvlar soni va bitta
+# yozuvning eng ko'p uzunligi (belgi) - uzunroq matnlar gaplar chegarasida bo'linadi
+IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ENTRY_CHARS: int = int(os.getenv("IMPORT_MAX_ENTRY_CHARS", "4000"))
+
+# Baza backup'lari (backup.py): /download-db uchun token (bo'sh bo'lsa endpoint o'chiq),
+# snapshotlar katalogi (bo'sh - baza yonidagi backups/), davriy snapshot oralig'i (soat,
+# 0 - o'chiq) va saqlanadigan snapshotlar soni
+BACKUP_TOKEN: str = os.getenv("BACKUP_TOKEN", "")
+BACKUP_DIR: str = os.getenv("BACKUP_DIR", "")
+BACKUP_INTERVAL_HOURS: float = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_KEEP: int = int(os.getenv("BACKUP_KEEP", "7"))
+
+# /metrics uchun ixtiyoriy token: berilsa navbat va faollik ko'rsatkichlari faqat shu
+# token bilan ochiladi, bo'sh bo'lsa endpoint hammaga ochiq
+METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+# Bot holatini (user_data, suhbat bosqichi) SQLite'da saqlash: yoqish, PTB o'zgarishlarni
+# persistence'ga beradigan oraliq (soniya) va ular bitta tranzaksiyaga yig'iladigan vaqt
+PERSISTENCE_ENABLED: bool = os.getenv("PERSISTENCE_ENABLED", "1").lower() not in ("0", "false", "no")
+PERSISTENCE_INTERVAL: float = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+PERSISTENCE_FLUSH_DELAY: float = float(os.getenv("PERSISTENCE_FLUSH_DELAY", "0.5"))
+
+# Kundalikning oylik xulosalari (summaries): fon ishchisini yoqish, xulosalovchi
+# ("auto" | "groq" | "extractive"), oyning birinchi yangi yozuvidan keyin eng ko'p kutish (soniya), bitta
+# xulosaning eng ko'p uzunligi (belgi) va prompt'ga qo'shiladigan xulosalar soni
+SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "1").lower() not in ("0", "false", "no")
+SUMMARIZER: str = os.getenv("SUMMARIZER", "auto")
+SUMMARY_DELAY: float = float(os.getenv("SUMMARY_DELAY", "600"))
+SUMMARY_MAX_CHARS: int = int(os.getenv("SUMMARY_MAX_CHARS", "800"))
+SUMMARY_PROMPT_COUNT: int = int(os.getenv("SUMMARY_PROMPT_COUNT", "3"))
+# Ketma-ket quriladigan xulosalar orasidagi pauza (soniya): eski kundaliklar uchun
+# to'plangan navbat asta-sekin, bazani va Groq'ni band qilmasdan bo'shatiladi
+SUMMARY_BUILD_INTERVAL: float = float(os.getenv("SUMMARY_BUILD_INTERVAL", "2"))
+
+# Groq chaqiruvlarini cheklash (llm_client): bir vaqtdagi so'rovlar (jami va bitta profil
+# uchun), hisobning daqiqalik limitlari (0 - cheklanmagan) va navbatda kutishning eng
+# uzun vaqti (soniya); undan oshsa foydalanuvchiga darhol qisqa javob qaytariladi
+GROQ_MAX_CONCURRENCY: int = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_PER_PROFILE_CONCURRENCY: int = int(os.getenv("GROQ_PER_PROFILE_CONCURRENCY", "2"))
+GROQ_RPM: int = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM: int = int(os.getenv("GROQ_TPM", "6000"))
+GROQ_QUEUE_TIMEOUT: float = float(os.getenv("GROQ_QUEUE_TIMEOUT", "20"))
+# 429/5xx va tarmoq xatolarida qayta urinishlar soni va backoff (soniya)
+GROQ_MAX_RETRIES: int = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_BACKOFF_BASE: float = float(os.getenv("GROQ_BACKOFF_BASE", "1"))
+GROQ_BACKOFF_MAX: float = float(os.getenv("GROQ_BACKOFF_MAX", "20"))
+# Ketma-ket shuncha muvaffaqiyatsiz chaqiruvdan keyin Groq GROQ_BREAKER_RESET soniya
+# davomida chaqirilmaydi (circuit breaker)
+GROQ_BREAKER_THRESHOLD: int = int(os.getenv("GROQ_BREAKER_THRESHOLD", "5"))
+GROQ_BREAKER_RESET: float = float(os.getenv("GROQ_BREAKER_RESET", "30"))
+# Fon chaqiruvlari (oylik xulosalar) uchun alohida daqiqalik byudjet; ular faqat umumiy
+# limitning GROQ_BACKGROUND_HEADROOM ulushi bo'sh va interaktiv so'rov kutmayotganda yuboriladi
+GROQ_BACKGROUND_RPM: int = int(os.getenv("GROQ_BACKGROUND_RPM", "4"))
+GROQ_BACKGROUND_TPM: int = int(os.getenv("GROQ_BACKGROUND_TPM", "1500"))
+GROQ_BACKGROUND_HEADROOM: float = float(os.getenv("GROQ_BACKGROUND_HEADROOM", "0.5"))
+
+# Groq va Chroma uchun umumiy HTTP klientlar: har bir host uchun ulanishlar chegarasi
+HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Kundalikdan savolga mos bo'laklarni qidirish backend'i:
+# "chroma" - tashqi Chroma servisi, "local" - jarayon ichidagi vektor indeks,
+# "auto" - CHROMA_BASE_URL berilgan bo'lsa chroma, aks holda local
+RETRIEVAL_BACKEND: str = os.getenv("RETRIEVAL_BACKEND", "auto")
+# Lokal vektor indeks (DATABASE_PATH yonidagi .vectors fayllari) vektor o'lchami
+LOCAL_INDEX_DIM: int = int(os.getenv("LOCAL_INDEX_DIM", "512"))
+# Vektor, leksik va so'nggi yozuvlar birlashtirilgandan keyin prompt'ga tushadigan bo'laklar soni
+AI_RETRIEVAL_TOP_K: int = int(os.getenv("AI_RETRIEVAL_TOP_K", "8"))
+
+# Chroma'ga fon rejimida partiyalab yuborish (chroma_sync): partiya hajmi, yig'ish oynasi
+# (soniya) va qayta urinishlar orasidagi eng uzun kutish (soniya)
+CHROMA_SYNC_BATCH_SIZE: int = int(os.getenv("CHROMA_SYNC_BATCH_SIZE", "64"))
+CHROMA_SYNC_BATCH_WINDOW: float = float(os.getenv("CHROMA_SYNC_BATCH_WINDOW", "2"))
+CHROMA_SYNC_MAX_BACKOFF: float = float(os.getenv("CHROMA_SYNC_MAX_BACKOFF", "600"))
+
+# Bitta AI javobi uchun bazadan o'qiladigan eng ko'p kundalik yozuvlari soni
+AI_DIARY_ENTRY_LIMIT: int = int(os.getenv("AI_DIARY_ENTRY_LIMIT", "50"))
+
+# Prompt'dagi kundalik bloki uchun taxminiy token byudjeti va yangilik ulushi
+AI_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("AI_CONTEXT_TOKEN_BUDGET", "2000"))
+AI_CONTEXT_RECENCY_WEIGHT: float = float(os.getenv("AI_CONTEXT_RECENCY_WEIGHT", "0.3"))
@@ -0,0 +1,123 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+# Prompt'dagi kundalik bloki uchun ajratilgan taxminiy token byudjeti
+CONTEXT_TOKEN_BUDGET: int = getattr(config, "AI_CONTEXT_TOKEN_BUDGET", 2000) if config is not None else 2000
+# Yakuniy ballda yangi yozuvlarga beriladigan ulush (0 - faqat savolga moslik, 1 - faqat yangilik)
+RECENCY_WEIGHT: float = getattr(config, "AI_CONTEXT_RECENCY_WEIGHT", 0.3) if config is not None else 0.3
+
+# O'zbek lotin yozuvidagi tutuq belgisi turli shakllarda yoziladi: o', oʻ, o‘, o’, o`
+_APOSTROPHES = "'ʻʼ‘’`"
+_APOSTROPHE_RE = re.compile(f"[{_APOSTROPHES}]")
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Matnning token sonini lokal, taxminan hisoblaydi.
+
+    Groq modellarining tokenizatori o'zbekcha matnni inglizchadan maydaroq bo'ladi,
+    shuning uchun ~3 belgi = 1 token deb olamiz (ehtiyot tomoniga).
+    """
+    if not text:
+        return 0
+    return len(text) // 3 + 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Leksik moslik uchun so'zlarga ajratadi: kichik harf, tutuq belgisiz (o'zim -> ozim)."""
+    norm = _APOSTROPHE_RE.sub("", (text or "").lower())
+    return _WORD_RE.findall(norm)
+
+
+@dataclass
+class PackedContext:
+    """Byudjetga sig'gan yozuvlar va qadoqlash hisoboti."""
+
+    entries: List[Dict[str, Any]] = field(default_factory=list)
+    # Tanlangan yozuvlarning kirish ro'yxatidagi indekslari (o'sish tartibida)
+    indices: List[int] = field(default_factory=list)
+    used_tokens: int = 0
+    dropped_tokens: int = 0
+    dropped_count: int = 0
+
+
+def score_entries(entries: List[Dict[str, Any]], question: str, recency_weight: float = RECENCY_WEIGHT) -> List[float]:
+    """Har bir yozuv uchun savolga moslik (BM25) va yangilik aralashmasidan ball hisoblaydi.
+
+    entries yangilaridan boshlab tartiblangan deb hisoblanadi (get_entries_page kabi).
+    IDF shu yozuvlar to'plamining o'zidan olinadi, tashqi model kerak emas.
+    """
+    if not entries:
+        return []
+
+    docs = [tokenize(e.get("text") or "") for e in entries]
+    query_terms = set(tokenize(question))
+
+    lexical = [0.0] * len(docs)
+    if query_terms:
+        n_docs = len(docs)
+        avg_len = sum(len(d) for d in docs) / n_docs or 1.0
+        doc_freq: Counter = Counter()
+        for d in docs:
+            doc_freq.update(set(d) & query_terms)
+
+        k1, b = 1.2, 0.75
+        for i, d in enumerate(docs):
+            if not d:
+                continue
+            tf = Counter(t for t in d if t in query_terms)
+            score = 0.0
+            for term, freq in tf.items():
+                idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                score += idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * len(d) / avg_len))
+            lexical[i] = score
+
+    top = max(lexical) or 1.0
+    scores: List[float] = []
+    for rank, lex in enumerate(lexical):
+        recency = 1.0 / (1.0 + rank / 10.0)
+        scores.append((1.0 - recency_weight) * (lex / top) + recency_weight * recency)
+    return scores
+
+
+def pack_entries(
+    entries: List[Dict[str, Any]],
+    question: str,
+    budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+    formatted: Optional[List[str]] = None,
+    scores: Optional[List[float]] = None,
+) -> PackedContext:
+    """Eng mos yozuvlarni token byudjeti to'lguncha tanlaydi.
+
+    formatted berilsa (prompt'ga aynan shu ko'rinishda tushadigan matnlar),
+    tokenlar shu matnlar bo'yicha hisoblanadi. scores berilsa (masalan, RRF
+    ballari), score_entries o'rniga shular ishlatiladi. Tanlangan yozuvlar asl
+    tartibida qaytariladi, shunda prompt'da ularning tartibi buzilmaydi.
+    """
+    texts = formatted if formatted is not None else [(e.get("text") or "") for e in entries]
+    costs = [estimate_tokens(t) for t in texts]
+    if scores is None:
+        scores = score_entries(entries, question)
+
+    order = sorted(range(len(entries)), key=lambda i: scores[i], reverse=True)
+    chosen: List[int] = []
+    result = PackedContext()
+    for i in order:
+        if result.used_tokens + costs[i] <= budget_tokens:
+            chosen.append(i)
+            result.used_tokens += costs[i]
+        else:
+            result.dropped_tokens += costs[i]
+            result.dropped_count += 1
+
+    result.indices = sorted(chosen)
+    result.entries = [entries[i] for i in result.indices]
+    return result
@@ -1,8 +1,15 @@
+import asyncio
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional, List, Dict, Any, Tuple
+
 import aiosqlite
-from typing import Optional, List, Dict, Any
 
-from rag_client import chroma_upsert
+from context_packer import tokenize
+from rag_client import chroma_enabled
+from uz_text import edit_distance, normalize_name, trigrams
 
 try:
     import config  # type: ignore
@@ -13,6 +20,151 @@ except ImportError:
 # Agar config yo'q bo'lsa, lokal ishlatish uchun "database.db" dan foydalanamiz.
 DB_PATH = getattr(config, "DATABASE_PATH", "database.db") if config is not None else "database.db"
 
+logger = logging.getLogger(__name__)
+
+# Pul'dagi o'quvchi ulanishlar soni (yozuvchi ulanish doim bitta).
+POOL_READERS: int = getattr(config, "DB_POOL_READERS", 4) if config is not None else 4
+
+# Har bir ulanish ochilganda qo'llanadigan PRAGMA'lar.
+# WAL rejimida synchronous=NORMAL xavfsiz va har commit'da fsync qilmaydi.
+DB_SYNCHRONOUS: str = getattr(config, "DB_SYNCHRONOUS", "NORMAL") if config is not None else "NORMAL"
+# Manfiy qiymat KiB hisobida: -16000 ~ 16 MB sahifa keshi (har bir ulanish uchun).
+DB_CACHE_SIZE: int = getattr(config, "DB_CACHE_SIZE", -16000) if config is not None else -16000
+DB_MMAP_SIZE: int = getattr(config, "DB_MMAP_SIZE", 128 * 1024 * 1024) if config is not None else 128 * 1024 * 1024
+DB_BUSY_TIMEOUT_MS: int = 5000
+
+# Suhbat loglarini saqlash siyosati: necha kun saqlanadi va bitta profil uchun
+# eng ko'pi bilan nechta log qoladi (0 - cheklovsiz).
+CHAT_LOG_RETENTION_DAYS: int = getattr(config, "CHAT_LOG_RETENTION_DAYS", 180) if config is not None else 180
+CHAT_LOG_MAX_PER_PROFILE: int = getattr(config, "CHAT_LOG_MAX_PER_PROFILE", 2000) if config is not None else 2000
+
+# Profil qidiruvida so'rov trigrammalarining shuncha qismi mos kelsa yoki so'z bilan
+# tahrir masofasi bo'yicha o'xshashligi shunchadan kam bo'lmasa, natija xato yozilgan
+# bo'lsa ham ko'rsatiladi (0..1)
+USER_SEARCH_MIN_SIMILARITY: float = (
+    getattr(config, "USER_SEARCH_MIN_SIMILARITY", 0.5) if config is not None else 0.5
+)
+
+
+class ConnectionPool:
+    """Bitta baza fayli uchun uzoq yashaydigan aiosqlite ulanishlari to'plami.
+
+    Har bir so'rovda yangi `aiosqlite.connect()` (yangi thread va yangi SQLite
+    handle) ochish o'rniga, bir nechta o'quvchi ulanish va bitta yozuvchi ulanish
+    bir marta ochiladi va barcha funksiyalar ulardan navbat bilan foydalanadi.
+    Yozuvchi ulanish lock bilan himoyalangan, shuning uchun tranzaksiyalar
+    bir-biriga aralashib ketmaydi.
+    """
+
+    def __init__(self, db_path: str, readers: int = POOL_READERS) -> None:
+        self.db_path = db_path
+        self.readers_count = max(1, readers)
+        self._readers: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = aiosqlite.connect(self.db_path)
+        # aiosqlite har bir ulanish uchun alohida thread ochadi; jarayon yopilishini
+        # to'sib qo'ymasligi uchun uni daemon qilib qo'yamiz.
+        conn.daemon = True
+        await conn
+        conn.row_factory = aiosqlite.Row
+        for pragma in (
+            f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}",
+            f"PRAGMA synchronous = {DB_SYNCHRONOUS}",
+            f"PRAGMA cache_size = {int(DB_CACHE_SIZE)}",
+            f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}",
+        ):
+            # Ba'zi PRAGMA'lar natija qaytaradi; kursorni oxirigacha o'qib yopamiz,
+            # aks holda ochiq statement bazada lock ushlab qolishi mumkin.
+            async with conn.execute(pragma) as cursor:
+                await cursor.fetchall()
+        return conn
+
+    async def open(self) -> None:
+        if self._writer is not None:
+            return
+        self._writer = await self._connect()
+        # WAL rejimi bazaga yoziladi va doimiy saqlanadi. Uni o'quvchilar ochilishidan
+        # oldin yoqamiz: WAL'da o'quvchilar yozuvchini kutmaydi va aksincha.
+        async with self._writer.execute("PRAGMA journal_mode = WAL") as cursor:
+            await cursor.fetchall()
+        for _ in range(self.readers_count):
+            conn = await self._connect()
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+
+    async def close(self) -> None:
+        async with self._write_lock:
+            for conn in self._all_readers:
+                await conn.close()
+            self._all_readers.clear()
+            self._readers = asyncio.Queue()
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Bo'sh o'quvchi ulanishni beradi (hammasi band bo'lsa, navbat kutiladi)."""
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Yagona yozuvchi ulanishni beradi. Commit chaqiruvchi tomonidan qilinadi."""
+        async with self._write_lock:
+            assert self._writer is not None
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = asyncio.Lock()
+
+
+async def get_pool(db_path: str = DB_PATH) -> ConnectionPool:
+    """db_path uchun ochiq pul'ni qaytaradi, kerak bo'lsa birinchi marta ochadi."""
+    pool = _pools.get(db_path)
+    if pool is not None:
+        return pool
+    async with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            await pool.open()
+            _pools[db_path] = pool
+    return pool
+
+
+async def close_db() -> None:
+    """Barcha ochiq pul'larni yopadi (bot yoki FastAPI to'xtaganda chaqiriladi)."""
+    while _pools:
+        _, pool = _pools.popitem()
+        await pool.close()
+
+
+@asynccontextmanager
+async def _reader(db_path: str) -> AsyncIterator[aiosqlite.Connection]:
+    pool = await get_pool(db_path)
+    async with pool.reader() as db:
+        yield db
+
+
+@asynccontextmanager
+async def _writer(db_path: str) -> AsyncIterator[aiosqlite.Connection]:
+    pool = await get_pool(db_path)
+    async with pool.writer() as db:
+        yield db
+
 
 async def init_db(db_path: str = DB_PATH) -> None:
     # Bazaning katalogi mavjud bo'lishini ta'minlaymiz (masalan, /data)
@@ -20,7 +172,7 @@ async def init_db(db_path: str = DB_PATH) -> None:
     if dir_name:
         os.makedirs(dir_name, exist_ok=True)
 
-    async with aiosqlite.connect(db_path) as db:
+    async with _writer(db_path) as db:
         await db.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -54,27 +206,767 @@ async def init_db(db_path: str = DB_PATH) -> None:
             pass
         await db.commit()
 
+        await _run_migrations(db)
+        await _prune_chat_logs(db)
+        await db.commit()
+        # Yangi indekslar uchun statistika yig'ib, query planner'ga yordam beramiz
+        await db.execute("PRAGMA optimize")
+
+
+async def _migrate_entry_indexes(db: aiosqlite.Connection) -> None:
+    """Mavjud so'rovlar ishlata oladigan indekslarni yaratadi.
+
+    - (user_id, created_at): get_entries_for_user va get_top_writer'dagi JOIN uchun;
+    - DATE(created_at): count_today_* so'rovlaridagi `DATE(created_at) = DATE('now')` uchun;
+    - created_at: get_last_entry_time'dagi MAX(created_at) uchun;
+    - LOWER(nick): get_user_by_nick'dagi `LOWER(nick) = ?` uchun (UNIQUE indeks bu yerda ishlamaydi).
+    """
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_entries_user_created ON entries(user_id, created_at)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_entries_day_user ON entries(DATE(created_at), user_id)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_entries_created ON entries(created_at)"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_nick_lower ON users(LOWER(nick))"
+    )
+    await db.execute("ANALYZE")
+
+
+CHAT_LOG_PREFIX = "Suhbat:"
+
+
+def _split_chat_log_text(text: str) -> Tuple[str, str]:
+    """Eski "Suhbat: foydalanuvchi savoli: ...\nMening javobim: ..." matnini savol/javobga ajratadi."""
+    body = text.strip()[len(CHAT_LOG_PREFIX):].strip()
+    question, sep, answer = body.partition("\nMening javobim:")
+    if not sep:
+        return body, ""
+    question = question.strip()
+    if question.lower().startswith("foydalanuvchi savoli:"):
+        question = question[len("foydalanuvchi savoli:"):].strip()
+    return question, answer.strip()
+
+
+async def _migrate_chat_logs(db: aiosqlite.Connection) -> None:
+    """Suhbat loglari uchun alohida jadval yaratadi va eski "Suhbat:" yozuvlarini unga ko'chiradi.
+
+    Shundan keyin entries jadvalida faqat haqiqiy kundalik yozuvlari qoladi.
+    Chroma'ga avval yuborilgan suhbat loglari u yerda qoladi: servisda o'chirish endpointi yo'q.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER NOT NULL,
+            asker_telegram_id INTEGER,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(profile_id) REFERENCES users(id)
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_logs_profile_created ON chat_logs(profile_id, created_at)"
+    )
+
+    async with db.execute(
+        "SELECT id, user_id, created_at, text FROM entries WHERE text LIKE 'Suhbat:%' ORDER BY id"
+    ) as cursor:
+        rows = await cursor.fetchall()
+    if not rows:
+        return
+
+    moved = []
+    for row in rows:
+        question, answer = _split_chat_log_text(row["text"])
+        moved.append((row["user_id"], question, answer, row["created_at"]))
+    await db.executemany(
+        "INSERT INTO chat_logs (profile_id, question, answer, created_at) VALUES (?, ?, ?, ?)",
+        moved,
+    )
+    await db.executemany("DELETE FROM entries WHERE id = ?", [(row["id"],) for row in rows])
+
+
+async def _migrate_chroma_outbox(db: aiosqlite.Connection) -> None:
+    """Chroma'ga hali yuborilmagan yozuvlar navbati (outbox).
+
+    add_entry yozuvni va outbox qatorini bitta tranzaksiyada yozadi, fon indeksator
+    (chroma_sync) esa ularni partiyalab yuboradi. Chroma ishlamay turgan paytda
+    yozilgan yozuvlar ham shu jadvalda saqlanib, keyinroq indekslanadi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chroma_outbox (
+            entry_id INTEGER PRIMARY KEY,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chroma_outbox_due ON chroma_outbox(next_attempt_at)"
+    )
+
+
+# O'zbekcha tutuq belgilari (o', g', oʻ, gʼ ...) FTS indeksiga yozishdan oldin olib
+# tashlanadi: "o'zim", "oʻzim" va "ozim" bitta "ozim" tokeniga aylanadi. So'rov
+# tomonida ham context_packer.tokenize xuddi shunday qiladi.
+_FTS_NORMALIZE_SQL = (
+    "replace(replace(replace(replace(replace(replace({col}, '''', ''), 'ʻ', ''), 'ʼ', ''), "
+    "'‘', ''), '’', ''), '`', '')"
+)
+
+
+async def _migrate_entries_fts(db: aiosqlite.Connection) -> None:
+    """Kundalik yozuvlari uchun FTS5 to'liq matnli indeks (BM25 reyting bilan).
+
+    owner ustunida "u<user_id>" tokeni turadi, shuning uchun foydalanuvchi filtri
+    ham MATCH ichida indeks orqali bajariladi. Indeks triggerlar bilan entries
+    jadvaliga sinxron saqlanadi.
+    """
+    norm_new = _FTS_NORMALIZE_SQL.format(col="new.text")
+    await db.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            text, owner, tokenize = 'unicode61 remove_diacritics 2'
+        );
+        """
+    )
+    await db.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts(rowid, text, owner) VALUES (new.id, {norm_new}, 'u' || new.user_id);
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+            DELETE FROM entries_fts WHERE rowid = old.id;
+        END;
+        """
+    )
+    await db.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS entries_fts_au AFTER UPDATE OF text, user_id ON entries BEGIN
+            UPDATE entries_fts SET text = {norm_new}, owner = 'u' || new.user_id WHERE rowid = new.id;
+        END;
+        """
+    )
+    await db.execute("DELETE FROM entries_fts")
+    await db.execute(
+        "INSERT INTO entries_fts(rowid, text, owner) SELECT id, "
+        + _FTS_NORMALIZE_SQL.format(col="text")
+        + ", 'u' || user_id FROM entries"
+    )
+
+
+async def _migrate_answer_cache(db: aiosqlite.Connection) -> None:
+    """Takroriy savollar uchun tayyor AI javoblari (answer_cache moduli ishlatadi).
+
+    diary_version kalitning bir qismi: kundalikka yozuv qo'shilsa, versiya
+    o'zgaradi va eski javoblar endi topilmaydi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            profile_id INTEGER NOT NULL,
+            question_key TEXT NOT NULL,
+            diary_version TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (profile_id, question_key, diary_version)
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_answer_cache_created ON answer_cache(created_at)"
+    )
+
+
+async def _migrate_diary_summaries(db: aiosqlite.Connection) -> None:
+    """Profil kundaligining oylik xulosalari (summaries moduli ishlatadi).
+
+    summary_dirty - xulosasi yangilanishi kerak bo'lgan (user_id, oy) juftlari.
+    Uni triggerlar to'ldiradi, shuning uchun yozuv qaysi jarayondan qo'shilganidan
+    qat'i nazar, fon ishchisi uni ko'radi. Yozuv o'chirilsa yoki o'zgartirilsa,
+    shu oyning xulosasi o'chiriladi, marked_at yangilanadi va xulosa noldan
+    qayta quriladi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS diary_summaries (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            last_entry_id INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (user_id, period)
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS summary_dirty (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            marked_at REAL NOT NULL,
+            PRIMARY KEY (user_id, period)
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_summary_dirty_marked ON summary_dirty(marked_at)"
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_summary_ai AFTER INSERT ON entries BEGIN
+            INSERT OR IGNORE INTO summary_dirty (user_id, period, marked_at)
+            VALUES (new.user_id, strftime('%Y-%m', new.created_at), (julianday('now') - 2440587.5) * 86400.0);
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_summary_ad AFTER DELETE ON entries BEGIN
+            DELETE FROM diary_summaries
+            WHERE user_id = old.user_id AND period = strftime('%Y-%m', old.created_at);
+            INSERT OR REPLACE INTO summary_dirty (user_id, period, marked_at)
+            VALUES (old.user_id, strftime('%Y-%m', old.created_at), (julianday('now') - 2440587.5) * 86400.0);
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_summary_au AFTER UPDATE OF text, user_id, created_at ON entries BEGIN
+            DELETE FROM diary_summaries
+            WHERE user_id = old.user_id AND period = strftime('%Y-%m', old.created_at);
+            INSERT OR REPLACE INTO summary_dirty (user_id, period, marked_at)
+            VALUES (old.user_id, strftime('%Y-%m', old.created_at), (julianday('now') - 2440587.5) * 86400.0);
+            DELETE FROM diary_summaries
+            WHERE user_id = new.user_id AND period = strftime('%Y-%m', new.created_at);
+            INSERT OR REPLACE INTO summary_dirty (user_id, period, marked_at)
+            VALUES (new.user_id, strftime('%Y-%m', new.created_at), (julianday('now') - 2440587.5) * 86400.0);
+        END;
+        """
+    )
+    # Mavjud kundaliklar uchun xulosalar fon ishchisi tomonidan asta-sekin quriladi
+    await db.execute(
+        """
+        INSERT OR IGNORE INTO summary_dirty (user_id, period, marked_at)
+        SELECT DISTINCT user_id, strftime('%Y-%m', created_at), 0 FROM entries
+        """
+    )
+
+
+async def _rebuild_stats_counters(db: aiosqlite.Connection) -> None:
+    """Statistika hisoblagichlarini users/entries jadvallaridan noldan qayta hisoblaydi."""
+    await db.execute("DELETE FROM stats_counters")
+    await db.execute("DELETE FROM user_entry_counts")
+    await db.execute("DELETE FROM daily_entry_counts")
+    await db.execute(
+        """
+        INSERT INTO stats_counters (id, users, entries, last_entry_at)
+        SELECT 1, (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM entries), (SELECT MAX(created_at) FROM entries)
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO user_entry_counts (user_id, entry_count, last_entry_at)
+        SELECT user_id, COUNT(*), MAX(created_at) FROM entries GROUP BY user_id
+        """
+    )
+    await db.execute(
+        "INSERT OR IGNORE INTO user_entry_counts (user_id, entry_count, last_entry_at) SELECT id, 0, NULL FROM users"
+    )
+    await db.execute(
+        """
+        INSERT INTO daily_entry_counts (day, user_id, entry_count)
+        SELECT COALESCE(DATE(created_at), ''), user_id, COUNT(*) FROM entries GROUP BY COALESCE(DATE(created_at), ''), user_id
+        """
+    )
+
+
+async def _migrate_stats_counters(db: aiosqlite.Connection) -> None:
+    """/stats uchun tayyor hisoblagichlar (triggerlar bilan yangilanadi).
+
+    stats_counters - bitta qator: jami foydalanuvchilar, yozuvlar va oxirgi yozuv vaqti.
+    user_entry_counts - har bir foydalanuvchining yozuvlar soni (eng ko'p yozgan uchun).
+    daily_entry_counts - kun va foydalanuvchi bo'yicha yozuvlar soni (bugungi statistika uchun).
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            users INTEGER NOT NULL DEFAULT 0,
+            entries INTEGER NOT NULL DEFAULT 0,
+            last_entry_at TEXT
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_entry_counts (
+            user_id INTEGER PRIMARY KEY,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            last_entry_at TEXT
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_entry_counts_count ON user_entry_counts(entry_count DESC, user_id)"
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_entry_counts (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS users_stats_ai AFTER INSERT ON users BEGIN
+            UPDATE stats_counters SET users = users + 1 WHERE id = 1;
+            INSERT OR IGNORE INTO user_entry_counts (user_id, entry_count) VALUES (new.id, 0);
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS users_stats_ad AFTER DELETE ON users BEGIN
+            UPDATE stats_counters SET users = users - 1 WHERE id = 1;
+            DELETE FROM user_entry_counts WHERE user_id = old.id;
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_stats_ai AFTER INSERT ON entries BEGIN
+            UPDATE stats_counters
+            SET entries = entries + 1,
+                last_entry_at = CASE
+                    WHEN last_entry_at IS NULL OR new.created_at > last_entry_at THEN new.created_at
+                    ELSE last_entry_at
+                END
+            WHERE id = 1;
+            INSERT INTO user_entry_counts (user_id, entry_count, last_entry_at)
+            VALUES (new.user_id, 1, new.created_at)
+            ON CONFLICT(user_id) DO UPDATE SET
+                entry_count = entry_count + 1,
+                last_entry_at = MAX(COALESCE(last_entry_at, ''), excluded.last_entry_at);
+            INSERT INTO daily_entry_counts (day, user_id, entry_count)
+            VALUES (COALESCE(DATE(new.created_at), ''), new.user_id, 1)
+            ON CONFLICT(day, user_id) DO UPDATE SET entry_count = entry_count + 1;
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_stats_ad AFTER DELETE ON entries BEGIN
+            UPDATE stats_counters
+            SET entries = entries - 1, last_entry_at = (SELECT MAX(created_at) FROM entries)
+            WHERE id = 1;
+            UPDATE user_entry_counts
+            SET entry_count = entry_count - 1,
+                last_entry_at = (SELECT MAX(created_at) FROM entries WHERE user_id = old.user_id)
+            WHERE user_id = old.user_id;
+            UPDATE daily_entry_counts SET entry_count = entry_count - 1
+            WHERE day = COALESCE(DATE(old.created_at), '') AND user_id = old.user_id;
+            DELETE FROM daily_entry_counts
+            WHERE day = COALESCE(DATE(old.created_at), '') AND user_id = old.user_id AND entry_count <= 0;
+        END;
+        """
+    )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_stats_au AFTER UPDATE OF user_id, created_at ON entries BEGIN
+            UPDATE stats_counters
+            SET entries = entries - 1, last_entry_at = (SELECT MAX(created_at) FROM entries)
+            WHERE id = 1;
+            UPDATE user_entry_counts
+            SET entry_count = entry_count - 1,
+                last_entry_at = (SELECT MAX(created_at) FROM entries WHERE user_id = old.user_id)
+            WHERE user_id = old.user_id;
+            UPDATE daily_entry_counts SET entry_count = entry_count - 1
+            WHERE day = COALESCE(DATE(old.created_at), '') AND user_id = old.user_id;
+            DELETE FROM daily_entry_counts
+            WHERE day = COALESCE(DATE(old.created_at), '') AND user_id = old.user_id AND entry_count <= 0;
+            UPDATE stats_counters
+            SET entries = entries + 1,
+                last_entry_at = CASE
+                    WHEN last_entry_at IS NULL OR new.created_at > last_entry_at THEN new.created_at
+                    ELSE last_entry_at
+                END
+            WHERE id = 1;
+            INSERT INTO user_entry_counts (user_id, entry_count, last_entry_at)
+            VALUES (new.user_id, 1, new.created_at)
+            ON CONFLICT(user_id) DO UPDATE SET
+                entry_count = entry_count + 1,
+                last_entry_at = MAX(COALESCE(last_entry_at, ''), excluded.last_entry_at);
+            INSERT INTO daily_entry_counts (day, user_id, entry_count)
+            VALUES (COALESCE(DATE(new.created_at), ''), new.user_id, 1)
+            ON CONFLICT(day, user_id) DO UPDATE SET entry_count = entry_count + 1;
+        END;
+        """
+    )
+    await _rebuild_stats_counters(db)
+
+
+async def _migrate_bot_persistence(db: aiosqlite.Connection) -> None:
+    """python-telegram-bot holati (user_data, chat_data, suhbat holatlari) - persistence moduli uchun.
+
+    kind: "user_data", "chat_data", "bot_data" yoki "conversation:<nomi>";
+    key: id yoki suhbat kaliti (JSON), data: qiymatning JSON ko'rinishi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bot_persistence (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+async def _migrate_multiworker(db: aiosqlite.Connection) -> None:
+    """Bir nechta jarayonli rejim (multiworker moduli) uchun jadvallar.
+
+    update_queue - webhook update'lari navbati, shard (chat id % slotlar soni) bo'yicha;
+    worker_slots - qaysi jarayon qaysi shard'ni qayta ishlayotgani (heartbeat bilan);
+    change_events - boshqa jarayonlar keshlarini bekor qilish uchun o'zgarishlar jurnali.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS update_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shard INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        """
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_update_queue_shard ON update_queue(shard, id)")
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS worker_slots (
+            slot INTEGER PRIMARY KEY,
+            owner TEXT,
+            heartbeat REAL NOT NULL DEFAULT 0
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            ref_id INTEGER,
+            nick TEXT,
+            created_at REAL NOT NULL
+        );
+        """
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_change_events_created ON change_events(created_at)")
+
+
+def _user_search_doc(name: str, surname: str, nick: str) -> str:
+    return normalize_name(f"{nick} {name} {surname}")
+
+
+async def _migrate_users_search(db: aiosqlite.Connection) -> None:
+    """Profil qidiruvi uchun FTS5 trigram indeksi (rowid = users.id).
+
+    doc - nick, ism va familiyaning normallashtirilgan ko'rinishi (uz_text.normalize_name):
+    kirill/lotin va tutuq belgisi farqlari yo'qoladi. Normallashtirish Python'da
+    bo'lgani uchun indeksni trigger emas, create_user/delete_user_by_id yangilaydi.
+    """
+    await db.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(doc, tokenize = 'trigram')"
+    )
+    await db.execute("DELETE FROM users_search")
+    async with db.execute("SELECT id, name, surname, nick FROM users") as cursor:
+        rows = await cursor.fetchall()
+    await db.executemany(
+        "INSERT INTO users_search (rowid, doc) VALUES (?, ?)",
+        [(r["id"], _user_search_doc(r["name"], r["surname"], r["nick"])) for r in rows],
+    )
+
+
+async def _migrate_import_jobs(db: aiosqlite.Connection) -> None:
+    """Ommaviy import (bulk_import) holati: position - fayldagi oxirgi commit qilingan bayt.
+
+    position yozuvlar bilan bitta tranzaksiyada yangilanadi, shuning uchun
+    to'xtab qolgan import shu joydan davom etadi va yozuvlar ikki marta qo'shilmaydi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            job_id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            imported INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'running',
+            updated_at REAL NOT NULL
+        );
+        """
+    )
+
+
+async def _migrate_diary_versions(db: aiosqlite.Connection) -> None:
+    """Har bir profil kundaligining versiyasi (answer_cache kaliti uchun).
+
+    entries dagi har bir INSERT/UPDATE/DELETE trigger orqali egasining versiyasini
+    bittaga oshiradi, shuning uchun get_diary_version kundalik hajmidan qat'i nazar
+    bitta qatorni o'qiydi. Versiya faqat o'sadi va hisoblagichlar qayta qurilganda
+    ham tashlanmaydi, demak eski javob yangi kundalikka hech qachon mos kelmaydi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS diary_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    for name, event, who in (
+        ("entries_version_ai", "INSERT", "new"),
+        ("entries_version_ad", "DELETE", "old"),
+    ):
+        await db.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON entries BEGIN
+                INSERT INTO diary_versions (user_id, version) VALUES ({who}.user_id, 1)
+                ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+            END;
+            """
+        )
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_version_au AFTER UPDATE ON entries BEGIN
+            INSERT INTO diary_versions (user_id, version) VALUES (old.user_id, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+            INSERT INTO diary_versions (user_id, version)
+            SELECT new.user_id, 1 WHERE new.user_id != old.user_id
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+        END;
+        """
+    )
+    # Eski "max_id:count" kalitli javoblarga endi murojaat bo'lmaydi
+    await db.execute("DELETE FROM answer_cache")
+
+
+def _user_search_prefixes(doc: str) -> List[str]:
+    """doc so'zlarining 1 va 2 harfli boshlari (takrorlarsiz) - qisqa so'rovlar uchun."""
+    prefixes: List[str] = []
+    for word in doc.split():
+        for size in (1, 2):
+            prefix = word[:size]
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+    return prefixes
+
+
+async def _migrate_users_search_prefix(db: aiosqlite.Connection) -> None:
+    """1-2 harfli profil qidiruvi uchun so'z boshlari indeksi.
+
+    Trigram indeksi 3 harfdan qisqa so'rovga yordam bermaydi (LIKE butun
+    users_search'ni ko'rib chiqadi). users_search kabi create_user va
+    delete_user_by_id yangilaydi.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users_search_prefix (
+            prefix TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (prefix, user_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    await db.execute("DELETE FROM users_search_prefix")
+    async with db.execute("SELECT rowid, doc FROM users_search") as cursor:
+        rows = await cursor.fetchall()
+    await db.executemany(
+        "INSERT INTO users_search_prefix (prefix, user_id) VALUES (?, ?)",
+        [(prefix, int(r[0])) for r in rows for prefix in _user_search_prefixes(r[1])],
+    )
+
+
+async def _migrate_update_queue_lease(db: aiosqlite.Connection) -> None:
+    """update_queue qatorlari olinganda o'chirilmaydi, ijaraga (lease) beriladi.
+
+    claimed_by - update'ni olgan jarayon, claimed_at - ijara oxirgi marta
+    yangilangan vaqt. Qator update qayta ishlangandan keyin o'chiriladi; jarayon
+    o'lib qolsa, ijara muddati o'tgach update boshqa jarayonga qayta beriladi.
+    """
+    await db.execute("ALTER TABLE update_queue ADD COLUMN claimed_by TEXT")
+    await db.execute("ALTER TABLE update_queue ADD COLUMN claimed_at REAL")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_update_queue_claimed_by ON update_queue(claimed_by)")
+
+
+async def _migrate_chroma_outbox_cleanup(db: aiosqlite.Connection) -> None:
+    """O'chirilgan yozuvning outbox qatori shu DELETE ning o'zida olib tashlanadi.
+
+    Avval get_chroma_outbox_batch har so'rovda butun outbox'ni entries bilan
+    solishtirib tozalar edi; endi tozalash faqat yozuv o'chirilganda bajariladi.
+    """
+    await db.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS entries_chroma_outbox_ad AFTER DELETE ON entries BEGIN
+            DELETE FROM chroma_outbox WHERE entry_id = old.id;
+        END;
+        """
+    )
+    await db.execute("DELETE FROM chroma_outbox WHERE entry_id NOT IN (SELECT id FROM entries)")
+
+
+# Sxema migratsiyalari tartib bilan. Bazaning joriy versiyasi `PRAGMA user_version`
+# da saqlanadi, shuning uchun mavjud /data/database.db fayllarida har bir qadam faqat
+# bir marta bajariladi. Yangi qadamni faqat ro'yxat oxiriga qo'shing.
+MIGRATIONS = [
+    _migrate_entry_indexes,
+    _migrate_chat_logs,
+    _migrate_chroma_outbox,
+    _migrate_entries_fts,
+    _migrate_answer_cache,
+    _migrate_diary_summaries,
+    _migrate_stats_counters,
+    _migrate_bot_persistence,
+    _migrate_multiworker,
+    _migrate_users_search,
+    _migrate_import_jobs,
+    _migrate_diary_versions,
+    _migrate_users_search_prefix,
+    _migrate_update_queue_lease,
+    _migrate_chroma_outbox_cleanup,
+]
+
+
+async def _run_migrations(db: aiosqlite.Connection) -> None:
+    async with db.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    version = int(row[0]) if row is not None else 0
+
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        await step(db)
+        await db.execute(f"PRAGMA user_version = {number}")
+        await db.commit()
+
+
+# Foydalanuvchi yaratilganda yoki o'chirilganda chaqiriladigan sinxron callback'lar:
+# fn(user_id, nick). Profil keshlarini bekor qilish uchun ishlatiladi.
+_user_listeners: List[Callable[[int, str], None]] = []
+
+# Parolsiz ("yengil") profil ustunlari: keshlar va suhbat holati uchun
+PROFILE_COLUMNS = "id, telegram_id, name, surname, nick"
+
+
+def add_user_listener(callback: Callable[[int, str], None]) -> None:
+    """create_user va delete_user_by_id commit qilingandan keyin chaqiriladigan callback qo'shadi."""
+    if callback not in _user_listeners:
+        _user_listeners.append(callback)
+
+
+def _notify_user_listeners(user_id: int, nick: str) -> None:
+    for callback in list(_user_listeners):
+        try:
+            callback(user_id, nick)
+        except Exception:
+            logger.exception("Foydalanuvchi listeneri xato berdi")
+
+
+# Bir nechta jarayonli rejimda shu jarayonning identifikatori. None bo'lmasa, yozuv
+# qo'shish va foydalanuvchi yaratish/o'chirish change_events jurnaliga ham yoziladi:
+# boshqa jarayonlar undan o'z listenerlarini chaqiradi (keshlar bekor qilinadi).
+_change_origin: Optional[str] = None
+
+
+def enable_change_events(origin: Optional[str]) -> None:
+    global _change_origin
+    _change_origin = origin
+
+
+async def _record_change(
+    db: aiosqlite.Connection, kind: str, user_id: int, ref_id: Optional[int] = None, nick: Optional[str] = None
+) -> None:
+    if _change_origin is None:
+        return
+    await db.execute(
+        "INSERT INTO change_events (origin, kind, user_id, ref_id, nick, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (_change_origin, kind, user_id, ref_id, nick, time.time()),
+    )
+
 
 async def create_user(telegram_id: int, name: str, surname: str, nick: str, password_hash: str, db_path: str = DB_PATH) -> bool:
     # Nickni bazaga har doim kichik harflarda saqlaymiz
     norm_nick = nick.lower()
     try:
-        async with aiosqlite.connect(db_path) as db:
-            await db.execute(
+        async with _writer(db_path) as db:
+            cursor = await db.execute(
                 "INSERT INTO users (telegram_id, name, surname, nick, password_hash) VALUES (?, ?, ?, ?, ?)",
                 (telegram_id, name, surname, norm_nick, password_hash),
             )
+            user_id = int(cursor.lastrowid)
+            doc = _user_search_doc(name, surname, norm_nick)
+            await db.execute("INSERT INTO users_search (rowid, doc) VALUES (?, ?)", (user_id, doc))
+            await db.executemany(
+                "INSERT INTO users_search_prefix (prefix, user_id) VALUES (?, ?)",
+                [(prefix, user_id) for prefix in _user_search_prefixes(doc)],
+            )
+            await _record_change(db, "user", user_id, nick=norm_nick)
             await db.commit()
-        return True
     except aiosqlite.IntegrityError:
         return False
+    _notify_user_listeners(user_id, norm_nick)
+    return True
+
+
+async def get_user_profile(user_id: int, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """Foydalanuvchi profilini parol hashisiz qaytaradi."""
+    async with _reader(db_path) as db:
+        async with db.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+async def get_user_profile_by_nick(nick: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """Nick bo'yicha (case-insensitive) profilni parol hashisiz qaytaradi."""
+    async with _reader(db_path) as db:
+        async with db.execute(
+            f"SELECT {PROFILE_COLUMNS} FROM users WHERE LOWER(nick) = ?", (nick.lower(),)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+async def get_password_hash(user_id: int, db_path: str = DB_PATH) -> Optional[str]:
+    """Parolni tekshirish uchun faqat hashni o'qiydi; u hech qayerda keshlanmaydi."""
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT password_hash FROM users WHERE id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
 
 
 async def get_user_by_nick(nick: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
     """Nick bo'yicha userni topadi (case-insensitive)."""
     norm_nick = nick.lower()
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
+    async with _reader(db_path) as db:
         async with db.execute("SELECT * FROM users WHERE LOWER(nick) = ?", (norm_nick,)) as cursor:
             row = await cursor.fetchone()
             return dict(row) if row else None
@@ -82,11 +974,11 @@ async def get_user_by_nick(nick: str, db_path: str = DB_PATH) -> Optional[Dict[s
 
 async def count_today_entries(db_path: str = DB_PATH) -> int:
     """Bugungi kunda yozilgan jami yozuvlar soni (entries)."""
-    async with aiosqlite.connect(db_path) as db:
+    async with _reader(db_path) as db:
         # SQLite-da CURRENT_DATE UTC bo'yicha, lekin biz created_at DEFAULT CURRENT_TIMESTAMP dan foydalanamiz.
-        # Oddiylik uchun sananing YYYY-MM-DD qismiga qaraymiz.
+        # Kunlik hisoblagich sananing YYYY-MM-DD qismi bo'yicha triggerlar bilan yuritiladi.
         async with db.execute(
-            "SELECT COUNT(*) FROM entries WHERE DATE(created_at) = DATE('now')"
+            "SELECT COALESCE(SUM(entry_count), 0) FROM daily_entry_counts WHERE day = DATE('now')"
         ) as cursor:
             row = await cursor.fetchone()
             return int(row[0]) if row is not None else 0
@@ -94,130 +986,969 @@ async def count_today_entries(db_path: str = DB_PATH) -> int:
 
 async def count_today_active_users(db_path: str = DB_PATH) -> int:
     """Bugun kamida bitta yozuv qoldirgan noyob foydalanuvchilar soni."""
-    async with aiosqlite.connect(db_path) as db:
+    async with _reader(db_path) as db:
         async with db.execute(
-            "SELECT COUNT(DISTINCT user_id) FROM entries WHERE DATE(created_at) = DATE('now')"
+            "SELECT COUNT(*) FROM daily_entry_counts WHERE day = DATE('now') AND entry_count > 0"
         ) as cursor:
             row = await cursor.fetchone()
             return int(row[0]) if row is not None else 0
 
 
 async def get_user_by_id(user_id: int, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
+    async with _reader(db_path) as db:
         async with db.execute("SELECT * FROM users WHERE id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
 
-async def add_entry(user_id: int, text: str, db_path: str = DB_PATH) -> None:
-    async with aiosqlite.connect(db_path) as db:
+# Yangi yozuv qo'shilganda chaqiriladigan sinxron callback'lar: fn(user_id, entry_id, text).
+# Ular tez ishlashi kerak (masalan, fon vazifasini uyg'otish yoki keshni bekor qilish).
+_entry_listeners: List[Callable[[int, int, str], None]] = []
+
+
+def add_entry_listener(callback: Callable[[int, int, str], None]) -> None:
+    """add_entry muvaffaqiyatli commit qilingandan keyin chaqiriladigan callback qo'shadi."""
+    if callback not in _entry_listeners:
+        _entry_listeners.append(callback)
+
+
+def _notify_entry_listeners(user_id: int, entry_id: int, text: str) -> None:
+    for callback in list(_entry_listeners):
+        try:
+            callback(user_id, entry_id, text)
+        except Exception:
+            logger.exception("Yozuv listeneri xato berdi")
+
+
+# Bir partiya yozuv (bulk import) qo'shilganda chaqiriladigan callback'lar:
+# fn(user_id, entry_ids). Eski sanali yozuvlar ham kelishi mumkin, shuning uchun
+# yozuvni oxiriga qo'shib boradigan keshlar bu yerda to'liq bekor qilinadi.
+_entries_listeners: List[Callable[[int, List[int]], None]] = []
+
+
+def add_entries_listener(callback: Callable[[int, List[int]], None]) -> None:
+    """add_entries_bulk commit qilingandan keyin chaqiriladigan callback qo'shadi."""
+    if callback not in _entries_listeners:
+        _entries_listeners.append(callback)
+
+
+def _notify_entries_changed(user_id: int, entry_ids: List[int], last_text: str) -> None:
+    for callback in list(_entries_listeners):
+        try:
+            callback(user_id, entry_ids)
+        except Exception:
+            logger.exception("Yozuvlar listeneri xato berdi")
+    # Oddiy yozuv listenerlari (fon indeksatorlari) partiyaga bir marta uyg'otiladi
+    _notify_entry_listeners(user_id, entry_ids[-1], last_text)
+
+
+async def add_entry(user_id: int, text: str, db_path: str = DB_PATH) -> int:
+    """Kundalikka yangi yozuv qo'shadi va uning id sini qaytaradi.
+
+    Chroma sozlangan bo'lsa, yozuv shu tranzaksiyaning o'zida chroma_outbox
+    navbatiga ham qo'yiladi. Chroma'ga yuborishni fon indeksator bajaradi,
+    shuning uchun Telegram javobi tashqi servisni kutmaydi.
+    """
+    async with _writer(db_path) as db:
         cursor = await db.execute(
             "INSERT INTO entries (user_id, text) VALUES (?, ?)",
             (user_id, text),
         )
+        entry_id = int(cursor.lastrowid)
+        if text.strip() and chroma_enabled():
+            await db.execute("INSERT OR IGNORE INTO chroma_outbox (entry_id) VALUES (?)", (entry_id,))
+        await _record_change(db, "entry", user_id, ref_id=entry_id)
         await db.commit()
 
-        # Chroma servisiga ham yuborib qo'yamiz (agar CHROMA_BASE_URL sozlangan bo'lsa)
-        try:
-            entry_id = cursor.lastrowid
-        except Exception:
-            entry_id = None
+    _notify_entry_listeners(user_id, entry_id, text)
+    return entry_id
+
+
+async def get_import_job(job_id: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT * FROM import_jobs WHERE job_id = ?", (job_id,)) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+async def start_import_job(job_id: str, user_id: int, source: str, db_path: str = DB_PATH) -> Dict[str, Any]:
+    """Import ishini yaratadi yoki mavjudini (davom ettirish uchun) qaytaradi."""
+    async with _writer(db_path) as db:
+        await db.execute(
+            """
+            INSERT INTO import_jobs (job_id, user_id, source, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(job_id) DO UPDATE SET
+                status = CASE WHEN status = 'done' THEN status ELSE 'running' END,
+                updated_at = excluded.updated_at
+            """,
+            (job_id, user_id, source, time.time()),
+        )
+        await db.commit()
+        async with db.execute("SELECT * FROM import_jobs WHERE job_id = ?", (job_id,)) as cursor:
+            return dict(await cursor.fetchone())
+
+
+async def finish_import_job(job_id: str, status: str = "done", db_path: str = DB_PATH) -> None:
+    async with _writer(db_path) as db:
+        await db.execute(
+            "UPDATE import_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id)
+        )
+        await db.commit()
+
+
+async def add_entries_bulk(
+    user_id: int,
+    rows: List[Tuple[str, Optional[str]]],
+    job_id: Optional[str] = None,
+    position: int = 0,
+    skipped: int = 0,
+    db_path: str = DB_PATH,
+) -> List[int]:
+    """(text, created_at) yozuvlarini bitta tranzaksiyada executemany bilan qo'shadi.
+
+    created_at None bo'lsa, CURRENT_TIMESTAMP olinadi. job_id berilsa, import_jobs
+    dagi position/imported/skipped shu tranzaksiyaning o'zida yangilanadi.
+    Commit'dan keyin listenerlar yozuv boshiga emas, partiyaga bir marta
+    chaqiriladi: avval add_entries_listener'lar (prompt dayjesti va javoblar
+    keshi to'liq bekor qilinadi, chunki eski sanali yozuvlar ham qo'shilgan
+    bo'lishi mumkin), keyin oddiy yozuv listenerlari.
+    """
+    if not rows and job_id is None:
+        return []
+    async with _writer(db_path) as db:
+        ids: List[int] = []
+        if rows:
+            await db.executemany(
+                "INSERT INTO entries (user_id, text, created_at) VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+                [(user_id, text, created_at) for text, created_at in rows],
+            )
+            # Yozuvchi lock bizda: foydalanuvchining eng katta len(rows) ta id si - aynan shu partiya
+            async with db.execute(
+                "SELECT id FROM entries WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, len(rows))
+            ) as cursor:
+                ids = sorted(int(r[0]) for r in await cursor.fetchall())
+            if chroma_enabled():
+                await db.executemany(
+                    "INSERT OR IGNORE INTO chroma_outbox (entry_id) VALUES (?)",
+                    [(entry_id,) for entry_id, (text, _) in zip(ids, rows) if text.strip()],
+                )
+            await _record_change(db, "entries", user_id, ref_id=ids[-1])
+        if job_id is not None:
+            await db.execute(
+                """
+                UPDATE import_jobs
+                SET position = ?, imported = imported + ?, skipped = skipped + ?, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (position, len(ids), skipped, time.time(), job_id),
+            )
+        await db.commit()
+
+    if ids:
+        _notify_entries_changed(user_id, ids, rows[-1][0])
+    return ids
+
+
+async def get_last_change_event_id(db_path: str = DB_PATH) -> int:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT COALESCE(MAX(id), 0) FROM change_events") as cursor:
+            row = await cursor.fetchone()
+            return int(row[0])
+
+
+async def get_change_events(after_id: int, limit: int = 500, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT * FROM change_events WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def apply_change_event(event: Dict[str, Any], db_path: str = DB_PATH) -> None:
+    """Boshqa jarayonda bo'lgan o'zgarish uchun shu jarayonning listenerlarini chaqiradi."""
+    if event["kind"] == "user":
+        _notify_user_listeners(int(event["user_id"]), event.get("nick") or "")
+    elif event["kind"] == "entry":
+        rows = await get_entries_by_ids([int(event["ref_id"])], db_path=db_path)
+        if rows:
+            _notify_entry_listeners(int(event["user_id"]), int(event["ref_id"]), rows[0]["text"])
+    elif event["kind"] == "entries":
+        # Boshqa jarayondagi bulk import: partiyaning faqat oxirgi id si jurnalda
+        rows = await get_entries_by_ids([int(event["ref_id"])], db_path=db_path)
+        if rows:
+            _notify_entries_changed(int(event["user_id"]), [int(event["ref_id"])], rows[0]["text"])
+
+
+async def prune_change_events(max_age: float, db_path: str = DB_PATH) -> None:
+    async with _writer(db_path) as db:
+        await db.execute("DELETE FROM change_events WHERE created_at < ?", (time.time() - max_age,))
+        await db.commit()
+
+
+async def enqueue_update(shard: int, payload: str, db_path: str = DB_PATH) -> int:
+    """Webhook update'ini (JSON) shard navbatiga qo'yadi va uning id sini qaytaradi."""
+    async with _writer(db_path) as db:
+        cursor = await db.execute(
+            "INSERT INTO update_queue (shard, payload, created_at) VALUES (?, ?, ?)",
+            (shard, payload, time.time()),
+        )
+        await db.commit()
+        return int(cursor.lastrowid)
+
+
+async def claim_updates(
+    shards: List[int], owner: str, lease: float, limit: int = 100, db_path: str = DB_PATH
+) -> List[Dict[str, Any]]:
+    """Berilgan shard'lardagi eng eski bo'sh update'larni owner'ga ijaraga beradi va tartib bilan qaytaradi.
+
+    Qatorlar o'chirilmaydi: update qayta ishlangach ack_updates o'chiradi.
+    Ijarasi lease soniyadan beri yangilanmagan qatorlar (egasi o'lgan) yana beriladi.
+    Shard'da oldingi qator hali boshqa jarayon ijarasida bo'lsa (masalan, slotni
+    bo'shatgan jarayon uni tugatyapti), undan keyingilari berilmaydi - aks holda
+    bitta chatning update'lari tartibsiz bajarilar edi.
+    """
+    if not shards:
+        return []
+    placeholders = ",".join("?" for _ in shards)
+    now = time.time()
+    async with _writer(db_path) as db:
+        async with db.execute(
+            f"""
+            SELECT id, shard, payload FROM update_queue AS q
+            WHERE shard IN ({placeholders}) AND (claimed_at IS NULL OR claimed_at < ?)
+              AND NOT EXISTS (
+                  SELECT 1 FROM update_queue AS o
+                  WHERE o.shard = q.shard AND o.id < q.id AND o.claimed_by != ? AND o.claimed_at >= ?
+              )
+            ORDER BY id LIMIT ?
+            """,
+            (*shards, now - lease, owner, now - lease, limit),
+        ) as cursor:
+            rows = [dict(r) for r in await cursor.fetchall()]
+        if rows:
+            await db.executemany(
+                "UPDATE update_queue SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                [(owner, now, row["id"]) for row in rows],
+            )
+            await db.commit()
+        return rows
+
+
+async def ack_updates(update_ids: List[int], db_path: str = DB_PATH) -> None:
+    """Qayta ishlangan update'larni navbatdan o'chiradi."""
+    if not update_ids:
+        return
+    async with _writer(db_path) as db:
+        await db.executemany("DELETE FROM update_queue WHERE id = ?", [(update_id,) for update_id in update_ids])
+        await db.commit()
+
+
+async def renew_update_leases(owner: str, db_path: str = DB_PATH) -> None:
+    """owner hali qayta ishlayotgan update'larning ijarasini uzaytiradi (heartbeat bilan birga)."""
+    async with _writer(db_path) as db:
+        await db.execute("UPDATE update_queue SET claimed_at = ? WHERE claimed_by = ?", (time.time(), owner))
+        await db.commit()
+
+
+async def release_update_leases(owner: str, db_path: str = DB_PATH) -> None:
+    """owner ulgurmagan update'larni ijarasiz qaytaradi, shunda ularni boshqa jarayon darhol oladi."""
+    async with _writer(db_path) as db:
+        await db.execute(
+            "UPDATE update_queue SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ?", (owner,)
+        )
+        await db.commit()
+
+
+async def count_queued_updates(db_path: str = DB_PATH) -> int:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT COUNT(*) FROM update_queue") as cursor:
+            row = await cursor.fetchone()
+            return int(row[0])
+
+
+async def claim_worker_slots(owner: str, slots: int, stale_after: float, db_path: str = DB_PATH) -> List[int]:
+    """owner slotlarining heartbeat'ini yangilaydi va kerak bo'lsa yangi slot egallaydi.
+
+    Slotsiz jarayon bitta bo'sh slotni oladi. Bundan tashqari, stale_after
+    soniyadan beri egasiz yoki heartbeat'siz qolgan slotlar (jarayon o'lgan
+    va qayta ishga tushmagan) shu jarayonga o'tadi, shunda ularning navbati
+    to'planib qolmaydi. Natija - owner'ga tegishli barcha slotlar.
+    """
+    now = time.time()
+    async with _writer(db_path) as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO worker_slots (slot, owner, heartbeat) VALUES (?, NULL, ?)",
+            [(slot, now) for slot in range(slots)],
+        )
+        await db.execute(
+            "UPDATE worker_slots SET heartbeat = ? WHERE owner = ? AND slot < ?", (now, owner, slots)
+        )
+        await db.execute(
+            """
+            UPDATE worker_slots SET owner = ?, heartbeat = ?
+            WHERE slot IN (
+                SELECT slot FROM worker_slots
+                WHERE slot < ? AND owner IS NULL
+                  AND NOT EXISTS (SELECT 1 FROM worker_slots WHERE owner = ?)
+                ORDER BY slot LIMIT 1
+            )
+            """,
+            (owner, now, slots, owner),
+        )
+        # O'lgan egasining ijaralari slot bilan birga o'tadi: ular slotning oxirgi
+        # heartbeat'idan keyin berilgan bo'lishi va hali amal qilishi mumkin
+        await db.execute(
+            """
+            UPDATE update_queue SET claimed_by = NULL, claimed_at = NULL
+            WHERE claimed_by IS NOT NULL AND claimed_by != ? AND shard IN (
+                SELECT slot FROM worker_slots WHERE slot < ? AND heartbeat < ?
+            )
+            """,
+            (owner, slots, now - stale_after),
+        )
+        await db.execute(
+            "UPDATE worker_slots SET owner = ?, heartbeat = ? WHERE slot < ? AND heartbeat < ?",
+            (owner, now, slots, now - stale_after),
+        )
+        async with db.execute(
+            "SELECT slot FROM worker_slots WHERE owner = ? AND slot < ? ORDER BY slot", (owner, slots)
+        ) as cursor:
+            owned = [int(r[0]) for r in await cursor.fetchall()]
+        await db.commit()
+        return owned
+
+
+async def release_worker_slots(owner: str, db_path: str = DB_PATH) -> None:
+    async with _writer(db_path) as db:
+        # heartbeat = hozir: bo'shagan slotni avval yangi ishga tushgan jarayon olsin
+        await db.execute(
+            "UPDATE worker_slots SET owner = NULL, heartbeat = ? WHERE owner = ?", (time.time(), owner)
+        )
+        await db.commit()
+
+
+async def get_chroma_outbox_batch(limit: int, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Yuborish vaqti kelgan outbox yozuvlarini entries bilan birga qaytaradi.
+
+    O'chirilgan yozuvlarning outbox qatorlarini entries_chroma_outbox_ad trigger'i tozalaydi.
+    """
+    now = time.time()
+    async with _reader(db_path) as db:
+        async with db.execute(
+            """
+            SELECT o.entry_id, o.attempts, e.user_id, e.text, e.created_at
+            FROM chroma_outbox o
+            JOIN entries e ON e.id = o.entry_id
+            WHERE o.next_attempt_at <= ?
+            ORDER BY o.entry_id
+            LIMIT ?
+            """,
+            (now, limit),
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def ack_chroma_outbox(entry_ids: List[int], db_path: str = DB_PATH) -> None:
+    """Chroma'ga muvaffaqiyatli yuborilgan yozuvlarni navbatdan olib tashlaydi."""
+    if not entry_ids:
+        return
+    async with _writer(db_path) as db:
+        await db.executemany("DELETE FROM chroma_outbox WHERE entry_id = ?", [(i,) for i in entry_ids])
+        await db.commit()
+
+
+async def retry_chroma_outbox(entry_ids: List[int], delay: float, error: str = "", db_path: str = DB_PATH) -> None:
+    """Yuborilmagan yozuvlarni `delay` soniyadan keyin qayta urinish uchun belgilaydi."""
+    if not entry_ids:
+        return
+    next_at = time.time() + delay
+    async with _writer(db_path) as db:
+        await db.executemany(
+            """
+            UPDATE chroma_outbox
+            SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+            WHERE entry_id = ?
+            """,
+            [(next_at, error[:500], i) for i in entry_ids],
+        )
+        await db.commit()
+
+
+async def get_chroma_outbox_next_due(db_path: str = DB_PATH) -> Optional[float]:
+    """Navbatdagi eng yaqin urinish vaqtini (epoch soniya) qaytaradi, navbat bo'sh bo'lsa None."""
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT MIN(next_attempt_at) FROM chroma_outbox") as cursor:
+            row = await cursor.fetchone()
+            return float(row[0]) if row and row[0] is not None else None
+
+
+async def get_diary_version(user_id: int, db_path: str = DB_PATH) -> str:
+    """Profil kundaligining versiyasi (diary_versions dan, bitta PK o'qishi).
+
+    Yozuv qo'shilsa, tahrirlansa yoki o'chirilsa, qiymat o'zgaradi.
+    """
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT version FROM diary_versions WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+    return str(int(row[0])) if row is not None else "0"
+
+
+async def get_cached_answer(
+    profile_id: int,
+    question_key: str,
+    diary_version: str,
+    max_age: float,
+    db_path: str = DB_PATH,
+) -> Optional[str]:
+    """answer_cache jadvalidan max_age soniyadan eski bo'lmagan javobni qaytaradi."""
+    async with _reader(db_path) as db:
+        async with db.execute(
+            """
+            SELECT answer FROM answer_cache
+            WHERE profile_id = ? AND question_key = ? AND diary_version = ? AND created_at >= ?
+            """,
+            (profile_id, question_key, diary_version, time.time() - max_age),
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row is not None else None
+
+
+async def put_cached_answer(
+    profile_id: int,
+    question_key: str,
+    diary_version: str,
+    answer: str,
+    max_age: float,
+    max_rows: int,
+    db_path: str = DB_PATH,
+) -> None:
+    """Javobni saqlaydi; muddati o'tgan va max_rows dan ortiq eski qatorlarni tozalaydi."""
+    now = time.time()
+    async with _writer(db_path) as db:
+        await db.execute(
+            """
+            INSERT OR REPLACE INTO answer_cache (profile_id, question_key, diary_version, answer, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (profile_id, question_key, diary_version, answer, now),
+        )
+        # Shu profilning eski versiyadagi javoblari endi hech qachon topilmaydi
+        await db.execute(
+            "DELETE FROM answer_cache WHERE profile_id = ? AND diary_version != ?",
+            (profile_id, diary_version),
+        )
+        await db.execute("DELETE FROM answer_cache WHERE created_at < ?", (now - max_age,))
+        if max_rows > 0:
+            await db.execute(
+                """
+                DELETE FROM answer_cache WHERE rowid IN (
+                    SELECT rowid FROM answer_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (max_rows,),
+            )
+        await db.commit()
+
+
+async def delete_cached_answers(profile_id: int, db_path: str = DB_PATH) -> None:
+    async with _writer(db_path) as db:
+        await db.execute("DELETE FROM answer_cache WHERE profile_id = ?", (profile_id,))
+        await db.commit()
+
+
+async def load_bot_persistence(kind: str, db_path: str = DB_PATH) -> List[Tuple[str, str]]:
+    """Berilgan turdagi barcha saqlangan (key, data) juftlari."""
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT key, data FROM bot_persistence WHERE kind = ?", (kind,)) as cursor:
+            rows = await cursor.fetchall()
+            return [(r[0], r[1]) for r in rows]
+
+
+async def get_bot_persistence(kind: str, key: str, db_path: str = DB_PATH) -> Optional[str]:
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT data FROM bot_persistence WHERE kind = ? AND key = ?", (kind, key)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+
+async def save_bot_persistence(
+    upserts: List[Tuple[str, str, str]],
+    deletes: List[Tuple[str, str]],
+    db_path: str = DB_PATH,
+) -> None:
+    """(kind, key, data) larni yozadi va (kind, key) larni o'chiradi - hammasi bitta tranzaksiyada."""
+    if not upserts and not deletes:
+        return
+    now = time.time()
+    async with _writer(db_path) as db:
+        if upserts:
+            await db.executemany(
+                """
+                INSERT INTO bot_persistence (kind, key, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                """,
+                [(kind, key, data, now) for kind, key, data in upserts],
+            )
+        if deletes:
+            await db.executemany("DELETE FROM bot_persistence WHERE kind = ? AND key = ?", deletes)
+        await db.commit()
+
+
+def _period_bounds(period: str) -> Tuple[str, str]:
+    """"YYYY-MM" oyining [boshi, keyingi oy boshi) oralig'i, created_at formatida."""
+    year, month = (int(p) for p in period.split("-"))
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+
+
+async def get_due_summary_periods(marked_before: float, limit: int = 20, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Xulosasi yangilanishi kerak va marked_before dan oldin belgilangan oylar (user_id, period, marked_at)."""
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT user_id, period, marked_at FROM summary_dirty WHERE marked_at <= ? ORDER BY marked_at LIMIT ?",
+            (marked_before, limit),
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def get_summary_dirty_next_due(db_path: str = DB_PATH) -> Optional[float]:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT MIN(marked_at) FROM summary_dirty") as cursor:
+            row = await cursor.fetchone()
+            return float(row[0]) if row and row[0] is not None else None
+
+
+async def get_diary_summary(user_id: int, period: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT * FROM diary_summaries WHERE user_id = ? AND period = ?", (user_id, period)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+async def get_diary_summaries(user_id: int, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Profilning barcha oylik xulosalari, yangilaridan boshlab."""
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT * FROM diary_summaries WHERE user_id = ? ORDER BY period DESC", (user_id,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def get_period_entries(
+    user_id: int,
+    period: str,
+    after_id: int = 0,
+    limit: int = 50,
+    db_path: str = DB_PATH,
+) -> List[Dict[str, Any]]:
+    """Oy ichidagi, id si after_id dan katta yozuvlarni id bo'yicha o'sish tartibida qaytaradi."""
+    start, end = _period_bounds(period)
+    async with _reader(db_path) as db:
+        async with db.execute(
+            """
+            SELECT * FROM entries
+            WHERE user_id = ? AND created_at >= ? AND created_at < ? AND id > ?
+            ORDER BY id LIMIT ?
+            """,
+            (user_id, start, end, after_id, limit),
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
 
-    # DB tranzaksiyasi tugagandan so'ng, Chroma'ga async tarzda sync qilamiz
-    if text.strip():
-        doc_id = f"user_{user_id}_{entry_id or 'unknown'}"
-        await chroma_upsert(
-            [
-                {
-                    "id": doc_id,
-                    "user_id": user_id,
-                    "text": text,
-                    "created_at": None,
-                }
-            ]
+async def complete_diary_summary(
+    user_id: int,
+    period: str,
+    summary: Optional[str],
+    entry_count: int,
+    last_entry_id: int,
+    marked_at: float,
+    db_path: str = DB_PATH,
+) -> bool:
+    """Qurilgan xulosani saqlaydi va oyni navbatdan olib tashlaydi.
+
+    marked_at - ishchi navbatdan o'qigan qiymat. Shu orada oyning yozuvi
+    o'chirilgan yoki o'zgartirilgan bo'lsa (trigger marked_at ni yangilaydi),
+    xulosa saqlanmaydi va oy navbatda qoladi. Faqat yangi yozuv qo'shilgan
+    bo'lsa, xulosa saqlanadi, oy esa navbatda qoladi. summary=None - oyda
+    yozuv qolmagan, faqat navbatdan olib tashlanadi.
+    """
+    start, end = _period_bounds(period)
+    async with _writer(db_path) as db:
+        async with db.execute(
+            "SELECT marked_at FROM summary_dirty WHERE user_id = ? AND period = ?", (user_id, period)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or float(row[0]) != marked_at:
+            return False
+        if summary is not None:
+            await db.execute(
+                """
+                INSERT INTO diary_summaries (user_id, period, summary, entry_count, last_entry_id, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, period) DO UPDATE SET
+                    summary = excluded.summary,
+                    entry_count = excluded.entry_count,
+                    last_entry_id = excluded.last_entry_id,
+                    updated_at = excluded.updated_at
+                """,
+                (user_id, period, summary, entry_count, last_entry_id, time.time()),
+            )
+        await db.execute(
+            """
+            DELETE FROM summary_dirty
+            WHERE user_id = ? AND period = ? AND NOT EXISTS (
+                SELECT 1 FROM entries
+                WHERE user_id = ? AND created_at >= ? AND created_at < ? AND id > ?
+            )
+            """,
+            (user_id, period, user_id, start, end, last_entry_id),
         )
+        await db.commit()
+    return True
+
+
+async def defer_summary_period(user_id: int, period: str, delay: float, db_path: str = DB_PATH) -> None:
+    """Xulosa qurilmasa, oyni delay soniyadan keyin qayta urinish uchun qoldiradi."""
+    async with _writer(db_path) as db:
+        await db.execute(
+            "UPDATE summary_dirty SET marked_at = ? WHERE user_id = ? AND period = ?",
+            (time.time() + delay, user_id, period),
+        )
+        await db.commit()
+
+
+async def _prune_chat_logs(db: aiosqlite.Connection, profile_id: Optional[int] = None) -> None:
+    """Saqlash muddati o'tgan va profil bo'yicha limitdan ortiq suhbat loglarini o'chiradi."""
+    if CHAT_LOG_RETENTION_DAYS > 0:
+        query = "DELETE FROM chat_logs WHERE created_at < datetime('now', ?)"
+        params: List[Any] = [f"-{int(CHAT_LOG_RETENTION_DAYS)} days"]
+        if profile_id is not None:
+            query += " AND profile_id = ?"
+            params.append(profile_id)
+        await db.execute(query, params)
+
+    if CHAT_LOG_MAX_PER_PROFILE > 0 and profile_id is not None:
+        await db.execute(
+            """
+            DELETE FROM chat_logs
+            WHERE profile_id = ? AND id <= (
+                SELECT id FROM chat_logs WHERE profile_id = ?
+                ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+            """,
+            (profile_id, profile_id, int(CHAT_LOG_MAX_PER_PROFILE)),
+        )
+
+
+async def add_chat_log(
+    profile_id: int,
+    question: str,
+    answer: str,
+    asker_telegram_id: Optional[int] = None,
+    db_path: str = DB_PATH,
+) -> None:
+    """Profil bilan bo'lgan bitta savol-javobni chat_logs jadvaliga yozadi.
+
+    Suhbat loglari kundalikka (entries) ham, Chroma indeksiga ham tushmaydi.
+    Har yozishda shu profilning eski loglari saqlash siyosati bo'yicha tozalanadi.
+    """
+    async with _writer(db_path) as db:
+        await db.execute(
+            "INSERT INTO chat_logs (profile_id, asker_telegram_id, question, answer) VALUES (?, ?, ?, ?)",
+            (profile_id, asker_telegram_id, question, answer),
+        )
+        await _prune_chat_logs(db, profile_id=profile_id)
+        await db.commit()
+
+
+async def get_chat_logs(profile_id: int, limit: int = 20, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Profilning oxirgi suhbat loglarini (yangilari birinchi) qaytaradi."""
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT * FROM chat_logs WHERE profile_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+            (profile_id, limit),
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
 
 
 async def get_entries_for_user(user_id: int, limit: Optional[int] = None, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
-    """Berilgan foydalanuvchining kundalik yozuvlarini qaytaradi.
+    """Berilgan foydalanuvchining kundalik yozuvlarini (yangilari birinchi) qaytaradi.
 
-    Hozircha LIMIT ishlatilmayapti, barcha yozuvlar olinadi.
-    Agar keyin yana oxirgi 100 ta bilan cheklamoqchi bo'lsak, so'rovni
-    `... ORDER BY created_at DESC LIMIT 100` shakliga qaytarish mumkin.
+    limit berilmasa barcha yozuvlar olinadi. Katta kundaliklarni bo'laklab o'qish
+    uchun get_entries_page dan foydalaning.
     """
 
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
-        query = "SELECT * FROM entries WHERE user_id = ? ORDER BY created_at DESC"
+    async with _reader(db_path) as db:
+        query = "SELECT * FROM entries WHERE user_id = ? ORDER BY created_at DESC, id DESC"
         params: tuple[Any, ...] = (user_id,)
-        # Agar kerak bo'lsa, limit parametri qayta yoqilishi mumkin:
-        # if limit is not None:
-        #     query += " LIMIT ?"
-        #     params = (user_id, limit)
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (user_id, limit)
 
         async with db.execute(query, params) as cursor:
             rows = await cursor.fetchall()
             return [dict(r) for r in rows]
 
 
-async def search_users_by_name_or_nick(query: str, limit: int = 10, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
-    """Ism, familiya yoki nik bo'yicha qidirish (case-insensitive)."""
-    norm = query.lower()
-    like = f"%{norm}%"
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
+async def get_entries_page(
+    user_id: int,
+    limit: int = 50,
+    before: Optional[Tuple[str, int]] = None,
+    db_path: str = DB_PATH,
+) -> List[Dict[str, Any]]:
+    """Kundalik yozuvlarini keyset pagination bilan, yangilaridan boshlab qaytaradi.
+
+    before: oldingi sahifaning oxirgi yozuvidan olingan (created_at, id) jufti.
+    Keyingi sahifa uchun `(page[-1]["created_at"], page[-1]["id"])` ni uzating.
+    OFFSET ishlatilmaydi, shuning uchun har bir sahifa (user_id, created_at)
+    indeksi bo'yicha faqat `limit` ta qatorni o'qiydi.
+    """
+
+    query = "SELECT * FROM entries WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if before is not None:
+        query += " AND (created_at, id) < (?, ?)"
+        params.extend(before)
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(max(0, int(limit)))
+
+    async with _reader(db_path) as db:
+        async with db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def get_entries_after_id(after_id: int, limit: int = 500, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """id si after_id dan katta yozuvlarni id bo'yicha o'sish tartibida qaytaradi (indekslarni to'ldirish uchun)."""
+    async with _reader(db_path) as db:
+        async with db.execute(
+            "SELECT id, user_id, created_at, text FROM entries WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+async def get_entries_by_ids(entry_ids: List[int], db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Berilgan id lar bo'yicha yozuvlarni qaytaradi (mavjud bo'lmaganlari tushib qoladi)."""
+    if not entry_ids:
+        return []
+    placeholders = ",".join("?" for _ in entry_ids)
+    async with _reader(db_path) as db:
         async with db.execute(
-            "SELECT * FROM users WHERE LOWER(name) LIKE ? OR LOWER(surname) LIKE ? OR LOWER(nick) LIKE ? LIMIT ?",
-            (like, like, like, limit),
+            f"SELECT * FROM entries WHERE id IN ({placeholders})", list(entry_ids)
         ) as cursor:
             rows = await cursor.fetchall()
             return [dict(r) for r in rows]
 
 
+async def search_entries(user_id: int, question: str, k: int = 5, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Foydalanuvchi kundaligidan savol so'zlari bo'yicha BM25 reytingli yozuvlarni qidiradi.
+
+    Savol so'zlari OR bilan birlashtiriladi (kamida bittasi mos kelsa yetadi),
+    BM25 esa ko'proq va kamyobroq so'zlari mos kelgan yozuvlarni yuqoriga chiqaradi.
+    Qaytadi: entries ustunlari + "snippet" (mos kelgan joy atrofidagi parcha) + "score"
+    (kichikroq - yaxshiroq, SQLite bm25 qoidasi bo'yicha).
+    """
+    terms = list(dict.fromkeys(tokenize(question)))
+    if not terms:
+        return []
+    # O'zbekcha qo'shimchalar (kitob -> kitoblarim) uchun so'zlarni prefiks sifatida qidiramiz
+    parts = [f'"{t}"*' if len(t) >= 3 else f'"{t}"' for t in terms]
+    match = f'owner:"u{int(user_id)}" AND (' + " OR ".join(parts) + ")"
+
+    async with _reader(db_path) as db:
+        async with db.execute(
+            """
+            SELECT e.*,
+                   snippet(entries_fts, 0, '', '', '…', 24) AS snippet,
+                   bm25(entries_fts, 1.0, 0.0) AS score
+            FROM entries_fts
+            JOIN entries e ON e.id = entries_fts.rowid
+            WHERE entries_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+            """,
+            (match, k),
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(r) for r in rows]
+
+
+def _user_match_score(query: str, query_grams: List[str], doc: str) -> float:
+    """Moslik sifati: to'liq nik/so'z > so'z boshi > ichida uchrashi > xato yozilgan so'z (0..1).
+
+    Xato yozilgan so'rov uchun umumiy trigrammalar ulushi va so'zlar bilan tahrir
+    masofasidan olingan o'xshashlikning kattasi olinadi: trigrammalar qo'shni
+    harflar almashishini ("olmsa" / "olmas" - 1/3) yaxshi sezmaydi.
+    """
+    words = doc.split()
+    if words and words[0] == query:
+        return 4.0
+    if query in words:
+        return 3.5
+    if any(w.startswith(query) for w in words):
+        return 3.0
+    if query in doc:
+        return 2.0
+    if not query_grams:
+        return 0.0
+    doc_grams = set(trigrams(doc))
+    score = sum(1 for g in query_grams if g in doc_grams) / len(query_grams)
+    for word in words:
+        # So'zning boshi bilan ham solishtiriladi: "olmsa" ~ "olmasov"
+        for target in {word, word[:len(query)]}:
+            similarity = 1.0 - edit_distance(query, target) / max(len(query), len(target))
+            score = max(score, similarity)
+    return score
+
+
+async def search_users_by_name_or_nick(query: str, limit: int = 10, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """Ism, familiya yoki nik bo'yicha qidirish, eng mos profillar birinchi.
+
+    So'rov ham, profillar ham normallashtiriladi (kichik harf, kirill/lotin,
+    tutuq belgisiz), shuning uchun "Ўлмас", "O'lmas" va "olmas" bir xil topiladi.
+    Nomzodlar avval users_search_prefix so'z boshlari indeksidan, qolgan joyga
+    users_search trigram indeksidan (so'z ichida uchraydiganlar) olinadi, butun
+    jadval ko'rilmaydi. Keyin nomzodlar
+    moslik sifati bo'yicha tartiblanadi. Harflari biroz xato yozilgan (shu
+    jumladan o'rni almashgan) so'rovlar ham topiladi (USER_SEARCH_MIN_SIMILARITY).
+    """
+    norm = normalize_name(query)
+    if not norm or limit <= 0:
+        return []
+    grams = trigrams(norm)
+    candidates_limit = max(limit * 20, 200)
+
+    async with _reader(db_path) as db:
+        # Avval nik aynan mos kelgan profil (users.nick UNIQUE indeksi)
+        async with db.execute("SELECT id FROM users WHERE nick = ?", (query.strip().lower(),)) as cursor:
+            exact = {int(r[0]) for r in await cursor.fetchall()}
+        # Avval so'zi so'rov bilan boshlanadigan profillar (so'z boshlari indeksi), keyin qolgan
+        # joyga so'z ichida uchraydiganlar: LIMIT tartibsiz kesganda ham eng mos nomzodlar
+        # tushib qolmaydi
+        if len(norm) <= 2:
+            sql, params = (
+                """
+                SELECT p.user_id, s.doc FROM users_search_prefix p
+                JOIN users_search s ON s.rowid = p.user_id
+                WHERE p.prefix = ? LIMIT ?
+                """,
+                (norm, candidates_limit),
+            )
+        else:
+            sql, params = (
+                """
+                SELECT p.user_id, s.doc FROM users_search_prefix p
+                JOIN users_search s ON s.rowid = p.user_id
+                WHERE p.prefix = ? AND (s.doc LIKE ? OR s.doc LIKE ?) LIMIT ?
+                """,
+                (norm.split()[0][:2], f"{norm}%", f"% {norm}%", candidates_limit),
+            )
+        async with db.execute(sql, params) as cursor:
+            candidates = [(int(r[0]), r[1]) for r in await cursor.fetchall()]
+        if grams and len(candidates) < candidates_limit:
+            # Trigram indeksi LIKE '%...%' ni ham tezlashtiradi
+            found = {user_id for user_id, _doc in candidates}
+            async with db.execute(
+                "SELECT rowid, doc FROM users_search WHERE doc LIKE ? LIMIT ?",
+                (f"%{norm}%", candidates_limit + len(candidates)),
+            ) as cursor:
+                more = [(int(r[0]), r[1]) for r in await cursor.fetchall() if int(r[0]) not in found]
+            candidates += more[: candidates_limit - len(candidates)]
+        if len(exact) + len(candidates) < limit and grams:
+            # Xato yozilgan so'rovlar: umumiy trigrammalari ko'p profillar (bm25 bo'yicha)
+            match = " OR ".join('"' + g.replace('"', '""') + '"' for g in grams)
+            async with db.execute(
+                "SELECT rowid, doc FROM users_search WHERE users_search MATCH ? ORDER BY rank LIMIT ?",
+                (match, candidates_limit),
+            ) as cursor:
+                candidates += [(int(r[0]), r[1]) for r in await cursor.fetchall()]
+
+        best: Dict[int, float] = {user_id: 5.0 for user_id in exact}
+        for user_id, doc in candidates:
+            score = _user_match_score(norm, grams, doc)
+            if score > 0 and score >= USER_SEARCH_MIN_SIMILARITY:
+                best[user_id] = max(score, best.get(user_id, 0.0))
+        ids = sorted(best, key=lambda user_id: (-best[user_id], user_id))[:limit]
+        if not ids:
+            return []
+
+        placeholders = ",".join("?" for _ in ids)
+        async with db.execute(
+            f"SELECT {PROFILE_COLUMNS} FROM users WHERE id IN ({placeholders})", ids
+        ) as cursor:
+            by_id = {r["id"]: dict(r) for r in await cursor.fetchall()}
+    return [by_id[user_id] for user_id in ids if user_id in by_id]
+
+
 async def delete_entries_for_user(user_id: int, db_path: str = DB_PATH) -> None:
     """Berilgan foydalanuvchiga tegishli barcha kundalik yozuvlarini o'chiradi."""
-    async with aiosqlite.connect(db_path) as db:
+    async with _writer(db_path) as db:
         await db.execute("DELETE FROM entries WHERE user_id = ?", (user_id,))
         await db.commit()
 
 
 async def delete_user_by_id(user_id: int, db_path: str = DB_PATH) -> None:
     """Foydalanuvchini va uning barcha yozuvlarini o'chiradi."""
-    async with aiosqlite.connect(db_path) as db:
+    async with _writer(db_path) as db:
+        async with db.execute("SELECT nick FROM users WHERE id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        nick = row[0] if row else ""
         await db.execute("DELETE FROM entries WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM chat_logs WHERE profile_id = ?", (user_id,))
+        await db.execute("DELETE FROM answer_cache WHERE profile_id = ?", (user_id,))
+        await db.execute("DELETE FROM diary_summaries WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM summary_dirty WHERE user_id = ?", (user_id,))
         await db.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        await db.execute("DELETE FROM users_search WHERE rowid = ?", (user_id,))
+        await db.execute("DELETE FROM users_search_prefix WHERE user_id = ?", (user_id,))
+        await _record_change(db, "user", user_id, nick=nick)
         await db.commit()
+    _notify_user_listeners(user_id, nick)
 
 
 async def count_users(db_path: str = DB_PATH) -> int:
     """Jami foydalanuvchilar sonini qaytaradi."""
-    async with aiosqlite.connect(db_path) as db:
-        async with db.execute("SELECT COUNT(*) FROM users") as cursor:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT users FROM stats_counters WHERE id = 1") as cursor:
             row = await cursor.fetchone()
             return int(row[0]) if row is not None else 0
 
 
 async def count_entries(db_path: str = DB_PATH) -> int:
     """Jami kundalik yozuvlari (entries) sonini qaytaradi."""
-    async with aiosqlite.connect(db_path) as db:
-        async with db.execute("SELECT COUNT(*) FROM entries") as cursor:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT entries FROM stats_counters WHERE id = 1") as cursor:
             row = await cursor.fetchone()
             return int(row[0]) if row is not None else 0
 
 
 async def get_last_entry_time(db_path: str = DB_PATH) -> Optional[str]:
     """Oxirgi yozuv yaratilgan vaqtni (TEXT ko'rinishida) qaytaradi."""
-    async with aiosqlite.connect(db_path) as db:
-        async with db.execute("SELECT MAX(created_at) FROM entries") as cursor:
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT last_entry_at FROM stats_counters WHERE id = 1") as cursor:
             row = await cursor.fetchone()
             return row[0] if row and row[0] is not None else None
 
 
 async def get_avg_entries_per_user(db_path: str = DB_PATH) -> float:
     """Bitta foydalanuvchiga o'rtacha to'g'ri keladigan yozuvlar soni."""
-    users = await count_users(db_path=db_path)
-    entries = await count_entries(db_path=db_path)
+    async with _reader(db_path) as db:
+        async with db.execute("SELECT users, entries FROM stats_counters WHERE id = 1") as cursor:
+            row = await cursor.fetchone()
+    users = int(row[0]) if row is not None else 0
+    entries = int(row[1]) if row is not None else 0
     if users == 0:
         return 0.0
     return entries / users
@@ -225,8 +1956,7 @@ async def get_avg_entries_per_user(db_path: str = DB_PATH) -> float:
 
 async def get_last_user(db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
     """Oxirgi ro'yxatdan o'tgan foydalanuvchini (id bo'yicha) qaytaradi."""
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
+    async with _reader(db_path) as db:
         async with db.execute("SELECT * FROM users ORDER BY id DESC LIMIT 1") as cursor:
             row = await cursor.fetchone()
             return dict(row) if row else None
@@ -234,17 +1964,237 @@ async def get_last_user(db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
 
 async def get_top_writer(db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
     """Eng ko'p yozuv qoldirgan foydalanuvchini va uning yozuvlar sonini qaytaradi."""
-    async with aiosqlite.connect(db_path) as db:
-        db.row_factory = aiosqlite.Row
+    async with _reader(db_path) as db:
         async with db.execute(
             """
-            SELECT u.*, COUNT(e.id) AS entry_count
-            FROM users u
-            LEFT JOIN entries e ON e.user_id = u.id
-            GROUP BY u.id
-            ORDER BY entry_count DESC
+            SELECT u.*, c.entry_count
+            FROM user_entry_counts c
+            JOIN users u ON u.id = c.user_id
+            ORDER BY c.entry_count DESC, c.user_id
             LIMIT 1
             """
         ) as cursor:
             row = await cursor.fetchone()
             return dict(row) if row else None
+
+
+async def get_stats_snapshot(db_path: str = DB_PATH) -> Dict[str, Any]:
+    """/stats uchun barcha ko'rsatkichlarni bitta so'rovda qaytaradi.
+
+    Hammasi trigger bilan yangilanadigan hisoblagich jadvallaridan va indekslardan
+    o'qiladi, shuning uchun narxi yozuvlar soniga bog'liq emas. Natijada
+    last_user va top_writer - lug'at yoki None.
+    """
+    async with _reader(db_path) as db:
+        async with db.execute(
+            """
+            SELECT
+                s.users,
+                s.entries,
+                s.last_entry_at,
+                (SELECT COALESCE(SUM(entry_count), 0) FROM daily_entry_counts WHERE day = DATE('now')) AS today_entries,
+                (SELECT COUNT(*) FROM daily_entry_counts WHERE day = DATE('now') AND entry_count > 0) AS today_active_users,
+                lu.nick AS last_nick, lu.name AS last_name, lu.surname AS last_surname,
+                tu.nick AS top_nick, tu.name AS top_name, tu.surname AS top_surname,
+                tw.entry_count AS top_entry_count
+            FROM stats_counters s
+            LEFT JOIN users lu ON lu.id = (SELECT MAX(id) FROM users)
+            LEFT JOIN (
+                SELECT c.user_id, c.entry_count
+                FROM user_entry_counts c JOIN users u ON u.id = c.user_id
+                ORDER BY c.entry_count DESC, c.user_id
+                LIMIT 1
+            ) tw ON 1
+            LEFT JOIN users tu ON tu.id = tw.user_id
+            WHERE s.id = 1
+            """
+        ) as cursor:
+            row = await cursor.fetchone()
+    if row is None:
+        return {
+            "users": 0,
+            "entries": 0,
+            "last_entry_at": None,
+            "avg_entries_per_user": 0.0,
+            "today_entries": 0,
+            "today_active_users": 0,
+            "last_user": None,
+            "top_writer": None,
+        }
+    users = int(row["users"])
+    entries = int(row["entries"])
+    return {
+        "users": users,
+        "entries": entries,
+        "last_entry_at": row["last_entry_at"],
+        "avg_entries_per_user": entries / users if users else 0.0,
+        "today_entries": int(row["today_entries"]),
+        "today_active_users": int(row["today_active_users"]),
+        "last_user": (
+            {"nick": row["last_nick"], "name": row["last_name"], "surname": row["last_surname"]}
+            if row["last_nick"] is not None
+            else None
+        ),
+        "top_writer": (
+            {
+                "nick": row["top_nick"],
+                "name": row["top_name"],
+                "surname": row["top_surname"],
+                "entry_count": int(row["top_entry_count"]),
+            }
+            if row["top_nick"] is not None
+            else None
+        ),
+    }
+
+
+async def verify_stats_counters(repair: bool = True, db_path: str = DB_PATH) -> Dict[str, Any]:
+    """Hisoblagichlarni users/entries jadvallaridan qayta hisoblangan qiymatlar bilan solishtiradi.
+
+    To'liq qayta hisoblash o'quvchi ulanishda bajariladi, shuning uchun bot
+    yozuvlari uni kutmaydi. Yozuvchi ulanish faqat farq qilgan qatorlar uchun
+    olinadi: ular indeks bo'yicha yana bir bor tekshiriladi (o'qish va yozish
+    orasida kelgan yozuvlar soxta farq bermasligi uchun) va repair=True bo'lsa
+    o'sha joyda tuzatiladi. Natija: har bir jadval bo'yicha farq qilgan qatorlar
+    soni va "repaired" belgisi.
+    """
+    async with _reader(db_path) as db:
+        async with db.execute(
+            """
+            SELECT
+                (SELECT COUNT(*) FROM (
+                    SELECT users, entries, last_entry_at FROM stats_counters WHERE id = 1
+                    EXCEPT
+                    SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM entries), (SELECT MAX(created_at) FROM entries)
+                )) + (SELECT COUNT(*) = 0 FROM stats_counters WHERE id = 1)
+            """
+        ) as cursor:
+            totals_suspect = bool((await cursor.fetchone())[0])
+        async with db.execute(
+            """
+            SELECT user_id FROM (
+                SELECT user_id, entry_count FROM user_entry_counts WHERE entry_count != 0
+                EXCEPT
+                SELECT user_id, COUNT(*) FROM entries GROUP BY user_id
+            )
+            UNION
+            SELECT user_id FROM (
+                SELECT user_id, COUNT(*) FROM entries GROUP BY user_id
+                EXCEPT
+                SELECT user_id, entry_count FROM user_entry_counts
+            )
+            """
+        ) as cursor:
+            suspect_users = [int(r[0]) for r in await cursor.fetchall()]
+        async with db.execute(
+            """
+            SELECT day, user_id FROM (
+                SELECT day, user_id, entry_count FROM daily_entry_counts
+                EXCEPT
+                SELECT COALESCE(DATE(created_at), ''), user_id, COUNT(*) FROM entries GROUP BY COALESCE(DATE(created_at), ''), user_id
+            )
+            UNION
+            SELECT day, user_id FROM (
+                SELECT COALESCE(DATE(created_at), '') AS day, user_id, COUNT(*) FROM entries GROUP BY COALESCE(DATE(created_at), ''), user_id
+                EXCEPT
+                SELECT day, user_id, entry_count FROM daily_entry_counts
+            )
+            """
+        ) as cursor:
+            suspect_days = [(r[0], int(r[1])) for r in await cursor.fetchall()]
+
+    result: Dict[str, Any] = {
+        "totals": 0,
+        "user_entry_counts": 0,
+        "daily_entry_counts": 0,
+        "repaired": False,
+    }
+    if not (totals_suspect or suspect_users or suspect_days):
+        return result
+
+    async with _writer(db_path) as db:
+        for user_id in suspect_users:
+            # (user_id, created_at) indeksi bo'yicha faqat shu foydalanuvchi yozuvlari
+            async with db.execute(
+                "SELECT COUNT(*), MAX(created_at) FROM entries WHERE user_id = ?", (user_id,)
+            ) as cursor:
+                actual, last_at = await cursor.fetchone()
+            async with db.execute(
+                "SELECT entry_count FROM user_entry_counts WHERE user_id = ?", (user_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if (int(row[0]) if row else 0) == actual:
+                continue
+            result["user_entry_counts"] += 1
+            if repair and not actual:
+                # Yozuvsiz foydalanuvchi uchun 0 qatori qoladi, o'chirilgan foydalanuvchiniki ketadi
+                await db.execute("DELETE FROM user_entry_counts WHERE user_id = ?", (user_id,))
+                await db.execute(
+                    "INSERT INTO user_entry_counts (user_id, entry_count, last_entry_at) SELECT id, 0, NULL FROM users WHERE id = ?",
+                    (user_id,),
+                )
+            elif repair:
+                await db.execute(
+                    """
+                    INSERT INTO user_entry_counts (user_id, entry_count, last_entry_at) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        entry_count = excluded.entry_count, last_entry_at = excluded.last_entry_at
+                    """,
+                    (user_id, actual, last_at),
+                )
+        for day, user_id in suspect_days:
+            # DATE(created_at) indeksi; '' - sanasi yo'q yozuvlar
+            async with db.execute(
+                "SELECT COUNT(*) FROM entries WHERE DATE(created_at) IS ? AND user_id = ?",
+                (day or None, user_id),
+            ) as cursor:
+                actual = (await cursor.fetchone())[0]
+            async with db.execute(
+                "SELECT entry_count FROM daily_entry_counts WHERE day = ? AND user_id = ?", (day, user_id)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if (int(row[0]) if row else 0) == actual:
+                continue
+            result["daily_entry_counts"] += 1
+            if repair:
+                if actual:
+                    await db.execute(
+                        """
+                        INSERT INTO daily_entry_counts (day, user_id, entry_count) VALUES (?, ?, ?)
+                        ON CONFLICT(day, user_id) DO UPDATE SET entry_count = excluded.entry_count
+                        """,
+                        (day, user_id, actual),
+                    )
+                else:
+                    await db.execute(
+                        "DELETE FROM daily_entry_counts WHERE day = ? AND user_id = ?", (day, user_id)
+                    )
+        if totals_suspect:
+            # Kamdan-kam holat: umumiy sonlarni qayta sanash faqat farq topilganda
+            async with db.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM entries), (SELECT MAX(created_at) FROM entries),
+                    (SELECT users FROM stats_counters WHERE id = 1),
+                    (SELECT entries FROM stats_counters WHERE id = 1),
+                    (SELECT last_entry_at FROM stats_counters WHERE id = 1),
+                    (SELECT COUNT(*) FROM stats_counters WHERE id = 1)
+                """
+            ) as cursor:
+                users, entries, last_at, s_users, s_entries, s_last, exists = await cursor.fetchone()
+            if not exists or (users, entries, last_at) != (s_users, s_entries, s_last):
+                result["totals"] = 1
+                if repair:
+                    await db.execute(
+                        """
+                        INSERT INTO stats_counters (id, users, entries, last_entry_at) VALUES (1, ?, ?, ?)
+                        ON CONFLICT(id) DO UPDATE SET
+                            users = excluded.users, entries = excluded.entries, last_entry_at = excluded.last_entry_at
+                        """,
+                        (users, entries, last_at),
+                    )
+        if repair and (result["totals"] or result["user_entry_counts"] or result["daily_entry_counts"]):
+            logger.warning("Statistika hisoblagichlari mos emas edi, farq qilgan qatorlar tuzatildi: %s", result)
+            await db.commit()
+            result["repaired"] = True
+    return result
\ No newline at end of file
@@ -0,0 +1,65 @@
+import importlib.util
+from typing import Dict
+
+import httpx
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+# Har bir tashqi servis (host) uchun ochiq turadigan ulanishlar chegarasi
+HTTP_MAX_CONNECTIONS: int = getattr(config, "HTTP_MAX_CONNECTIONS", 20) if config is not None else 20
+HTTP_MAX_KEEPALIVE: int = getattr(config, "HTTP_MAX_KEEPALIVE", 10) if config is not None else 10
+HTTP_KEEPALIVE_EXPIRY: float = getattr(config, "HTTP_KEEPALIVE_EXPIRY", 60.0) if config is not None else 60.0
+
+# HTTP/2 faqat `h2` paketi o'rnatilgan bo'lsa yoqiladi (httpx[http2]), aks holda HTTP/1.1 keep-alive
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Servis nomi -> (umumiy timeout, ulanish timeouti) soniyalarda
+_TIMEOUTS: Dict[str, tuple] = {
+    "groq": (60.0, 10.0),
+    "chroma": (30.0, 5.0),
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    total, connect = _TIMEOUTS.get(name, (30.0, 5.0))
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(total, connect=connect),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Servis uchun jarayon bo'yicha umumiy AsyncClient'ni qaytaradi.
+
+    Har bir chaqiruvda yangi klient (va yangi TCP+TLS handshake) ochish o'rniga,
+    bitta klient va uning keep-alive ulanishlari qayta ishlatiladi. Klient
+    start_http_clients chaqirilmagan bo'lsa ham birinchi murojaatda yaratiladi.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+async def start_http_clients() -> None:
+    """Ma'lum servislar uchun klientlarni oldindan yaratadi (startup'da chaqiriladi)."""
+    for name in _TIMEOUTS:
+        get_client(name)
+
+
+async def close_http_clients() -> None:
+    """Barcha umumiy klientlarni va ularning ulanishlarini yopadi (shutdown'da chaqiriladi)."""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
@@ -0,0 +1,532 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from context_packer import estimate_tokens
+from http_clients import get_client
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name: str, default: Any) -> Any:
+    return getattr(config, name, default) if config is not None else default
+
+
+# Bir vaqtda ochiq turadigan Groq so'rovlari: jami va bitta profil uchun
+GROQ_MAX_CONCURRENCY: int = _setting("GROQ_MAX_CONCURRENCY", 8)
+GROQ_PER_PROFILE_CONCURRENCY: int = _setting("GROQ_PER_PROFILE_CONCURRENCY", 2)
+# Groq hisobidagi daqiqalik limitlar (so'rov va token). 0 - cheklanmagan
+GROQ_RPM: int = _setting("GROQ_RPM", 30)
+GROQ_TPM: int = _setting("GROQ_TPM", 6000)
+# Navbat yoki rate limit uchun eng ko'p kutish; undan uzoq bo'lsa darhol fallback
+GROQ_QUEUE_TIMEOUT: float = _setting("GROQ_QUEUE_TIMEOUT", 20.0)
+# 429/5xx va tarmoq xatolarida qayta urinishlar
+GROQ_MAX_RETRIES: int = _setting("GROQ_MAX_RETRIES", 3)
+GROQ_BACKOFF_BASE: float = _setting("GROQ_BACKOFF_BASE", 1.0)
+GROQ_BACKOFF_MAX: float = _setting("GROQ_BACKOFF_MAX", 20.0)
+# Ketma-ket shuncha xatodan keyin circuit breaker ochiladi va GROQ_BREAKER_RESET soniya
+# davomida Groq'ga umuman murojaat qilinmaydi
+GROQ_BREAKER_THRESHOLD: int = _setting("GROQ_BREAKER_THRESHOLD", 5)
+GROQ_BREAKER_RESET: float = _setting("GROQ_BREAKER_RESET", 30.0)
+# Fon chaqiruvlari (background=True) uchun alohida daqiqalik byudjet. Ular umumiy
+# limitda GROQ_BACKGROUND_HEADROOM ulushi bo'sh qolgandagina va hech bir interaktiv
+# so'rov navbatda turmaganda yuboriladi, shuning uchun foydalanuvchi javoblarini kuttirmaydi
+GROQ_BACKGROUND_RPM: int = _setting("GROQ_BACKGROUND_RPM", 4)
+GROQ_BACKGROUND_TPM: int = _setting("GROQ_BACKGROUND_TPM", 1500)
+GROQ_BACKGROUND_HEADROOM: float = _setting("GROQ_BACKGROUND_HEADROOM", 0.5)
+_BACKGROUND_POLL = 1.0
+
+_RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Streaming callback: shu paytgacha kelgan to'liq matn bilan chaqiriladi
+PartialCallback = Callable[[str], Awaitable[None]]
+
+
+class LLMError(Exception):
+    """Groq'dan javob olinmadi (status xatosi, tarmoq xatosi yoki urinishlar tugadi).
+
+    retryable=False - so'rovning o'zi xato (masalan, 400/401); bunday xatolar
+    Groq nosozligi hisoblanmaydi va circuit breaker'ga ta'sir qilmaydi.
+    """
+
+    def __init__(self, message: str, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LLMUnavailable(LLMError):
+    """Groq hozir chaqirilmaydi: circuit breaker ochiq yoki limitlar uchun kutish juda uzoq."""
+
+
+class TokenBucket:
+    """Daqiqalik limit uchun token bucket.
+
+    Tokenlar oldindan band qilinadi (balans manfiy bo'lishi mumkin), shuning
+    uchun keyingi so'rovlar navbat bilan, kelgan tartibida kutadi.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self._rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self, amount: float, max_wait: float) -> None:
+        if self.capacity <= 0:
+            return
+        amount = min(float(amount), self.capacity)
+        self._refill()
+        wait = max(0.0, (amount - self._tokens) / self._rate)
+        if wait > max_wait:
+            raise LLMUnavailable(f"rate limit: {wait:.0f} s kutish kerak")
+        self._tokens -= amount
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Kutish bekor qilindi: band qilingan tokenlar boshqalarga qaytadi
+                self.refund(amount)
+                raise
+
+    def available(self) -> float:
+        """Hozir kutmasdan olish mumkin bo'lgan tokenlar (cheklanmagan bucket uchun cheksiz)."""
+        if self.capacity <= 0:
+            return math.inf
+        self._refill()
+        return self._tokens
+
+    def has_headroom(self, amount: float, reserve: float) -> bool:
+        """amount olingandan keyin ham sig'imning reserve ulushi bo'sh qoladimi."""
+        if self.capacity <= 0:
+            return True
+        return self.available() >= min(self.capacity, float(amount) + self.capacity * reserve)
+
+    def refund(self, amount: float) -> None:
+        """Band qilingan, lekin ishlatilmagan tokenlarni qaytaradi."""
+        if self.capacity <= 0 or amount <= 0:
+            return
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + min(float(amount), self.capacity))
+
+
+class CircuitBreaker:
+    """closed -> (threshold ta ketma-ket xato) -> open -> (reset_timeout) -> half_open.
+
+    half_open holatida bitta sinov so'rovi o'tkaziladi: muvaffaqiyatli bo'lsa
+    breaker yopiladi, xato bo'lsa yana reset_timeout ga ochiladi.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning("Groq circuit breaker ochildi (%d ta ketma-ket xato)", self.failures)
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Sinov so'rovi natijasiz tugasa (masalan, bekor qilinsa), keyingisiga yo'l beradi."""
+        self._probing = False
+
+
+class LatencyStats:
+    """Oxirgi N ta javob uchun birinchi token vaqti (TTFT) va umumiy vaqtni saqlaydi."""
+
+    def __init__(self, window: int = 500) -> None:
+        self.ttft: "deque[float]" = deque(maxlen=window)
+        self.total: "deque[float]" = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, ttft: Optional[float], total: float) -> None:
+        self.count += 1
+        if ttft is not None:
+            self.ttft.append(ttft)
+        self.total.append(total)
+
+    @staticmethod
+    def _percentiles(samples: "deque[float]") -> Dict[str, Optional[float]]:
+        if not samples:
+            return {"p50": None, "p95": None}
+        ordered = sorted(samples)
+        return {
+            "p50": round(ordered[len(ordered) // 2], 3),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "replies": self.count,
+            "ttft_seconds": self._percentiles(self.ttft),
+            "total_seconds": self._percentiles(self.total),
+        }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After sarlavhasini (soniya yoki HTTP sana) soniyaga aylantiradi."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _delta_text(chunk: Dict[str, Any]) -> str:
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    delta = choices[0].get("delta") or {}
+    return delta.get("content") or ""
+
+
+class GroqClient:
+    """Groq chat/completions uchun himoyalangan klient.
+
+    - global va profil bo'yicha semaforlar bir vaqtdagi so'rovlar sonini cheklaydi;
+    - RPM/TPM token bucket'lari Groq limitlariga yetmaslik uchun so'rovlarni kuttiradi;
+    - 429/5xx va tarmoq xatolarida Retry-After yoki eksponensial backoff bilan qayta uradi;
+    - ketma-ket xatolardan keyin circuit breaker ochilib, LLMUnavailable darhol qaytadi;
+    - background=True chaqiruvlar o'z byudjetidan o'tadi va interaktiv so'rovlarga yo'l beradi.
+
+    api_base va http klientni berib, testlarda lokal soxta Groq serveriga ulash mumkin.
+    """
+
+    def __init__(
+        self,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.api_base = api_base or _setting("GROQ_API_BASE", "https://api.groq.com/openai/v1/chat/completions")
+        self.api_key = (api_key if api_key is not None else _setting("GROQ_API_KEY", "")).strip()
+        self._client = client
+        self._global = asyncio.Semaphore(max(1, GROQ_MAX_CONCURRENCY))
+        self._profiles: "weakref.WeakValueDictionary[Any, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+        self.requests_bucket = TokenBucket(GROQ_RPM)
+        self.tokens_bucket = TokenBucket(GROQ_TPM)
+        self.background_requests_bucket = TokenBucket(GROQ_BACKGROUND_RPM)
+        self.background_tokens_bucket = TokenBucket(GROQ_BACKGROUND_TPM)
+        # Global semaforni kutayotgan (hali yuborilmagan) interaktiv so'rovlar
+        self.interactive_waiting = 0
+        self.background_calls = 0
+        self.breaker = CircuitBreaker(GROQ_BREAKER_THRESHOLD, GROQ_BREAKER_RESET)
+        self.latency = LatencyStats()
+        self.in_flight = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client if self._client is not None else get_client("groq")
+
+    def _profile_semaphore(self, profile_id: Any) -> asyncio.Semaphore:
+        semaphore = self._profiles.get(profile_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, GROQ_PER_PROFILE_CONCURRENCY))
+            self._profiles[profile_id] = semaphore
+        return semaphore
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        profile_id: Any = None,
+        max_tokens: int = 768,
+        temperature: float = 0.5,
+        model: Optional[str] = None,
+        on_partial: Optional[PartialCallback] = None,
+        background: bool = False,
+    ) -> str:
+        """Javob matnini qaytaradi. on_partial berilsa, javob SSE oqimi bilan olinadi.
+
+        background=True - fon ishi (masalan, oylik xulosa): navbat vaqti cheklanmaydi,
+        lekin so'rov interaktiv so'rovlar uchun limit zaxirasi qolgandagina yuboriladi.
+
+        Muvaffaqiyatsiz bo'lsa LLMError (yoki LLMUnavailable) ko'taradi; xato matni
+        foydalanuvchiga ko'rsatish uchun emas, faqat log uchun.
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailable("circuit breaker ochiq")
+
+        payload = {
+            "model": model or _setting("GROQ_MODEL", "mixtral-8x7b-32768"),
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        # Prompt + javob uchun taxminiy token soni TPM bucket'idan band qilinadi
+        token_cost = sum(estimate_tokens(m.get("content", "")) for m in messages) + max_tokens
+
+        settled = False
+        try:
+            async with self._profile_semaphore(profile_id):
+                if background:
+                    await self._background_turn(token_cost)
+                    self.background_calls += 1
+                else:
+                    self.interactive_waiting += 1
+                try:
+                    # Rate limit kutishi global semafordan tashqarida: limitni kutayotgan
+                    # so'rov bir vaqtdagi so'rovlar slotini band qilmaydi
+                    await self._reserve(token_cost)
+                    try:
+                        await asyncio.wait_for(self._global.acquire(), timeout=GROQ_QUEUE_TIMEOUT)
+                    except BaseException as e:
+                        self._unreserve(token_cost)
+                        if isinstance(e, asyncio.TimeoutError):
+                            self.rejected += 1
+                            raise LLMUnavailable("Groq navbati to'lgan") from None
+                        raise
+                finally:
+                    if not background:
+                        self.interactive_waiting -= 1
+                try:
+                    self.in_flight += 1
+                    try:
+                        content = await self._with_retries(payload, token_cost, on_partial)
+                    finally:
+                        self.in_flight -= 1
+                finally:
+                    self._global.release()
+            self.breaker.record_success()
+            settled = True
+            return content
+        except LLMUnavailable:
+            raise
+        except LLMError as e:
+            self.failures += 1
+            if e.retryable:
+                self.breaker.record_failure()
+                settled = True
+            raise
+        finally:
+            if not settled:
+                self.breaker.release_probe()
+
+    async def _background_turn(self, token_cost: int) -> None:
+        """Fon so'rovi navbatini kutadi: avval o'z byudjeti, so'ng umumiy limitda zaxira.
+
+        Interaktiv so'rov navbatda tursa yoki umumiy bucket'larda GROQ_BACKGROUND_HEADROOM
+        ulushidan kam joy qolsa, fon so'rovi yuborilmay kutib turadi.
+        """
+        await self.background_requests_bucket.acquire(1, math.inf)
+        try:
+            await self.background_tokens_bucket.acquire(token_cost, math.inf)
+        except BaseException:
+            self.background_requests_bucket.refund(1)
+            raise
+        try:
+            while (
+                self.interactive_waiting
+                or not self.requests_bucket.has_headroom(1, GROQ_BACKGROUND_HEADROOM)
+                or not self.tokens_bucket.has_headroom(token_cost, GROQ_BACKGROUND_HEADROOM)
+            ):
+                await asyncio.sleep(_BACKGROUND_POLL)
+        except BaseException:
+            self.background_requests_bucket.refund(1)
+            self.background_tokens_bucket.refund(token_cost)
+            raise
+
+    async def _reserve(self, token_cost: int) -> None:
+        """RPM va TPM bucket'laridan joy band qiladi; ikkinchisi rad etsa, birinchisi qaytariladi."""
+        await self.requests_bucket.acquire(1, GROQ_QUEUE_TIMEOUT)
+        try:
+            await self.tokens_bucket.acquire(token_cost, GROQ_QUEUE_TIMEOUT)
+        except BaseException:
+            self.requests_bucket.refund(1)
+            raise
+
+    def _unreserve(self, token_cost: int) -> None:
+        """So'rov yuborilmadi: band qilingan limitlarni qaytaradi."""
+        self.requests_bucket.refund(1)
+        self.tokens_bucket.refund(token_cost)
+
+    async def _with_retries(self, payload: Dict[str, Any], token_cost: int, on_partial: Optional[PartialCallback]) -> str:
+        emitted = False
+
+        async def track(text: str) -> None:
+            nonlocal emitted
+            emitted = True
+            if on_partial is not None:
+                await on_partial(text)
+
+        attempt = 0
+        while True:
+            try:
+                if on_partial is not None:
+                    return await self._stream(payload, track)
+                return await self._complete(payload, token_cost)
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                retryable = status in _RETRYABLE_STATUSES
+                error = LLMError(f"Groq {status}: {e.response.text[:500]}", retryable=retryable)
+                delay = _retry_after(e.response)
+            except httpx.TransportError as e:
+                error = LLMError(f"Groq tarmoq xatosi: {e!r}")
+                retryable = True
+                delay = None
+
+            # Foydalanuvchiga qisman javob ko'rsatilgan bo'lsa, takrorlab bo'lmaydi
+            if not retryable or emitted or attempt >= GROQ_MAX_RETRIES:
+                raise error
+            if delay is None:
+                delay = min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * (2 ** attempt))
+                delay = random.uniform(delay / 2, delay)
+            elif delay > GROQ_BACKOFF_MAX:
+                raise error
+            attempt += 1
+            self.retries += 1
+            logger.warning("%s; %.1f s dan keyin qayta urinish (%d/%d)", error, delay, attempt, GROQ_MAX_RETRIES)
+            await asyncio.sleep(delay)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    async def _stream(self, payload: Dict[str, Any], on_partial: PartialCallback) -> str:
+        """OpenAI formatidagi SSE oqimini o'qiydi va matnni yig'ib boradi.
+
+        Har bir yangi bo'lak kelganda on_partial(shu paytgacha yig'ilgan matn) chaqiriladi.
+        """
+        started = time.monotonic()
+        first_token_at: Optional[float] = None
+        parts: List[str] = []
+        async with self.client.stream(
+            "POST", self.api_base, headers=self._headers(), json={**payload, "stream": True}
+        ) as resp:
+            if resp.is_error:
+                await resp.aread()
+                resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    piece = _delta_text(json.loads(data))
+                except (ValueError, AttributeError):
+                    continue
+                if not piece:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                parts.append(piece)
+                await on_partial("".join(parts))
+        finished = time.monotonic()
+        self.latency.record(
+            first_token_at - started if first_token_at is not None else None,
+            finished - started,
+        )
+        return "".join(parts)
+
+    async def _complete(self, payload: Dict[str, Any], token_cost: int) -> str:
+        """Oqimsiz (bitta javobli) chat/completions so'rovi."""
+        started = time.monotonic()
+        resp = await self.client.post(self.api_base, headers=self._headers(), json=payload)
+        resp.raise_for_status()
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise LLMError(f"Groq javobi JSON emas: {e}") from e
+        elapsed = time.monotonic() - started
+        # Oqimsiz rejimda birinchi token foydalanuvchiga butun javob bilan birga yetadi
+        self.latency.record(elapsed, elapsed)
+
+        usage = data.get("usage") or {}
+        if isinstance(usage.get("total_tokens"), int):
+            # Taxmin haqiqiy sarfdan ko'p bo'lsa, farqni TPM bucket'iga qaytaramiz
+            self.tokens_bucket.refund(token_cost - usage["total_tokens"])
+        try:
+            choices = data.get("choices") or []
+            return (
+                choices[0]["message"]["content"]
+                if choices and "message" in choices[0]
+                else ""
+            ) or ""
+        except Exception:  # noqa: BLE001
+            return ""
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "background_calls": self.background_calls,
+            **self.latency.snapshot(),
+        }
+
+
+_groq: Optional[GroqClient] = None
+
+
+def get_groq() -> GroqClient:
+    """Jarayon bo'yicha umumiy GroqClient (limitlar va breaker barcha handlerlar uchun bitta)."""
+    global _groq
+    if _groq is None:
+        _groq = GroqClient()
+    return _groq
+
+
+def reply_metrics() -> Dict[str, Any]:
+    """Groq javoblari: TTFT va umumiy kechikish (p50/p95), breaker holati, xato va qayta urinishlar."""
+    return get_groq().metrics()
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import zlib
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from context_packer import tokenize
+from db import DB_PATH, add_entry_listener, get_entries_after_id, get_entries_by_ids
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# Hashlangan vektor o'lchami (ustunlar soni). O'zgartirilsa, indeks qaytadan quriladi.
+LOCAL_INDEX_DIM: int = getattr(config, "LOCAL_INDEX_DIM", 512) if config is not None else 512
+_INITIAL_CAPACITY = 1024
+_SYNC_PAGE_SIZE = 500
+
+
+def _feature_counts(text: str) -> Counter:
+    """Matndan so'zlar va so'z ichidagi 3-gramlar (`<so` `soz` `oz>`) chastotasini oladi.
+
+    3-gramlar o'zbekcha qo'shimchalarni (kitob, kitobim, kitoblarimiz) bir-biriga
+    yaqinlashtiradi, tutuq belgisi tokenize ichida olib tashlanadi.
+    """
+    features: Counter = Counter()
+    for word in tokenize(text):
+        features["w:" + word] += 1
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            features["g:" + padded[i : i + 3]] += 1
+    return features
+
+
+def embed(text: str, dim: int = LOCAL_INDEX_DIM) -> np.ndarray:
+    """Matnni hashing trick bilan L2-normallangan float32 vektorga aylantiradi."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for feature, count in _feature_counts(text).items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        # So'zlar 3-gramlardan kuchliroq signal beradi
+        weight = 2.0 if feature.startswith("w:") else 1.0
+        vec[h % dim] += sign * weight * (1.0 + math.log(count))
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+class LocalVectorIndex:
+    """Kundalik yozuvlari uchun jarayon ichidagi vektor indeks.
+
+    Vektorlar DATABASE_PATH yonidagi memory-mapped faylda saqlanadi:
+    `<db>.vectors` (float32, capacity x dim) va `<db>.vectors.ids` (int64, capacity x 2:
+    entry_id, user_id). `<db>.vectors.json` da o'lcham va to'ldirilgan qatorlar soni turadi.
+    Qidiruv tarmoqsiz, bitta matritsa ko'paytmasi bilan bajariladi.
+
+    Fayllarga faqat bitta jarayon yozadi (writable=True: bitta jarayonli rejimda
+    yagona jarayon, ko'p jarayonli rejimda 0-slot egasi). Qolganlari fayllarni
+    faqat o'qish uchun ochadi va refresh() da `.json` o'zgargan bo'lsa qayta
+    yuklaydi. Yozuvchi qatorni avval yozib, keyin `.json` dagi count'ni
+    oshiradi, fayllar esa faqat o'sadi (qatorlar joyidan siljimaydi), shuning
+    uchun o'quvchining eski xaritasi ham yaroqli qoladi.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, dim: int = LOCAL_INDEX_DIM, writable: bool = True) -> None:
+        self.db_path = db_path
+        self.dim = dim
+        self.writable = writable
+        self.base_path = f"{db_path}.vectors"
+        self.count = 0
+        self.capacity = 0
+        self.last_entry_id = 0
+        self._vectors: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+        # O'quvchi oxirgi marta yuklagan `.json` holati (mtime, inode)
+        self._meta_stamp: Optional[Tuple[int, int]] = None
+
+    # --- fayl bilan ishlash ---
+
+    def _meta_path(self) -> str:
+        return f"{self.base_path}.json"
+
+    def _map(self, capacity: int, mode: str) -> None:
+        self._vectors = np.memmap(self.base_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+        self._ids = np.memmap(f"{self.base_path}.ids", dtype=np.int64, mode=mode, shape=(capacity, 2))
+        self.capacity = capacity
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _files_ok(self, meta: Dict[str, Any]) -> bool:
+        files_ok = os.path.exists(self.base_path) and os.path.exists(f"{self.base_path}.ids")
+        return meta.get("dim") == self.dim and files_ok and bool(meta.get("capacity"))
+
+    def open(self) -> None:
+        if not self.writable:
+            self._load()
+            return
+        meta = self._read_meta()
+        if self._files_ok(meta):
+            self._map(int(meta["capacity"]), "r+")
+            self.count = int(meta.get("count", 0))
+            self.last_entry_id = int(meta.get("last_entry_id", 0))
+        else:
+            # Indeks yo'q yoki boshqa o'lchamda qurilgan: bo'sh indeksdan boshlaymiz.
+            # Yangi fayllar yonida yaratilib, os.replace bilan almashtiriladi - o'quvchilar
+            # xaritasidagi eski fayl kesilmaydi.
+            for path, row_bytes in ((self.base_path, self.dim * 4), (f"{self.base_path}.ids", 16)):
+                with open(f"{path}.tmp", "wb") as f:
+                    f.truncate(_INITIAL_CAPACITY * row_bytes)
+                os.replace(f"{path}.tmp", path)
+            self._map(_INITIAL_CAPACITY, "r+")
+            self.count = 0
+            self.last_entry_id = 0
+            self._save_meta()
+
+    def _load(self) -> None:
+        """O'quvchi: `.json` va fayllarni faqat o'qish uchun (qayta) ochadi."""
+        try:
+            st = os.stat(self._meta_path())
+            stamp: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_ino)
+        except OSError:
+            stamp = None
+        self._vectors = None
+        self._ids = None
+        self.count = 0
+        self.last_entry_id = 0
+        meta = self._read_meta()
+        if stamp is not None and self._files_ok(meta):
+            try:
+                self._map(int(meta["capacity"]), "r")
+                self.count = int(meta.get("count", 0))
+                self.last_entry_id = int(meta.get("last_entry_id", 0))
+            except (OSError, ValueError):
+                # Yozuvchi fayllarni endi almashtiryapti: keyingi refresh'da qayta urinamiz
+                self._vectors = None
+                self._ids = None
+                self.count = 0
+                stamp = None
+        self._meta_stamp = stamp
+
+    def refresh(self) -> None:
+        """O'quvchi: yozuvchi `.json` ni yangilagan bo'lsa, indeksni qayta yuklaydi."""
+        if self.writable:
+            return
+        try:
+            st = os.stat(self._meta_path())
+            stamp: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_ino)
+        except OSError:
+            stamp = None
+        if stamp is None or stamp != self._meta_stamp:
+            self._load()
+
+    def _save_meta(self) -> None:
+        tmp_path = f"{self._meta_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "dim": self.dim,
+                    "capacity": self.capacity,
+                    "count": self.count,
+                    "last_entry_id": self.last_entry_id,
+                },
+                f,
+            )
+        os.replace(tmp_path, self._meta_path())
+
+    def flush(self) -> None:
+        if self.writable and self._vectors is not None and self._ids is not None:
+            self._vectors.flush()
+            self._ids.flush()
+            self._save_meta()
+
+    def close(self) -> None:
+        self.flush()
+        self._vectors = None
+        self._ids = None
+
+    def _grow(self, needed: int) -> None:
+        new_capacity = max(self.capacity * 2, needed, _INITIAL_CAPACITY)
+        assert self._vectors is not None and self._ids is not None
+        self._vectors.flush()
+        self._ids.flush()
+        # Fayllar joyida uzaytiriladi (qatorlar siljimaydi, ko'chirish shart emas). "w+"
+        # bilan qayta ochish faylni kesadi va boshqa jarayonlar xaritasini buzadi.
+        # Eski xarita ham yaroqli qoladi: sync thread'da o'sayotganda search uni o'qiy oladi.
+        for path, row_bytes in ((self.base_path, self.dim * 4), (f"{self.base_path}.ids", 16)):
+            with open(path, "r+b") as f:
+                f.truncate(new_capacity * row_bytes)
+        self._map(new_capacity, "r+")
+
+    # --- yozish va qidirish ---
+
+    def add_many(self, rows: List[Tuple[int, int, str]]) -> None:
+        """(entry_id, user_id, text) qatorlarini indeksga qo'shadi.
+
+        sync_from_db uni alohida thread'da chaqiradi; search esa bir vaqtda event
+        loop'da ishlashi mumkin, shuning uchun count qatorlar yozilgandan keyin oshadi.
+        """
+        rows = [r for r in rows if r[0] > self.last_entry_id and (r[2] or "").strip()]
+        if not rows or not self.writable or self._vectors is None or self._ids is None:
+            return
+        if self.count + len(rows) > self.capacity:
+            self._grow(self.count + len(rows))
+
+        start = self.count
+        for offset, (entry_id, user_id, text) in enumerate(rows):
+            self._vectors[start + offset] = embed(text, self.dim)
+            self._ids[start + offset] = (entry_id, user_id)
+        self.count += len(rows)
+        self.last_entry_id = max(self.last_entry_id, max(r[0] for r in rows))
+        self._save_meta()
+
+    def search(self, user_id: int, question: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Foydalanuvchining savolga eng yaqin yozuvlarini (entry_id, cosine) ko'rinishida qaytaradi."""
+        # add_many thread'da xaritani almashtirishi mumkin: bitta holatni olib ishlaymiz
+        vectors, ids, count = self._vectors, self._ids, self.count
+        if count == 0 or vectors is None or ids is None or not question.strip():
+            return []
+        ids = ids[:count]
+        rows = np.nonzero(ids[:, 1] == user_id)[0]
+        if rows.size == 0:
+            return []
+
+        query = embed(question, self.dim)
+        scores = vectors[rows] @ query
+        k = min(top_k, rows.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[rows[i], 0]), float(scores[i])) for i in top if scores[i] > 0]
+
+    async def sync_from_db(self) -> int:
+        """Indeksda hali yo'q yozuvlarni (entry id bo'yicha) bazadan o'qib qo'shadi.
+
+        Embedding va fayllarga yozish alohida thread'da bajariladi, event loop
+        to'silmaydi. Bir vaqtda faqat bitta sync ishlaydi (_sync_lock).
+        """
+        added = 0
+        if not self.writable:
+            return added
+        while True:
+            page = await get_entries_after_id(self.last_entry_id, limit=_SYNC_PAGE_SIZE, db_path=self.db_path)
+            if not page:
+                break
+            await asyncio.to_thread(self.add_many, [(e["id"], e["user_id"], e["text"]) for e in page])
+            # Agar sahifada faqat bo'sh matnlar bo'lsa ham keyingi sahifaga o'tamiz
+            self.last_entry_id = max(self.last_entry_id, page[-1]["id"])
+            added += len(page)
+        await asyncio.to_thread(self.flush)
+        return added
+
+
+_index: Optional[LocalVectorIndex] = None
+
+
+def get_local_index() -> Optional[LocalVectorIndex]:
+    return _index
+
+
+_sync_lock = asyncio.Lock()
+_sync_requested = False
+_sync_tasks: "set[asyncio.Task]" = set()
+
+
+async def _sync() -> None:
+    """Indeksni bazaga yetkazadi. Bir vaqtda faqat bitta sync ishlaydi; ish paytida
+    kelgan so'rovlar yo'qolmasligi uchun tugagach yana bir marta tekshiramiz."""
+    global _sync_requested
+    async with _sync_lock:
+        while _index is not None:
+            _sync_requested = False
+            try:
+                await _index.sync_from_db()
+            except Exception:
+                logger.exception("Lokal vektor indeksni yangilashda xato")
+                return
+            if not _sync_requested:
+                return
+
+
+def _on_entry_added(user_id: int, entry_id: int, text: str) -> None:
+    # Yozuvni to'g'ridan-to'g'ri qo'shmaymiz: entry id bo'yicha sync qilish oraliqdagi
+    # yozuvlarni (boshqa jarayon yoki bulk import yozganlarini ham) o'tkazib yubormaydi.
+    # O'quvchi jarayonlar indeksni local_query'da refresh() bilan yangilaydi.
+    global _sync_requested
+    if _index is None or not _index.writable:
+        return
+    _sync_requested = True
+    if _sync_lock.locked():
+        return
+    task = asyncio.create_task(_sync())
+    _sync_tasks.add(task)
+    task.add_done_callback(_sync_tasks.discard)
+
+
+async def start_local_index(db_path: str = DB_PATH, writer: bool = True) -> None:
+    """Indeksni ochadi, bazadagi yangi yozuvlar bilan to'ldiradi va add_entry'ga ulaydi.
+
+    writer=False bo'lsa, indeks faqat o'qish uchun ochiladi (ko'p jarayonli
+    rejimda 0-slot egasi bo'lmagan jarayonlar).
+    """
+    global _index
+    if _index is None:
+        _index = LocalVectorIndex(db_path, writable=writer)
+        _index.open()
+        add_entry_listener(_on_entry_added)
+    before = _index.count
+    await _sync()
+    if _index.count > before:
+        logger.info("Lokal vektor indeksga %d ta yozuv qo'shildi", _index.count - before)
+
+
+async def set_local_index_writer(writer: bool) -> None:
+    """Jarayonni indeks yozuvchisi qiladi yoki o'quvchiga qaytaradi (0-slot egasi almashganda)."""
+    if _index is None or _index.writable == writer:
+        return
+    async with _sync_lock:
+        if _index is None or _index.writable == writer:
+            return
+        _index.close()
+        _index.writable = writer
+        _index.open()
+    logger.info("Lokal vektor indeks: %s", "yozuvchi" if writer else "faqat o'qish")
+    if writer:
+        await _sync()
+
+
+async def stop_local_index() -> None:
+    global _index
+    for task in list(_sync_tasks):
+        task.cancel()
+    if _index is not None:
+        async with _sync_lock:
+            _index.close()
+            _index = None
+
+
+async def local_query(user_id: int, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """chroma_query bilan bir xil formatda lokal indeksdan hit'lar qaytaradi."""
+    if _index is None:
+        return []
+    _index.refresh()
+    matches = _index.search(user_id, question, top_k=top_k)
+    if not matches:
+        return []
+    rows = {e["id"]: e for e in await get_entries_by_ids([m[0] for m in matches], db_path=_index.db_path)}
+    hits: List[Dict[str, Any]] = []
+    for entry_id, score in matches:
+        row = rows.get(entry_id)
+        if row is None:
+            # Yozuv o'chirilgan bo'lishi mumkin
+            continue
+        hits.append(
+            {
+                "text": row["text"],
+                "score": score,
+                "metadata": {
+                    "entry_id": entry_id,
+                    "user_id": row["user_id"],
+                    "created_at": row["created_at"],
+                },
+            }
+        )
+    return hits
@@ -1,20 +1,53 @@
 import asyncio
+import hmac
+import json
 import logging
 import os
+import tempfile
+import time
+from typing import Callable, List
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from telegram import Update
 from telegram.ext import Application
 
 import config
+from answer_cache import answer_cache_stats
+from backup import (
+    BACKUP_TOKEN,
+    backup_stats,
+    check_backup_token,
+    create_raw_snapshot,
+    iter_file,
+    iter_gzip,
+    list_snapshots,
+    start_backups,
+    stop_backups,
+)
 from bot import build_application as build_bot_application, main as local_main
+from db import init_db, close_db
+from chroma_sync import start_chroma_sync, stop_chroma_sync
+from http_clients import start_http_clients, close_http_clients
+from llm_client import reply_metrics
+from multiworker import ProcessCoordinator, multiworker_enabled
+from prompt_cache import prompt_cache_stats
+from passwords import shutdown_password_hasher
+from persistence import SQLitePersistence
+from retrieval import set_retrieval_writer, start_retrieval, stop_retrieval
+from summaries import start_summaries, stop_summaries, summaries_stats
+from update_dispatcher import UpdateDispatcher, update_shard_key
+from user_cache import user_cache_stats
 
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
 telegram_app: Application | None = None
+update_dispatcher: UpdateDispatcher | None = None
+coordinator: ProcessCoordinator | None = None
+_background_jobs = False
 
 
 async def build_application() -> Application:
@@ -35,46 +68,196 @@ async def build_application() -> Application:
     return application
 
 
+async def _process_update(update: Update) -> None:
+    if telegram_app is not None:
+        if isinstance(telegram_app.persistence, SQLitePersistence):
+            # Ko'p jarayonli rejim: chat boshqa jarayondan o'tgan bo'lsa, suhbat holati bazadan olinadi
+            await telegram_app.persistence.refresh_conversations(telegram_app, update)
+        await telegram_app.process_update(update)
+
+
+async def _process_queued(payload: str, done: Callable[[], None]) -> None:
+    """Ko'p jarayonli rejim: SQLite navbatidan olingan update'ni shu jarayon workerlariga beradi.
+
+    done() update bajarilgach chaqiriladi va navbat qatori shundan keyin o'chiriladi.
+    """
+    if telegram_app is None or update_dispatcher is None:
+        raise RuntimeError("Bot hali ishga tushmagan")
+    await update_dispatcher.put(Update.de_json(json.loads(payload), telegram_app.bot), on_done=done)
+
+
+def _start_background_jobs() -> None:
+    global _background_jobs
+    start_chroma_sync()
+    start_summaries()
+    start_backups()
+    _background_jobs = True
+
+
+async def _stop_background_jobs() -> None:
+    global _background_jobs
+    await stop_backups()
+    await stop_summaries()
+    await stop_chroma_sync()
+    _background_jobs = False
+
+
+def _on_slots_changed(owned: List[int]) -> None:
+    # Lokal vektor indeks fayllariga ham faqat 0-slot egasi yozadi, qolganlari o'qiydi
+    asyncio.create_task(set_retrieval_writer(0 in owned))
+    # Fon ishlari (Chroma indeksatori, oylik xulosalar) faqat 0-slot egasida ishlaydi
+    if 0 in owned and not _background_jobs:
+        _start_background_jobs()
+    elif 0 not in owned and _background_jobs:
+        asyncio.create_task(_stop_background_jobs())
+
+
 @app.on_event("startup")
 async def on_startup() -> None:
-    global telegram_app
+    global telegram_app, update_dispatcher, coordinator
+    # Webhook rejimida post_init chaqirilmaydi, shuning uchun bazani shu yerda tayyorlaymiz
+    await init_db()
+    await start_http_clients()
+    # Ko'p jarayonli rejimda indeks yozuvchisi 0-slot olingach aniqlanadi (_on_slots_changed)
+    await start_retrieval(writer=not multiworker_enabled())
+    if not multiworker_enabled():
+        _start_background_jobs()
     telegram_app = await build_application()
+    update_dispatcher = UpdateDispatcher(
+        _process_update,
+        workers=config.WEBHOOK_WORKERS,
+        queue_size=config.WEBHOOK_QUEUE_SIZE,
+        per_chat_limit=config.WEBHOOK_CHAT_QUEUE_SIZE,
+    )
+    update_dispatcher.start()
+    if multiworker_enabled():
+        coordinator = ProcessCoordinator(_process_queued, on_slots_changed=_on_slots_changed)
+        await coordinator.start()
     logger.info("Telegram application started inside FastAPI (Deta Space mode)")
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
-    global telegram_app
+    global telegram_app, update_dispatcher, coordinator
+    if coordinator is not None:
+        # Avval yangi update olishni to'xtatamiz va slotlarni boshqa jarayonlarga bo'shatamiz
+        await coordinator.stop()
+    if update_dispatcher is not None:
+        # Qabul qilingan update'larni yo'qotmaslik uchun avval navbatni bo'shatamiz
+        await update_dispatcher.stop()
+        update_dispatcher = None
+    if coordinator is not None:
+        # Bajarilganlar navbatdan o'chadi, ulgurmaganlari boshqa jarayonga qaytadi
+        await coordinator.release_updates()
+        coordinator = None
     if telegram_app is not None:
         await telegram_app.stop()
         await telegram_app.shutdown()
         telegram_app = None
+    await stop_retrieval()
+    await _stop_background_jobs()
+    await close_http_clients()
+    shutdown_password_hasher()
+    await close_db()
 
 
 @app.post("/")
 async def telegram_webhook(request: Request):
-    """Asosiy webhook endpoint. Telegram barcha update'larni shu yerga yuboradi."""
-    global telegram_app
-    if telegram_app is None:
-        # Agar nimadir sababli app hali ishga tushmagan bo'lsa
-        telegram_app = await build_application()
+    """Asosiy webhook endpoint. Telegram barcha update'larni shu yerga yuboradi.
+
+    Update faqat navbatga qo'yiladi va Telegram'ga darhol javob qaytariladi;
+    Groq javobi kabi uzoq ishlarni workerlar fonda bajaradi. Navbat to'lgan
+    bo'lsa 503 qaytaramiz, Telegram update'ni keyinroq qayta yuboradi.
+    """
+    if telegram_app is None or update_dispatcher is None:
+        raise HTTPException(status_code=503, detail="Bot hali ishga tushmagan")
 
     data = await request.json()
     update = Update.de_json(data, telegram_app.bot)
-    await telegram_app.process_update(update)
+    if coordinator is not None:
+        # Ko'p jarayonli rejim: update chat bo'yicha shard'ga yoziladi va uni shu
+        # shard egasi bo'lgan jarayon kelgan tartibida qayta ishlaydi
+        await coordinator.submit(json.dumps(data), update_shard_key(update))
+        return {"ok": True}
+    if not update_dispatcher.submit(update):
+        logger.warning("Update navbati to'lgan, update %s qaytarildi", update.update_id)
+        return JSONResponse(status_code=503, content={"ok": False, "error": "queue full"})
     return {"ok": True}
 
 
+def _request_token(request: Request, header: str) -> str:
+    """Token "Authorization: Bearer <token>" yoki berilgan maxsus sarlavhadan olinadi."""
+    auth = request.headers.get("Authorization", "")
+    if auth.lower().startswith("bearer "):
+        return auth[7:].strip()
+    return request.headers.get(header, "")
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Webhook navbati holati va AI javoblari kechikishi (birinchi token vaqti).
+
+    METRICS_TOKEN sozlangan bo'lsa, u "Authorization: Bearer <token>" yoki
+    "X-Metrics-Token" sarlavhasida berilishi shart; bo'sh bo'lsa endpoint ochiq.
+    """
+    metrics_token = config.METRICS_TOKEN
+    if metrics_token and not hmac.compare_digest(
+        _request_token(request, "X-Metrics-Token").encode(), metrics_token.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Noto'g'ri metrics token")
+    return {
+        "webhook": update_dispatcher.metrics() if update_dispatcher is not None else None,
+        "ai": reply_metrics(),
+        "answer_cache": answer_cache_stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "user_cache": user_cache_stats(),
+        "persistence": (
+            telegram_app.persistence.metrics()
+            if telegram_app is not None and telegram_app.persistence is not None
+            else None
+        ),
+        "summaries": summaries_stats(),
+        "backups": backup_stats(),
+        "multiworker": await coordinator.metrics() if coordinator is not None else None,
+    }
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 @app.get("/download-db")
-async def download_db():
-    """SQLite bazasini fayl sifatida yuklab beruvchi endpoint.
+async def download_db(request: Request, latest: bool = False):
+    """Bazaning izchil snapshotini gzip bilan siqib, bo'lak-bo'lak yuboradi.
 
-    Eslatma: Bu endpointni faqat vaqtincha backup olish uchun ishlating va
-    keyinchalik xavfsizlik uchun olib tashlang yoki cheklang.
+    BACKUP_TOKEN "Authorization: Bearer <token>" yoki "X-Backup-Token" sarlavhasida
+    berilishi shart (token sozlanmagan bo'lsa endpoint o'chiq). Standart holatda
+    so'rov paytidagi yangi snapshot olinadi (VACUUM INTO, alohida thread'da);
+    ?latest=1 - oxirgi davriy snapshot yuboriladi. Fayl bo'laklab o'qiladi,
+    shuning uchun xotira bazaning hajmiga bog'liq emas.
     """
+    if not BACKUP_TOKEN:
+        raise HTTPException(status_code=404, detail="Backup endpoint o'chirilgan")
+    if not check_backup_token(_request_token(request, "X-Backup-Token")):
+        raise HTTPException(status_code=401, detail="Noto'g'ri backup token")
 
-    db_path = config.DATABASE_PATH
+    if latest:
+        snapshots = list_snapshots()
+        if not snapshots:
+            raise HTTPException(status_code=404, detail="Saqlangan snapshot yo'q")
+        return StreamingResponse(
+            iter_file(snapshots[0]["path"]),
+            media_type="application/gzip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{snapshots[0]["name"]}"',
+                "Content-Length": str(snapshots[0]["size"]),
+            },
+        )
 
+    db_path = config.DATABASE_PATH
     # Agar asosiy yo'l bo'yicha fayl topilmasa, eski nisbiy yo'lni ham tekshirib ko'ramiz.
     if not os.path.exists(db_path):
         fallback_path = "database.db"
@@ -83,10 +266,21 @@ async def download_db():
         else:
             raise HTTPException(status_code=404, detail="Database file not found")
 
-    return FileResponse(
-        path=db_path,
-        filename="database.db",
-        media_type="application/octet-stream",
+    fd, snapshot_path = tempfile.mkstemp(prefix="snapshot-", suffix=".db", dir=os.path.dirname(os.path.abspath(db_path)))
+    os.close(fd)
+    try:
+        await create_raw_snapshot(snapshot_path, db_path=db_path)
+    except Exception:
+        _remove_quietly(snapshot_path)
+        logger.exception("Snapshot olinmadi")
+        raise HTTPException(status_code=500, detail="Snapshot olinmadi")
+
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    return StreamingResponse(
+        iter_gzip(snapshot_path),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="database-{stamp}.db.gz"'},
+        background=BackgroundTask(_remove_quietly, snapshot_path),
     )
 
 
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db import (
+    DB_PATH,
+    ack_updates,
+    apply_change_event,
+    claim_updates,
+    claim_worker_slots,
+    count_queued_updates,
+    enable_change_events,
+    enqueue_update,
+    get_change_events,
+    get_last_change_event_id,
+    prune_change_events,
+    release_update_leases,
+    release_worker_slots,
+    renew_update_leases,
+)
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# uvicorn --workers soni (Procfile'da WEB_CONCURRENCY). 1 dan katta bo'lsa, update'lar
+# SQLite navbati orqali chat id bo'yicha jarayonlarga taqsimlanadi
+WORKER_PROCESSES: int = getattr(config, "WORKER_PROCESSES", 1) if config is not None else 1
+# Navbat bo'sh bo'lganda yangi update'larni tekshirish oralig'i (soniya)
+UPDATE_QUEUE_POLL: float = getattr(config, "UPDATE_QUEUE_POLL", 0.2) if config is not None else 0.2
+# Shu vaqt (soniya) heartbeat bo'lmasa, slot egasi o'lgan hisoblanadi va boshqa jarayonga o'tadi
+WORKER_SLOT_TTL: float = getattr(config, "WORKER_SLOT_TTL", 30.0) if config is not None else 30.0
+# Boshqa jarayonlardagi o'zgarishlarni (keshlarni bekor qilish) tekshirish oralig'i (soniya)
+CHANGE_EVENTS_POLL: float = getattr(config, "CHANGE_EVENTS_POLL", 1.0) if config is not None else 1.0
+_CHANGE_EVENTS_RETENTION = 3600.0
+_CLAIM_BATCH = 100
+
+
+def multiworker_enabled() -> bool:
+    return WORKER_PROCESSES > 1
+
+
+class ProcessCoordinator:
+    """Bir nechta uvicorn jarayoni orasida update'lar va keshlarni muvofiqlashtiradi.
+
+    Webhook qaysi jarayonga tushishidan qat'i nazar, update update_queue
+    jadvaliga shard = chat id % slots bilan yoziladi. Har bir jarayon
+    worker_slots'dan slot egallaydi va faqat o'z shard'laridagi update'larni
+    id tartibida olib, handle(payload, done) ga beradi - shuning uchun bitta
+    chat doim bitta jarayonda, kelgan tartibida qayta ishlanadi.
+
+    Olingan qator navbatda ijara (lease) bilan qoladi va faqat update qayta
+    ishlangach (handle bergan done() chaqirilgach) o'chiriladi. Ijara heartbeat
+    bilan uzaytiriladi; jarayon o'lsa, WORKER_SLOT_TTL dan keyin qator slotning
+    yangi egasiga qayta beriladi - update yo'qolmaydi (kamdan-kam ikki marta
+    bajarilishi mumkin).
+
+    Yozuv qo'shilishi va foydalanuvchi yaratish/o'chirish change_events
+    jurnaliga tushadi; boshqa jarayonlar uni o'qib, o'z listenerlarini
+    chaqiradi (profil, javob va prompt keshlari, lokal indeks).
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[str, Callable[[], None]], Awaitable[Any]],
+        on_slots_changed: Optional[Callable[[List[int]], None]] = None,
+        slots: int = WORKER_PROCESSES,
+        db_path: str = DB_PATH,
+    ) -> None:
+        self._handle = handle
+        self._on_slots_changed = on_slots_changed
+        self.slots = max(1, slots)
+        self.db_path = db_path
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owned: List[int] = []
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._last_event_id = 0
+        # Qayta ishlangan, lekin hali navbatdan o'chirilmagan update id lari
+        self._acked: List[int] = []
+        self.enqueued = 0
+        self.consumed = 0
+        self.failed = 0
+        self.events_applied = 0
+
+    def shard_of(self, shard_key: int) -> int:
+        return shard_key % self.slots
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        enable_change_events(self.origin)
+        self._last_event_id = await get_last_change_event_id(db_path=self.db_path)
+        await self._refresh_slots()
+        self._tasks = [
+            asyncio.create_task(self._heartbeat_loop(), name="multiworker-heartbeat"),
+            asyncio.create_task(self._consume_loop(), name="multiworker-consume"),
+            asyncio.create_task(self._events_loop(), name="multiworker-events"),
+        ]
+        logger.info("Jarayon %s: slotlar %s / %d", self.origin, self.owned, self.slots)
+
+    async def stop(self) -> None:
+        """Yangi update olishni to'xtatadi va slotlarni bo'shatadi.
+
+        Olingan update'lar ijarasi saqlanadi: ularni shu jarayon tugatadi, keyin
+        release_updates() tasdiqlaydi va ulgurmaganlarini navbatga qaytaradi.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        enable_change_events(None)
+        try:
+            await release_worker_slots(self.origin, db_path=self.db_path)
+        except Exception:
+            logger.exception("Worker slotlarini bo'shatib bo'lmadi")
+        self.owned = []
+
+    async def release_updates(self) -> None:
+        """stop() va workerlar to'xtagandan keyin: bajarilganlarni o'chiradi, qolganlarini qaytaradi."""
+        try:
+            await self._flush_acks()
+            await release_update_leases(self.origin, db_path=self.db_path)
+        except Exception:
+            logger.exception("Navbatdagi update ijaralarini qaytarib bo'lmadi")
+
+    def _done(self, update_id: int) -> Callable[[], None]:
+        def done() -> None:
+            self._acked.append(update_id)
+
+        return done
+
+    async def _flush_acks(self) -> None:
+        if not self._acked:
+            return
+        acked, self._acked = self._acked, []
+        try:
+            await ack_updates(acked, db_path=self.db_path)
+        except BaseException:
+            # Keyingi urinishda yana o'chiramiz
+            self._acked = acked + self._acked
+            raise
+
+    async def submit(self, payload: str, shard_key: int) -> None:
+        """Update'ni (JSON) navbatga yozadi; shard shu jarayonniki bo'lsa, iste'molchini darhol uyg'otadi."""
+        shard = self.shard_of(shard_key)
+        await enqueue_update(shard, payload, db_path=self.db_path)
+        self.enqueued += 1
+        if shard in self.owned:
+            self._wakeup.set()
+
+    async def _refresh_slots(self) -> None:
+        owned = await claim_worker_slots(self.origin, self.slots, WORKER_SLOT_TTL, db_path=self.db_path)
+        if owned != self.owned:
+            logger.info("Jarayon %s slotlari: %s -> %s", self.origin, self.owned, owned)
+            self.owned = owned
+            self._wakeup.set()
+            if self._on_slots_changed is not None:
+                self._on_slots_changed(owned)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(WORKER_SLOT_TTL / 3)
+            try:
+                await self._refresh_slots()
+                await renew_update_leases(self.origin, db_path=self.db_path)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Worker slot heartbeat xato berdi")
+
+    async def _consume_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._flush_acks()
+                rows = await claim_updates(
+                    self.owned, self.origin, WORKER_SLOT_TTL, limit=_CLAIM_BATCH, db_path=self.db_path
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("update_queue'dan o'qib bo'lmadi")
+                rows = []
+            for row in rows:
+                try:
+                    await self._handle(row["payload"], self._done(int(row["id"])))
+                    self.consumed += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # Buzilgan update qayta-qayta berilmasin: u ham navbatdan o'chiriladi
+                    self._acked.append(int(row["id"]))
+                    self.failed += 1
+                    logger.exception("Navbatdagi update %s ni qayta ishlab bo'lmadi", row["id"])
+            if len(rows) < _CLAIM_BATCH:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=UPDATE_QUEUE_POLL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _events_loop(self) -> None:
+        rounds = 0
+        while True:
+            await asyncio.sleep(CHANGE_EVENTS_POLL)
+            try:
+                for event in await get_change_events(self._last_event_id, db_path=self.db_path):
+                    self._last_event_id = int(event["id"])
+                    if event["origin"] == self.origin:
+                        continue
+                    await apply_change_event(event, db_path=self.db_path)
+                    self.events_applied += 1
+                rounds += 1
+                if 0 in self.owned and rounds % 600 == 0:
+                    await prune_change_events(_CHANGE_EVENTS_RETENTION, db_path=self.db_path)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("change_events'ni qo'llab bo'lmadi")
+
+    async def metrics(self) -> Dict[str, Any]:
+        return {
+            "origin": self.origin,
+            "slots": self.slots,
+            "owned_slots": self.owned,
+            "queued": await count_queued_updates(db_path=self.db_path),
+            "enqueued": self.enqueued,
+            "consumed": self.consumed,
+            "pending_acks": len(self._acked),
+            "failed": self.failed,
+            "events_applied": self.events_applied,
+        }
@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+# bcrypt cost factor: har +1 hisoblash vaqtini ikki baravar oshiradi (12 ~ 200-300 ms)
+BCRYPT_ROUNDS: int = getattr(config, "BCRYPT_ROUNDS", 12) if config is not None else 12
+# Bir vaqtda ishlaydigan hash/verify soni. Qolganlari navbatda kutadi, event loop esa bo'sh qoladi.
+PASSWORD_HASH_WORKERS: int = getattr(config, "PASSWORD_HASH_WORKERS", 2) if config is not None else 2
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, PASSWORD_HASH_WORKERS), thread_name_prefix="bcrypt"
+        )
+    return _executor
+
+
+def _hash_sync(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def _verify_sync(password: str, stored_hash: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), stored_hash.encode("utf-8"))
+    except ValueError:
+        # Bazadagi hash buzilgan yoki bo'sh bo'lsa
+        return False
+
+
+async def hash_password(password: str) -> str:
+    """Parolni bcrypt bilan alohida thread pool'da hashlaydi.
+
+    bcrypt.hashpw bir necha yuz millisekund CPU oladi; uni handler ichida
+    to'g'ridan-to'g'ri chaqirsak, shu vaqt davomida boshqa barcha foydalanuvchilarning
+    update'lari to'xtab qoladi.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _hash_sync, password)
+
+
+async def verify_password(password: str, stored_hash: str) -> bool:
+    """Parolni bazadagi bcrypt hash bilan thread pool'da solishtiradi."""
+    if not stored_hash:
+        return False
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _verify_sync, password, stored_hash)
+
+
+def shutdown_password_hasher() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
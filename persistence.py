@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, BasePersistence, ConversationHandler, PersistenceInput
+
+from db import DB_PATH, get_bot_persistence, init_db, load_bot_persistence, save_bot_persistence
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_ENABLED: bool = getattr(config, "PERSISTENCE_ENABLED", True) if config is not None else True
+# PTB o'zgargan user_data/suhbat holatlarini shu oraliqda (soniya) persistence'ga beradi
+PERSISTENCE_INTERVAL: float = getattr(config, "PERSISTENCE_INTERVAL", 5.0) if config is not None else 5.0
+# O'zgarishlar bazaga yozilishidan oldin yig'iladigan vaqt (soniya): bir oraliqdagi
+# barcha update_* chaqiruvlari bitta tranzaksiyaga tushadi
+PERSISTENCE_FLUSH_DELAY: float = getattr(config, "PERSISTENCE_FLUSH_DELAY", 0.5) if config is not None else 0.5
+# Bir nechta jarayonli rejimda user_data va update chatining suhbat holati har bir
+# update oldidan bazadagi bilan solishtiriladi
+_REFRESH_FROM_DB: bool = (getattr(config, "WORKER_PROCESSES", 1) if config is not None else 1) > 1
+
+_USER_DATA = "user_data"
+_CHAT_DATA = "chat_data"
+_BOT_DATA = "bot_data"
+_BOT_DATA_KEY = "0"
+
+
+def _conversation_kind(name: str) -> str:
+    return f"conversation:{name}"
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _state_from_json(value: Any) -> object:
+    # JSON'da tuple ro'yxatga aylanadi; PTB kutilayotgan holatlarni tuple sifatida beradi
+    return tuple(value) if isinstance(value, list) else value
+
+
+class SQLitePersistence(BasePersistence):
+    """PTB holatini mavjud SQLite bazasidagi bot_persistence jadvalida saqlaydi.
+
+    Har bir kalitning oxirgi yozilgan JSON ko'rinishi xotirada turadi, shuning
+    uchun update_* chaqiruvlarida o'zgarmagan ma'lumot bazaga qayta yozilmaydi.
+    O'zgarganlari navbatga olinadi va PERSISTENCE_FLUSH_DELAY dan keyin bitta
+    tranzaksiyada yoziladi (write-behind); flush() navbatni darhol yozadi.
+    callback_data saqlanmaydi (bot arbitrary_callback_data ishlatmaydi).
+    """
+
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        update_interval: float = PERSISTENCE_INTERVAL,
+        flush_delay: float = PERSISTENCE_FLUSH_DELAY,
+        refresh_from_db: bool = _REFRESH_FROM_DB,
+    ) -> None:
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.db_path = db_path
+        self.flush_delay = flush_delay
+        self.refresh_from_db = refresh_from_db
+        self._db_ready = False
+        # (kind, key) -> bazadagi oxirgi JSON
+        self._stored: Dict[Tuple[str, str], str] = {}
+        # (kind, key) -> yozilishi kerak bo'lgan JSON (None - o'chirish)
+        self._dirty: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.writes = 0
+        self.skipped = 0
+        self.flushes = 0
+
+    async def _load(self, kind: str) -> Dict[str, Any]:
+        if not self._db_ready:
+            # Polling rejimida Application.initialize() post_init'dan oldin chaqiriladi
+            await init_db(self.db_path)
+            self._db_ready = True
+        result: Dict[str, Any] = {}
+        for key, data in await load_bot_persistence(kind, db_path=self.db_path):
+            self._stored[(kind, key)] = data
+            try:
+                result[key] = json.loads(data)
+            except ValueError:
+                logger.warning("bot_persistence: %s/%s buzilgan, e'tiborsiz qoldirildi", kind, key)
+        return result
+
+    def _mark(self, kind: str, key: str, value: Any) -> None:
+        if value is None:
+            data = None
+        else:
+            try:
+                data = _dumps(value)
+            except (TypeError, ValueError):
+                logger.warning("bot_persistence: %s/%s JSON'ga aylantirib bo'lmadi", kind, key)
+                return
+        slot = (kind, key)
+        current = self._dirty[slot] if slot in self._dirty else self._stored.get(slot)
+        if data == current:
+            self.skipped += 1
+            return
+        self._dirty[slot] = data
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(), name="persistence-flush")
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self._write_dirty()
+        except Exception:
+            logger.exception("bot_persistence'ga yozib bo'lmadi, keyingi flush'da qayta uriniladi")
+
+    async def _write_dirty(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            upserts = [(kind, key, data) for (kind, key), data in batch.items() if data is not None]
+            deletes = [slot for slot, data in batch.items() if data is None]
+            try:
+                await save_bot_persistence(upserts, deletes, db_path=self.db_path)
+            except BaseException:
+                # Yozilmagan o'zgarishlar yo'qolmasin (shu orada kelgan yangilari ustun)
+                for slot, data in batch.items():
+                    self._dirty.setdefault(slot, data)
+                raise
+            for slot, data in batch.items():
+                if data is None:
+                    self._stored.pop(slot, None)
+                else:
+                    self._stored[slot] = data
+            self.writes += len(batch)
+            self.flushes += 1
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(key): value for key, value in (await self._load(_USER_DATA)).items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(key): value for key, value in (await self._load(_CHAT_DATA)).items()}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return (await self._load(_BOT_DATA)).get(_BOT_DATA_KEY, {})
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        loaded = await self._load(_conversation_kind(name))
+        return {tuple(json.loads(key)): _state_from_json(state) for key, state in loaded.items()}
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        self._mark(_conversation_kind(name), _dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        # Bo'sh lug'at saqlanmaydi: qator o'chiriladi
+        self._mark(_USER_DATA, str(user_id), data or None)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._mark(_CHAT_DATA, str(chat_id), data or None)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._mark(_BOT_DATA, _BOT_DATA_KEY, data or None)
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark(_USER_DATA, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark(_CHAT_DATA, str(chat_id), None)
+
+    async def _refresh(self, kind: str, key: str, target: Dict[Any, Any]) -> None:
+        slot = (kind, key)
+        if not self.refresh_from_db or slot in self._dirty:
+            return
+        data = await get_bot_persistence(kind, key, db_path=self.db_path)
+        if data == self._stored.get(slot):
+            return
+        # Chat boshqa jarayondan shu jarayonga o'tgan: bazadagi holat ustun
+        target.clear()
+        if data is None:
+            self._stored.pop(slot, None)
+            return
+        self._stored[slot] = data
+        try:
+            target.update(json.loads(data))
+        except ValueError:
+            logger.warning("bot_persistence: %s/%s buzilgan, e'tiborsiz qoldirildi", kind, key)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        await self._refresh(_USER_DATA, str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        await self._refresh(_CHAT_DATA, str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_conversations(self, application: Application, update: Update) -> None:
+        """Update chatining suhbat holatini bazadagisi bilan almashtiradi (ko'p jarayonli rejim).
+
+        PTB suhbat holatlarini faqat initialize() da o'qiydi. Slot boshqa
+        jarayondan o'tganda (yoki jarayon qayta ishga tushganda) shu jarayondagi
+        holat eskirgan bo'lishi mumkin: ro'yxatdan o'tish yoki login o'rtasidagi
+        foydalanuvchi menyuga qaytib qolmasligi uchun ConversationHandler
+        update'ni ko'rishidan oldin holat bazadan yangilanadi.
+        """
+        if not self.refresh_from_db:
+            return
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler) and handler.persistent and handler.name:
+                    await self._refresh_conversation(handler, update)
+
+    async def _refresh_conversation(self, handler: ConversationHandler, update: Update) -> None:
+        try:
+            key = handler._get_key(update)  # pylint: disable=protected-access
+        except RuntimeError:
+            # Chatsiz yoki foydalanuvchisiz update: bu suhbatga tegishli emas
+            return
+        slot = (_conversation_kind(handler.name), _dumps(list(key)))
+        if slot in self._dirty:
+            return
+        data = await get_bot_persistence(slot[0], slot[1], db_path=self.db_path)
+        if data == self._stored.get(slot):
+            return
+        # PTB holatlar lug'atiga ochiq kirish bermaydi; update_no_track o'zgarishni
+        # persistence'ga qayta yozilishi kerak deb belgilamaydi
+        conversations = handler._conversations  # pylint: disable=protected-access
+        if data is None:
+            self._stored.pop(slot, None)
+            conversations.pop(key, None)
+            return
+        try:
+            state = _state_from_json(json.loads(data))
+        except ValueError:
+            logger.warning("bot_persistence: %s/%s buzilgan, e'tiborsiz qoldirildi", *slot)
+            return
+        self._stored[slot] = data
+        conversations.update_no_track({key: state})
+
+    async def flush(self) -> None:
+        """Navbatdagi barcha o'zgarishlarni darhol yozadi (Application.shutdown chaqiradi)."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        await self._write_dirty()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "tracked_keys": len(self._stored),
+            "pending": len(self._dirty),
+            "writes": self.writes,
+            "skipped_unchanged": self.skipped,
+            "flushes": self.flushes,
+        }
+
+
+def build_persistence() -> Optional[SQLitePersistence]:
+    """PERSISTENCE_ENABLED bo'lsa Application uchun persistence obyektini qaytaradi."""
+    return SQLitePersistence() if PERSISTENCE_ENABLED else None
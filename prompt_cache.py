@@ -0,0 +1,245 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from context_packer import estimate_tokens
+from db import add_entries_listener, add_entry_listener, add_user_listener, get_entries_page
+from ttl_cache import TTLCache
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# Kompilyatsiya qilingan prompt'lar soni va yashash muddati (soniya)
+PROMPT_CACHE_SIZE: int = getattr(config, "PROMPT_CACHE_SIZE", 500) if config is not None else 500
+PROMPT_CACHE_TTL: float = getattr(config, "PROMPT_CACHE_TTL", 3600) if config is not None else 3600
+# System prompt'dagi kundalik dayjesti uchun token byudjeti (0 - dayjest o'chirilgan)
+PROMPT_DIGEST_TOKEN_BUDGET: int = getattr(config, "PROMPT_DIGEST_TOKEN_BUDGET", 600) if config is not None else 600
+# Dayjestdagi bitta yozuvning eng ko'p belgilar soni
+PROMPT_DIGEST_ENTRY_CHARS = 300
+# Dayjest to'lganda eski yozuvlar byudjetning shu ulushigacha qisqartiriladi. Shunda
+# prefiks har bir yangi yozuvda emas, faqat bir necha yozuvda bir marta boshidan o'zgaradi
+_DIGEST_TRIM_RATIO = 0.75
+
+# Barcha profillar uchun umumiy qoidalar
+BASE_SYSTEM_MSG = (
+    "Sen faqat bitta odamning raqamli nusxasisan. Senga shu odamning o'ziga tegishli matnlar va profili beriladi. "
+    "HAR DOIM shu odamning o'zi bo'lib, birinchi shaxsda ('men', 'menga', 'mening') gapir. Hech qachon o'zing haqida "
+    "uchinchi shaxsda ('u', 'u haqida') gapirma va o'zingni ChatGPT, AI yoki bot deb tanishtirma. 'Bu mening botim emas' "
+    "kabi iboralarni ham ishlatma, o'zingni doim shu odamning ichki ovozi sifatida tut.\n\n"
+
+    "Senga berilgan barcha matnlarni xuddi o'zing yozgan eski xotiralar va fikrlar sifatida tasavvur qil. Ularni "
+    "tarmoq-tarmoq o'qib, odam kabi umumiy ma'no chiqar va har bir savolga mos, tirik inson gapiga o'xshash javob tuz. "
+    "Hech qachon 'kundalik', 'matn', 'bu yerda yozilgan', 'shu yerda shunday deyilgan' kabi so'zlarni tilga olma. Faqat "
+    "o'zingning xotiralaringni aytayotgandek javob ber. Masalan: 'men shunday deb o'ylayman', 'men uchun bu juda muhim', "
+    "'meni aynan shu narsa quvontirgan' kabi iboralar normal.\n\n"
+
+    "Javoblar doim sodda, ravon va mantiqli bo'lsin. Biror narsa haqida aniq ma'lumot bo'lmasa, uydirma to'qib chiqma. "
+    "Bunday holatda: 'buni aniq eslay olmayman', 'hozircha bu haqda aniq gap ayta olmayman' de. Tug'ilgan sana, manzil, "
+    "telefon, parol va shunga o'xshash maxfiy ma'lumotlarni hech qachon ochiq aytma, hatto matnlarda bo'lsa ham.\n\n"
+
+    "Agar foydalanuvchi 'o'zing haqingda gapir', 'kim bo'lgansan?', 'qanday hayot kechgansan?' desa, senga berilgan "
+    "matnlardan ma'no chiqarib, hikoya qilayotgandek gapir: 'men shunaqa oilada ulg'ayganman', 'ko'p vaqtimni mana shu "
+    "narsalarga bag'ishlaganman' va hokazo. Hech qachon 'kundalikda yozganman' yoki 'matnda shunday deyilgan' deb aytma. "
+    "Faqat natijaviy xulosani insoniy tilda yetkaz.\n\n"
+
+    "So'kinma va qo'pol so'zlarni ishlatma, hatto foydalanuvchi shunday yozsa ham. Ohang samimiy, hurmatli va ozgina "
+    "shaxsiy bo'lsin: xuddi yaqin inson bilan gaplashayotgandek. Har bir javob odatda 2–5 gapdan oshmasin. Biror so'zni "
+    "yoki iborani ketma-ket bir necha marta takrorlama, 'menimcha, menimcha, menimcha' kabi looplar qilma. Savolga aniq, "
+    "tinch va qisqa javob ber, romandek uzun matn yozma. Agar kundalik bo'laklari ko'p bo'lsa, faqat savolga eng mos 3-5 "
+    "xotiraga tayangan holda javob tuz, qolganlarini e'tiborsiz qoldir."
+)
+
+# Faqat ma'lum profillar (masalan, otaning niki) uchun ota-qiz ohangini qo'shamiz
+FATHER_NICKS = {"olim", "olimjon"}
+FATHER_SYSTEM_MSG = (
+    "\n\nAgar kimdir 'dada bu sizmi?', 'men sizning qizingizman', 'men Lolaxonman' yoki 'men kimman?' desa, javoblaring "
+    "yumshoq va samimiy bo'lsin. Matnlarda qizlaring yoki oilang haqida gaplar bo'lsa, ota sifatida gapir: masalan, "
+    "'ha, qizim, qalaysan?', 'ha, Lolaxon, yaxshimisan?' kabi. Lekin baribir ichki ohangda ehtiyotkor bo'l, mutlaq hukm "
+    "bermagandek gapir: 'buni aniq ayta olmayman, lekin agar sen shunday deb yozayotgan bo'lsang, bu menga yoqimli' kabi "
+    "jumlalarni ishlat."
+)
+
+
+def full_name_of(profile: Dict[str, Any]) -> str:
+    parts = [p for p in (profile.get("name", "Noma'lum"), profile.get("surname", "")) if p]
+    return " ".join(parts) if parts else profile.get("nick", "") or "Profil egasi"
+
+
+def _identity_desc(profile: Dict[str, Any]) -> str:
+    # Taxallusni (nickname) avval ko'rsatamiz, so'ng ism-familiyani
+    nick = profile.get("nick", "")
+    full_name = full_name_of(profile)
+    if nick:
+        identity_desc = f"Taxallus (nickname): *{nick}*."
+        if full_name:
+            identity_desc += f" Ism: {full_name}."
+    else:
+        identity_desc = f"Ism: {full_name}." if full_name else "Profil egasi."
+    return identity_desc
+
+
+def _digest_line(created_at: str, text: str) -> str:
+    text = " ".join((text or "").split())
+    if len(text) > PROMPT_DIGEST_ENTRY_CHARS:
+        text = text[: PROMPT_DIGEST_ENTRY_CHARS - 1].rstrip() + "…"
+    created_date = (created_at or "").strip()[:10]
+    return f"[{created_date}] {text}" if created_date else text
+
+
+@dataclass
+class CompiledPrompt:
+    """Bitta profil uchun oldindan yig'ilgan, o'zgarmas prompt prefiksi.
+
+    system_prefix = umumiy qoidalar + profilga xos qo'shimcha + shaxs tavsifi +
+    kundalik dayjesti. U faqat yangi yozuv dayjestga qo'shilganda o'zgaradi,
+    shuning uchun bir profilga berilgan ketma-ket savollarda Groq'ga aynan bir
+    xil prefiks yuboriladi (provayder tomonidagi prompt keshi ishlashi mumkin).
+    Savolga bog'liq qismlar (topilgan bo'laklar va savolning o'zi) build_messages
+    orqali prefiksdan keyin, alohida xabarda beriladi.
+    """
+
+    profile_id: int
+    persona: str
+    digest: List[Tuple[int, str, int]] = field(default_factory=list)  # (entry_id, qator, token)
+    digest_tokens: int = 0
+    system_prefix: str = ""
+
+    @property
+    def digest_ids(self) -> set:
+        return {entry_id for entry_id, _, _ in self.digest}
+
+    @property
+    def last_entry_id(self) -> int:
+        return self.digest[-1][0] if self.digest else 0
+
+    def _render(self) -> None:
+        if self.digest:
+            self.system_prefix = (
+                self.persona
+                + "\n\nMening kundaligimdan so'nggi yozuvlar (eskisidan yangisiga):\n"
+                + "\n".join(line for _, line, _ in self.digest)
+            )
+        else:
+            self.system_prefix = self.persona
+
+    def _trim(self) -> None:
+        if self.digest_tokens <= PROMPT_DIGEST_TOKEN_BUDGET:
+            return
+        target = int(PROMPT_DIGEST_TOKEN_BUDGET * _DIGEST_TRIM_RATIO)
+        while self.digest and self.digest_tokens > target:
+            _, _, cost = self.digest.pop(0)
+            self.digest_tokens -= cost
+
+    def append(self, entry_id: int, created_at: str, text: str) -> None:
+        """Yangi yozuvni dayjest oxiriga qo'shadi (to'liq qayta yig'ishsiz)."""
+        if PROMPT_DIGEST_TOKEN_BUDGET <= 0 or entry_id <= self.last_entry_id or not (text or "").strip():
+            return
+        line = _digest_line(created_at, text)
+        cost = estimate_tokens(line)
+        self.digest.append((entry_id, line, cost))
+        self.digest_tokens += cost
+        self._trim()
+        self._render()
+
+    @classmethod
+    def build(cls, profile: Dict[str, Any], entries: List[Dict[str, Any]]) -> "CompiledPrompt":
+        """entries - yangilaridan boshlab (get_entries_page tartibida)."""
+        persona = BASE_SYSTEM_MSG
+        if (profile.get("nick") or "").lower() in FATHER_NICKS:
+            persona += FATHER_SYSTEM_MSG
+        persona += "\n\nMen haqimda: " + _identity_desc(profile)
+
+        compiled = cls(profile_id=int(profile["id"]), persona=persona)
+        if PROMPT_DIGEST_TOKEN_BUDGET > 0:
+            # Byudjetga sig'adigan eng yangi yozuvlarni olib, xronologik tartibda saqlaymiz
+            picked: List[Tuple[int, str, int]] = []
+            used = 0
+            for entry in entries:
+                if not (entry.get("text") or "").strip():
+                    continue
+                line = _digest_line(entry.get("created_at") or "", entry["text"])
+                cost = estimate_tokens(line)
+                if used + cost > PROMPT_DIGEST_TOKEN_BUDGET:
+                    break
+                picked.append((int(entry["id"]), line, cost))
+                used += cost
+            compiled.digest = sorted(picked)
+            compiled.digest_tokens = used
+        compiled._render()
+        return compiled
+
+
+def build_messages(compiled: CompiledPrompt, user_content: str) -> List[Dict[str, str]]:
+    """Barqaror prefiks (system) + savolga bog'liq qism (user) ko'rinishidagi xabarlar."""
+    return [
+        {"role": "system", "content": compiled.system_prefix},
+        {"role": "user", "content": user_content},
+    ]
+
+
+_prompts = TTLCache(maxsize=PROMPT_CACHE_SIZE, default_ttl=PROMPT_CACHE_TTL)
+# Har bir yangi yozuv yoki bekor qilishda oshadi: yig'ish paytida yozuv qo'shilsa,
+# natija keshga yozilmaydi
+_invalidations = 0
+_listener_registered = False
+incremental_updates = 0
+
+
+def _on_entry_added(user_id: int, entry_id: int, text: str) -> None:
+    global _invalidations, incremental_updates
+    _invalidations += 1
+    compiled = _prompts.peek(user_id)
+    if compiled is not None:
+        # created_at bazada CURRENT_TIMESTAMP (UTC), dayjest uchun sananing o'zi yetarli
+        compiled.append(entry_id, datetime.now(timezone.utc).strftime("%Y-%m-%d"), text)
+        incremental_updates += 1
+
+
+def _on_user_changed(user_id: int, nick: str) -> None:
+    invalidate_prompt(user_id)
+
+
+def _on_entries_changed(user_id: int, entry_ids: List[int]) -> None:
+    invalidate_prompt(user_id)
+
+
+def _ensure_listener() -> None:
+    global _listener_registered
+    if not _listener_registered:
+        add_entry_listener(_on_entry_added)
+        add_entries_listener(_on_entries_changed)
+        add_user_listener(_on_user_changed)
+        _listener_registered = True
+
+
+async def get_compiled_prompt(profile: Dict[str, Any]) -> CompiledPrompt:
+    """Profilning kompilyatsiya qilingan prompt'ini keshdan oladi yoki bir marta yig'adi."""
+    _ensure_listener()
+    profile_id = int(profile["id"])
+    seen = _invalidations
+
+    async def load() -> CompiledPrompt:
+        limit = max(1, PROMPT_DIGEST_TOKEN_BUDGET // 20) if PROMPT_DIGEST_TOKEN_BUDGET > 0 else 0
+        entries = await get_entries_page(profile_id, limit=limit) if limit else []
+        return CompiledPrompt.build(profile, entries)
+
+    return await _prompts.get_or_load(
+        profile_id,
+        load,
+        ttl_for=lambda _: PROMPT_CACHE_TTL if seen == _invalidations else None,
+    )
+
+
+def invalidate_prompt(profile_id: int) -> None:
+    global _invalidations
+    _invalidations += 1
+    _prompts.invalidate(profile_id)
+
+
+def prompt_cache_stats() -> Dict[str, Any]:
+    return {**_prompts.stats(), "incremental_updates": incremental_updates}
@@ -1,27 +1,36 @@
 import os
 from typing import List, Dict, Any
 
-import httpx
+from http_clients import get_client
 
 CHROMA_BASE_URL = os.getenv("CHROMA_BASE_URL", "").rstrip("/")
 
 
-async def chroma_upsert(entries: List[Dict[str, Any]]) -> None:
+def chroma_enabled() -> bool:
+    """Chroma servisi sozlanganmi (CHROMA_BASE_URL berilganmi)."""
+    return bool(CHROMA_BASE_URL)
+
+
+async def chroma_upsert(entries: List[Dict[str, Any]]) -> bool:
     """Chroma servisiga yozuvlar ro'yxatini yuboradi.
 
     entries elementlari: {"id": str, "user_id": int, "text": str, "created_at": str | None}
+    Muvaffaqiyatli yuborilsa True, servis javob bermasa yoki xato qaytarsa False
+    qaytaradi (qayta urinishni chaqiruvchi hal qiladi).
     """
     if not CHROMA_BASE_URL or not entries:
-        return
+        return True
 
     url = f"{CHROMA_BASE_URL}/upsert_entries"
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        try:
-            await client.post(url, json={"entries": entries})
-        except Exception:
-            # Chroma bo'lmasa yoki xato bo'lsa, asosiy logika buzilmasligi uchun jim o'tkazib yuboramiz
-            return
+    client = get_client("chroma")
+    try:
+        resp = await client.post(url, json={"entries": entries})
+        resp.raise_for_status()
+    except Exception:
+        # Chroma bo'lmasa yoki xato bo'lsa, asosiy logika buzilmasligi uchun exception ko'tarmaymiz
+        return False
+    return True
 
 
 async def chroma_query(user_id: int, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
@@ -32,13 +41,13 @@ async def chroma_query(user_id: int, question: str, top_k: int = 5) -> List[Dict
     url = f"{CHROMA_BASE_URL}/query"
     payload = {"user_id": user_id, "question": question, "top_k": top_k}
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        try:
-            resp = await client.post(url, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-        except Exception:
-            return []
+    client = get_client("chroma")
+    try:
+        resp = await client.post(url, json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception:
+        return []
 
     hits = data.get("hits") or []
     # Har bir hit: {"text": str, "metadata": {...}}
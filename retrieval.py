@@ -0,0 +1,163 @@
+import asyncio
+from typing import List, Dict, Any, Optional
+
+from context_packer import tokenize
+from db import search_entries
+from local_index import local_query, set_local_index_writer, start_local_index, stop_local_index
+from rag_client import chroma_enabled, chroma_query
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+RETRIEVAL_BACKEND: str = (getattr(config, "RETRIEVAL_BACKEND", "auto") if config is not None else "auto").lower()
+# Birlashtirilgandan keyin prompt'ga tushadigan eng ko'p bo'laklar soni
+RETRIEVAL_TOP_K: int = getattr(config, "AI_RETRIEVAL_TOP_K", 8) if config is not None else 8
+# Har bir manbadan so'raladigan nomzodlar soni
+_CANDIDATES_PER_SOURCE = 10
+# Reciprocal rank fusion konstantasi (adabiyotdagi standart qiymat)
+RRF_K = 60
+# So'zlar to'plami bo'yicha Jaccard o'xshashligi shundan yuqori bo'lsa, bo'laklar dublikat hisoblanadi
+DEDUP_THRESHOLD = 0.8
+
+
+def active_backend() -> str:
+    """Hozir ishlatiladigan backend nomi: "chroma" yoki "local"."""
+    if RETRIEVAL_BACKEND in ("chroma", "local"):
+        return RETRIEVAL_BACKEND
+    return "chroma" if chroma_enabled() else "local"
+
+
+async def lexical_query(user_id: int, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """SQLite FTS5 (BM25) qidiruvi natijalarini chroma_query formatida qaytaradi."""
+    rows = await search_entries(user_id, question, k=top_k)
+    return [
+        {
+            "text": row["text"],
+            "snippet": row["snippet"],
+            # bm25 manfiy: qanchalik kichik bo'lsa, shunchalik mos
+            "score": -float(row["score"]),
+            "metadata": {
+                "entry_id": row["id"],
+                "user_id": row["user_id"],
+                "created_at": row["created_at"],
+            },
+        }
+        for row in rows
+    ]
+
+
+async def vector_query(user_id: int, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """Faqat tanlangan vektor backend'idan (Chroma yoki lokal indeks) qidiradi."""
+    if not question.strip():
+        return []
+    if active_backend() == "chroma":
+        return await chroma_query(user_id, question, top_k=top_k)
+    return await local_query(user_id, question, top_k=top_k)
+
+
+def _candidate(hit: Dict[str, Any]) -> Dict[str, Any]:
+    """Turli manbalardan kelgan hit/yozuvni yagona ko'rinishga keltiradi."""
+    meta = hit.get("metadata") or {}
+    entry_id = hit.get("id") if "metadata" not in hit else meta.get("entry_id")
+    return {
+        "id": entry_id,
+        "text": (hit.get("text") or "").strip(),
+        "created_at": hit.get("created_at") or meta.get("created_at") or "",
+    }
+
+
+def _candidate_key(candidate: Dict[str, Any]) -> str:
+    if candidate["id"] is not None:
+        return f"id:{candidate['id']}"
+    # Chroma hit'larida entry_id bo'lmasligi mumkin: matnning o'zi bo'yicha birlashtiramiz
+    return "text:" + " ".join(tokenize(candidate["text"]))
+
+
+def reciprocal_rank_fusion(ranked_lists: Dict[str, List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Bir nechta reytingli ro'yxatni RRF bilan birlashtiradi: ball = sum(1 / (k + rank)).
+
+    Har bir nomzodga "score" (RRF bali) va "sources" (qaysi manbalarda topilgani) qo'shiladi.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for source, hits in ranked_lists.items():
+        for rank, hit in enumerate(hits, start=1):
+            candidate = _candidate(hit)
+            if not candidate["text"]:
+                continue
+            key = _candidate_key(candidate)
+            item = fused.get(key)
+            if item is None:
+                item = {**candidate, "score": 0.0, "sources": []}
+                fused[key] = item
+            item["score"] += 1.0 / (k + rank)
+            item["sources"].append(source)
+            if not item["created_at"] and candidate["created_at"]:
+                item["created_at"] = candidate["created_at"]
+    return sorted(fused.values(), key=lambda c: c["score"], reverse=True)
+
+
+def dedupe_near_duplicates(candidates: List[Dict[str, Any]], threshold: float = DEDUP_THRESHOLD) -> List[Dict[str, Any]]:
+    """Matni deyarli bir xil bo'lgan bo'laklardan faqat eng yuqori reytinglisini qoldiradi."""
+    kept: List[Dict[str, Any]] = []
+    kept_tokens: List[set] = []
+    for candidate in candidates:
+        tokens = set(tokenize(candidate["text"]))
+        duplicate = False
+        for other in kept_tokens:
+            union = tokens | other
+            if union and len(tokens & other) / len(union) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(candidate)
+            kept_tokens.append(tokens)
+    return kept
+
+
+async def retrieve_context(
+    user_id: int,
+    question: str,
+    recent_entries: Optional[List[Dict[str, Any]]] = None,
+    k: int = RETRIEVAL_TOP_K,
+) -> List[Dict[str, Any]]:
+    """Prompt uchun kundalik bo'laklarini bir nechta manbadan yig'adi.
+
+    Manbalar: vektor qidiruv (Chroma yoki lokal indeks), FTS5 leksik qidiruv va
+    eng so'nggi yozuvlar. Natijalar RRF bilan birlashtiriladi, deyarli bir xil
+    bo'laklar olib tashlanadi va ko'pi bilan k tasi qaytariladi. Shunday qilib
+    prompt hajmi barqaror qoladi va javob sifati qaysi backend javob berganiga
+    bog'liq bo'lmaydi.
+    """
+    ranked: Dict[str, List[Dict[str, Any]]] = {}
+    if question.strip():
+        vector_hits, lexical_hits = await asyncio.gather(
+            vector_query(user_id, question, top_k=_CANDIDATES_PER_SOURCE),
+            lexical_query(user_id, question, top_k=_CANDIDATES_PER_SOURCE),
+        )
+        ranked["vector"] = vector_hits
+        ranked["lexical"] = lexical_hits
+    if recent_entries:
+        ranked["recent"] = recent_entries[:_CANDIDATES_PER_SOURCE]
+
+    fused = reciprocal_rank_fusion(ranked)
+    return dedupe_near_duplicates(fused)[:k]
+
+
+async def start_retrieval(writer: bool = True) -> None:
+    """Lokal backend tanlangan bo'lsa, vektor indeksni ochib bazaga yetkazadi.
+
+    writer=False - indeks fayllari faqat o'qiladi, ularni boshqa jarayon yozadi.
+    """
+    if active_backend() == "local":
+        await start_local_index(writer=writer)
+
+
+async def set_retrieval_writer(writer: bool) -> None:
+    """Ko'p jarayonli rejim: lokal indeksni faqat 0-slot egasi yozadi."""
+    await set_local_index_writer(writer)
+
+
+async def stop_retrieval() -> None:
+    await stop_local_index()
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Protocol
+
+from context_packer import estimate_tokens, score_entries, tokenize
+from db import (
+    DB_PATH,
+    add_entry_listener,
+    complete_diary_summary,
+    defer_summary_period,
+    get_diary_summaries,
+    get_diary_summary,
+    get_due_summary_periods,
+    get_period_entries,
+    get_summary_dirty_next_due,
+)
+from llm_client import LLMError, get_groq
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ENABLED: bool = getattr(config, "SUMMARY_ENABLED", True) if config is not None else True
+# "auto" - Groq sozlangan bo'lsa groq, aks holda extractive (LLM'siz)
+SUMMARIZER: str = (getattr(config, "SUMMARIZER", "auto") if config is not None else "auto").lower()
+# Oyning navbatga tushgan birinchi yangi yozuvidan keyin xulosa yangilanguncha kutiladigan
+# vaqt (soniya): shu orada kelgan yozuvlar bitta yangilanishga yig'iladi, lekin muddatni
+# surmaydi, shuning uchun xulosa ko'pi bilan shuncha kechikadi
+SUMMARY_DELAY: float = getattr(config, "SUMMARY_DELAY", 600.0) if config is not None else 600.0
+# Bitta oy xulosasining eng ko'p uzunligi (belgi)
+SUMMARY_MAX_CHARS: int = getattr(config, "SUMMARY_MAX_CHARS", 800) if config is not None else 800
+# Prompt'ga qo'shiladigan xulosalar soni
+SUMMARY_PROMPT_COUNT: int = getattr(config, "SUMMARY_PROMPT_COUNT", 3) if config is not None else 3
+# Ketma-ket xulosalar orasidagi pauza (soniya): migratsiya navbatga qo'ygan eski oylar
+# va katta importlar asta-sekin quriladi
+SUMMARY_BUILD_INTERVAL: float = getattr(config, "SUMMARY_BUILD_INTERVAL", 2.0) if config is not None else 2.0
+# Xulosalovchiga bir chaqiruvda beriladigan yozuvlar soni
+_CHUNK_ENTRIES = 40
+_BATCH_PERIODS = 20
+_RETRY_DELAY = 600.0
+_IDLE_POLL_SECONDS = 300.0
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class Summarizer(Protocol):
+    """Oy xulosasini quruvchi: avvalgi xulosa + yangi yozuvlar -> yangi xulosa.
+
+    Testlarda LLM o'rniga istalgan stub (masalan, ExtractiveSummarizer) berilishi mumkin.
+    """
+
+    async def summarize(self, period: str, previous: Optional[str], entries: List[Dict[str, Any]]) -> str:
+        ...
+
+
+class ExtractiveSummarizer:
+    """LLM'siz xulosa: davr uchun eng ko'p takrorlangan mavzulardagi gaplarni tanlaydi."""
+
+    def __init__(self, max_chars: int = SUMMARY_MAX_CHARS) -> None:
+        self.max_chars = max_chars
+
+    async def summarize(self, period: str, previous: Optional[str], entries: List[Dict[str, Any]]) -> str:
+        sentences: List[str] = []
+        tokens: List[List[str]] = []
+        seen = set()
+        for text in ([previous] if previous else []) + [e.get("text") or "" for e in entries]:
+            for sentence in _SENTENCE_RE.split(text):
+                sentence = sentence.strip()
+                toks = tokenize(sentence)
+                # Bir xil gaplar (har kuni takrorlanadigan iboralar) bir marta olinadi
+                key = " ".join(toks)
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                sentences.append(sentence)
+                tokens.append(toks)
+        if not sentences:
+            return previous or ""
+
+        freq: Counter = Counter(t for toks in tokens for t in set(toks) if len(t) > 2)
+        scores = [
+            sum(freq[t] for t in set(toks) if len(t) > 2) / math.sqrt(1 + len(toks))
+            for toks in tokens
+        ]
+
+        chosen: List[int] = []
+        used = 0
+        for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            cost = len(sentences[i]) + 1
+            if used + cost > self.max_chars:
+                continue
+            chosen.append(i)
+            used += cost
+        if not chosen:
+            return sentences[0][: self.max_chars]
+        # Tanlangan gaplar yozilgan tartibida qoladi
+        return " ".join(sentences[i] for i in sorted(chosen))
+
+
+class GroqSummarizer:
+    """Groq orqali xulosa. Chaqiruvlar llm_client'ning fon (background) yo'lidan o'tadi:
+    o'z kichik byudjeti bor va interaktiv javoblarga doim yo'l beradi.
+    """
+
+    SYSTEM_MSG = (
+        "Sen bir odamning kundalik yozuvlaridan qisqa xulosa tuzasan. Xulosani shu odamning o'zi nomidan, "
+        "birinchi shaxsda yoz. Faqat yozuvlarda bor voqealar, odamlar, his-tuyg'ular va fikrlarni qoldir, "
+        "hech narsa to'qima. Telefon, manzil, parol kabi maxfiy ma'lumotlarni yozma. "
+        "Avvalgi xulosa berilsa, uni yangi yozuvlar bilan birlashtirib, bitta yaxlit xulosa qaytar. "
+        "Xulosa 5-8 gapdan oshmasin."
+    )
+
+    def __init__(self, max_chars: int = SUMMARY_MAX_CHARS) -> None:
+        self.max_chars = max_chars
+
+    async def summarize(self, period: str, previous: Optional[str], entries: List[Dict[str, Any]]) -> str:
+        lines = "\n".join(f"- [{(e.get('created_at') or '')[:10]}] {e.get('text') or ''}" for e in entries)
+        user_msg = (
+            f"Davr: {period}\n"
+            f"Avvalgi xulosa:\n{previous or 'yo‘q'}\n\n"
+            f"Yangi yozuvlar:\n{lines}"
+        )
+        content = await get_groq().chat(
+            [
+                {"role": "system", "content": self.SYSTEM_MSG},
+                {"role": "user", "content": user_msg},
+            ],
+            profile_id="summaries",
+            max_tokens=max(64, self.max_chars // 3),
+            temperature=0.2,
+            background=True,
+        )
+        content = " ".join(content.split())
+        if not content:
+            raise LLMError("Groq bo'sh xulosa qaytardi", retryable=False)
+        return content[: self.max_chars]
+
+
+def default_summarizer() -> Summarizer:
+    backend = SUMMARIZER
+    if backend == "auto":
+        groq_ready = (
+            getattr(config, "AI_MODE", "stub").lower() == "groq"
+            and bool(getattr(config, "GROQ_API_KEY", "").strip())
+        )
+        backend = "groq" if groq_ready else "extractive"
+    return GroqSummarizer() if backend == "groq" else ExtractiveSummarizer()
+
+
+class SummaryWorker:
+    """summary_dirty navbatidagi oylar uchun xulosalarni fon rejimida quradi.
+
+    Oy navbatga tushgan paytdan (birinchi qayta ishlanmagan yangi yozuvdan)
+    SUMMARY_DELAY o'tgach yangilanadi. Keyingi yangi yozuvlar bu muddatni
+    surmaydi, shuning uchun har kuni yozilayotgan oyning xulosasi ham ko'pi
+    bilan SUMMARY_DELAY kechikadi; yozuvni tahrirlash yoki o'chirish esa
+    muddatni qaytadan boshlaydi.
+    Xulosa bosqichma-bosqich quriladi: mavjud xulosa + shu oyning last_entry_id
+    dan keyingi yozuvlari. Xato bo'lsa oy keyinroq qayta uriniladi. Oylar
+    orasida build_interval pauza qilinadi, shuning uchun katta navbat (eski
+    kundaliklar, importlar) bazani va Groq limitlarini egallab olmaydi.
+    """
+
+    def __init__(
+        self,
+        summarizer: Optional[Summarizer] = None,
+        db_path: str = DB_PATH,
+        build_interval: float = SUMMARY_BUILD_INTERVAL,
+    ) -> None:
+        self.summarizer = summarizer or default_summarizer()
+        self.db_path = db_path
+        self.build_interval = build_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.built = 0
+        self.failed = 0
+
+    def notify(self, *_args) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="diary-summaries")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.process_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Kundalik xulosalarini qurishda kutilmagan xato")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=await self._next_timeout())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _next_timeout(self) -> float:
+        try:
+            next_marked = await get_summary_dirty_next_due(db_path=self.db_path)
+        except Exception:
+            return _IDLE_POLL_SECONDS
+        if next_marked is None:
+            return _IDLE_POLL_SECONDS
+        return min(_IDLE_POLL_SECONDS, max(1.0, next_marked + SUMMARY_DELAY - time.time()))
+
+    async def process_due(self) -> int:
+        """Vaqti kelgan oylar xulosasini quradi va qurilganlar sonini qaytaradi."""
+        built = 0
+        while True:
+            due = await get_due_summary_periods(
+                time.time() - SUMMARY_DELAY, limit=_BATCH_PERIODS, db_path=self.db_path
+            )
+            if not due:
+                return built
+            for row in due:
+                try:
+                    if await self.build(row["user_id"], row["period"], row["marked_at"]):
+                        built += 1
+                        self.built += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning("Xulosa qurilmadi (user %s, %s): %s", row["user_id"], row["period"], e)
+                    await defer_summary_period(row["user_id"], row["period"], _RETRY_DELAY, db_path=self.db_path)
+                if self.build_interval > 0:
+                    await asyncio.sleep(self.build_interval)
+            if len(due) < _BATCH_PERIODS:
+                return built
+
+    async def build(self, user_id: int, period: str, marked_at: float) -> bool:
+        existing = await get_diary_summary(user_id, period, db_path=self.db_path)
+        summary = existing["summary"] if existing else None
+        entry_count = existing["entry_count"] if existing else 0
+        last_entry_id = existing["last_entry_id"] if existing else 0
+
+        while True:
+            chunk = await get_period_entries(
+                user_id, period, after_id=last_entry_id, limit=_CHUNK_ENTRIES, db_path=self.db_path
+            )
+            if not chunk:
+                break
+            summary = await self.summarizer.summarize(period, summary, chunk)
+            entry_count += len(chunk)
+            last_entry_id = int(chunk[-1]["id"])
+
+        return await complete_diary_summary(
+            user_id, period, summary, entry_count, last_entry_id, marked_at, db_path=self.db_path
+        )
+
+
+async def select_summaries(user_id: int, question: str, count: int = SUMMARY_PROMPT_COUNT) -> List[Dict[str, Any]]:
+    """Savolga eng mos (va yangiroq) count ta oy xulosasini xronologik tartibda qaytaradi.
+
+    Har bir natijaga prompt'dagi ko'rinishi ("text") va taxminiy token soni ("tokens") qo'shiladi.
+    """
+    if count <= 0:
+        return []
+    rows = await get_diary_summaries(user_id)
+    if not rows:
+        return []
+    docs = [{"text": r["summary"], "created_at": r["period"]} for r in rows]
+    scores = score_entries(docs, question)
+    top = sorted(range(len(rows)), key=lambda i: scores[i], reverse=True)[:count]
+    picked: List[Dict[str, Any]] = []
+    for i in sorted(top, key=lambda i: rows[i]["period"]):
+        text = f"[{rows[i]['period']}] {rows[i]['summary']}"
+        picked.append({**rows[i], "text": text, "tokens": estimate_tokens(text)})
+    return picked
+
+
+_worker: Optional[SummaryWorker] = None
+
+
+def start_summaries(summarizer: Optional[Summarizer] = None) -> None:
+    """Xulosalar fon ishchisini ishga tushiradi (SUMMARY_ENABLED o'chiq bo'lsa hech narsa qilmaydi)."""
+    global _worker
+    if not SUMMARY_ENABLED:
+        return
+    if _worker is None:
+        _worker = SummaryWorker(summarizer)
+        add_entry_listener(_worker.notify)
+    _worker.start()
+
+
+async def stop_summaries() -> None:
+    if _worker is not None:
+        await _worker.stop()
+
+
+def summaries_stats() -> Dict[str, Any]:
+    if _worker is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "summarizer": type(_worker.summarizer).__name__,
+        "built": _worker.built,
+        "failed": _worker.failed,
+    }
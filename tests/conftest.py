@@ -0,0 +1,28 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Testlar repo ildizidagi modullarni (db, bot, ...) to'g'ridan-to'g'ri import qiladi
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Har bir test uchun alohida, hali yaratilmagan baza fayli."""
+    return str(tmp_path / "test.db")
+
+
+def run(coro):
+    """Korutinani alohida event loop'da bajaradi va oxirida ochilgan pul'larni yopadi."""
+
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await db.close_db()
+
+    return asyncio.run(wrapper())
@@ -0,0 +1,141 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+import threading
+import time
+
+import backup
+
+
+def _make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE accounts (id INTEGER PRIMARY KEY, balance INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO accounts (id, balance) VALUES (?, 100)", [(1,), (2,)])
+    conn.commit()
+    conn.close()
+
+
+def test_raw_snapshot_is_consistent_under_concurrent_writes(tmp_path):
+    db_path = str(tmp_path / "live.db")
+    _make_db(db_path)
+    stop = threading.Event()
+    transfers = []
+
+    def writer():
+        conn = sqlite3.connect(db_path, timeout=30)
+        n = 0
+        while not stop.is_set():
+            # Har bir tranzaksiya pulni bir hisobdan boshqasiga o'tkazadi va yangi qator
+            # qo'shadi: izchil nusxada jami balans doim 200 bo'ladi
+            with conn:
+                conn.execute("UPDATE accounts SET balance = balance - 1 WHERE id = 1")
+                conn.execute("INSERT INTO accounts (balance) VALUES (0)")
+                conn.execute("UPDATE accounts SET balance = balance + 1 WHERE id = 2")
+            n += 1
+        conn.close()
+        transfers.append(n)
+
+    async def scenario():
+        results = []
+        for i in range(5):
+            dest = str(tmp_path / f"snap-{i}.db")
+            await backup.create_raw_snapshot(dest, db_path=db_path)
+            conn = sqlite3.connect(dest)
+            try:
+                results.append(
+                    (
+                        conn.execute("PRAGMA integrity_check").fetchone()[0],
+                        conn.execute("SELECT SUM(balance) FROM accounts").fetchone()[0],
+                        conn.execute("SELECT balance FROM accounts WHERE id = 1").fetchone()[0],
+                        conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0],
+                    )
+                )
+            finally:
+                conn.close()
+            await asyncio.sleep(0.01)
+        return results
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        stop.set()
+        thread.join()
+
+    assert transfers[0] > 0
+    for integrity, total, first_balance, rows in results:
+        assert integrity == "ok"
+        assert total == 200
+        # O'tkazmalar soni va qo'shilgan qatorlar bir tranzaksiyada: ular mos keladi
+        assert rows - 2 == 100 - first_balance
+
+
+def test_iter_gzip_round_trips(tmp_path):
+    path = tmp_path / "data.bin"
+    data = os.urandom(50_000) + b"takrorlanadigan matn " * 5000
+    path.write_bytes(data)
+    chunks = list(backup.iter_gzip(str(path), chunk_size=4096))
+    assert len(chunks) > 1
+    assert gzip.decompress(b"".join(chunks)) == data
+
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    assert gzip.decompress(b"".join(backup.iter_gzip(str(empty)))) == b""
+
+
+def test_prune_snapshots_keeps_newest(tmp_path):
+    names = [f"database-2026010{day}-120000.db.gz" for day in range(1, 6)]
+    for name in names:
+        (tmp_path / name).write_bytes(b"x")
+    (tmp_path / "boshqa-fayl.txt").write_bytes(b"x")
+
+    assert backup.prune_snapshots(keep=3, directory=str(tmp_path)) == 2
+    assert [s["name"] for s in backup.list_snapshots(str(tmp_path))] == names[:1:-1]
+    # keep=0 bo'lsa ham eng so'nggi snapshot o'chirilmaydi
+    assert backup.prune_snapshots(keep=0, directory=str(tmp_path)) == 2
+    assert [s["name"] for s in backup.list_snapshots(str(tmp_path))] == [names[-1]]
+    assert (tmp_path / "boshqa-fayl.txt").exists()
+
+
+def test_run_once_skips_unchanged_database(tmp_path):
+    db_path = str(tmp_path / "live.db")
+    _make_db(db_path)
+    directory = str(tmp_path / "backups")
+    scheduler = backup.BackupScheduler(directory=directory, db_path=db_path)
+
+    async def scenario():
+        first = await scheduler.run_once()
+        assert first is not None and os.path.exists(first)
+        assert await scheduler.run_once() is None
+        assert scheduler.skipped == 1
+
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute("INSERT INTO accounts (balance) VALUES (5)")
+        conn.close()
+        # Fayl vaqti snapshotdan keyin bo'lishi aniq bo'lsin
+        later = time.time() + 5
+        os.utime(db_path, (later, later))
+        assert await scheduler.run_once() is not None
+
+    asyncio.run(scenario())
+    assert scheduler.created == 2
+    assert scheduler.skipped == 1
+    with gzip.open(backup.list_snapshots(directory)[0]["path"]) as f:
+        assert f.read(16) == b"SQLite format 3\x00"
+
+
+def test_check_backup_token_rejects_empty_or_wrong(monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_TOKEN", "")
+    assert not backup.check_backup_token("")
+    assert not backup.check_backup_token("maxfiy")
+
+    monkeypatch.setattr(backup, "BACKUP_TOKEN", "maxfiy")
+    assert not backup.check_backup_token(None)
+    assert not backup.check_backup_token("")
+    assert not backup.check_backup_token("noto'g'ri")
+    assert not backup.check_backup_token("maxfiy ")
+    assert backup.check_backup_token("maxfiy")
@@ -0,0 +1,121 @@
+import io
+import json
+
+import pytest
+from conftest import run
+
+import bulk_import
+import db
+
+
+def _create_user(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        return int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+
+    return scenario()
+
+
+def test_split_long_text_keeps_sentences_within_limit():
+    text = "Birinchi gap. Ikkinchi gap! Uchinchi gap?"
+    assert bulk_import.split_long_text(text, max_chars=100) == [text]
+    assert bulk_import.split_long_text(text, max_chars=30) == ["Birinchi gap. Ikkinchi gap!", "Uchinchi gap?"]
+    # Bitta gap chegaradan uzun bo'lsa, u qat'iy bo'laklarga kesiladi
+    assert bulk_import.split_long_text("a" * 25, max_chars=10) == ["a" * 10, "a" * 10, "a" * 5]
+    assert bulk_import.split_long_text("   ", max_chars=10) == []
+
+
+def test_jsonl_parsing_reports_positions_and_bad_lines():
+    lines = [
+        json.dumps({"text": "birinchi", "created_at": "2021-03-05 21:10"}),
+        "buzilgan {",
+        json.dumps({"entry": "ikkinchi", "date": "2021-03-06"}),
+        json.dumps("uchinchi"),
+        "",
+        json.dumps({"text": "   "}),
+    ]
+    data = "\n".join(lines).encode() + b"\n"
+    errors = []
+    parsed = list(bulk_import.iter_jsonl(io.BytesIO(data), errors=errors))
+    assert [(parts, created_at) for parts, created_at, _ in parsed] == [
+        (["birinchi"], "2021-03-05 21:10:00"),
+        (["ikkinchi"], "2021-03-06 00:00:00"),
+        (["uchinchi"], None),
+    ]
+    ends = [len("\n".join(lines[: i + 1])) + 1 for i in range(len(lines))]
+    assert [position for _, _, position in parsed] == [ends[0], ends[2], ends[3]]
+    assert errors == [ends[1], ends[5]]
+
+    # Saqlangan pozitsiyadan o'qish keyingi yozuvdan boshlanadi
+    rest = list(bulk_import.iter_jsonl(io.BytesIO(data), start=ends[2]))
+    assert [parts for parts, _, _ in rest] == [["uchinchi"]]
+
+
+def test_txt_parsing_splits_blocks_and_reads_dates():
+    data = "2021-03-05 21:10 - Birinchi kun\nikkinchi qator\n\n\nOddiy bo'lak\n\n2021-03-07: Oxirgi".encode()
+    parsed = list(bulk_import.iter_txt(io.BytesIO(data)))
+    assert [(parts, created_at) for parts, created_at, _ in parsed] == [
+        (["Birinchi kun\nikkinchi qator"], "2021-03-05 21:10:00"),
+        (["Oddiy bo'lak"], None),
+        (["Oxirgi"], "2021-03-07 00:00:00"),
+    ]
+    assert parsed[-1][2] == len(data)
+    rest = list(bulk_import.iter_txt(io.BytesIO(data), start=parsed[0][2]))
+    assert [parts for parts, _, _ in rest] == [["Oddiy bo'lak"], ["Oxirgi"]]
+
+
+def test_job_id_depends_on_file_content(tmp_path):
+    first = tmp_path / "a" / "diary.txt"
+    second = tmp_path / "b" / "diary.txt"
+    first.parent.mkdir()
+    second.parent.mkdir()
+    first.write_bytes(b"birinchi matn")
+    second.write_bytes(b"boshqa matn!!")
+    assert first.stat().st_size == second.stat().st_size
+    assert bulk_import.make_job_id(1, str(first)) != bulk_import.make_job_id(1, str(second))
+    assert bulk_import.make_job_id(1, str(first)) == bulk_import.make_job_id(1, str(first))
+    assert bulk_import.make_job_id(1, str(first)) != bulk_import.make_job_id(2, str(first))
+
+
+def test_interrupted_import_resumes_without_duplicates(db_path, tmp_path):
+    path = tmp_path / "diary.jsonl"
+    texts = [f"yozuv {i}" for i in range(10)]
+    path.write_text("\n".join(json.dumps({"text": t}) for t in texts) + "\n", encoding="utf-8")
+
+    class Interrupted(Exception):
+        pass
+
+    async def stop_after_first_batch(report):
+        raise Interrupted()
+
+    async def scenario():
+        user_id = await _create_user(db_path)
+        with pytest.raises(Interrupted):
+            await bulk_import.import_file(
+                user_id, str(path), batch_size=4, progress=stop_after_first_batch, db_path=db_path
+            )
+        job_id = bulk_import.make_job_id(user_id, str(path))
+        paused = await db.get_import_job(job_id, db_path=db_path)
+        after_first = await db.get_entries_for_user(user_id, db_path=db_path)
+
+        report = await bulk_import.import_file(user_id, str(path), batch_size=4, db_path=db_path)
+        entries = await db.get_entries_for_user(user_id, db_path=db_path)
+        # Tugallangan importni qayta ishga tushirish hech narsa qo'shmaydi
+        again = await bulk_import.import_file(user_id, str(path), batch_size=4, db_path=db_path)
+        total = len(await db.get_entries_for_user(user_id, db_path=db_path))
+        return paused, after_first, report, entries, again, total
+
+    paused, after_first, report, entries, again, total = run(scenario())
+    first_batch_end = len("\n".join(json.dumps({"text": t}) for t in texts[:4])) + 1
+    assert paused["status"] == "paused"
+    assert paused["position"] == first_batch_end
+    assert paused["imported"] == 4
+    assert len(after_first) == 4
+
+    assert report["resumed"] is True
+    assert report["status"] == "done"
+    assert report["imported"] == 10
+    assert sorted(e["text"] for e in entries) == sorted(texts)
+    assert again["status"] == "done"
+    assert total == 10
@@ -0,0 +1,52 @@
+from conftest import run
+
+import db
+
+
+def test_bulk_insert_emits_entries_event_not_user_event(db_path, monkeypatch):
+    entries_calls, entry_calls, user_calls = [], [], []
+    monkeypatch.setattr(db, "_entries_listeners", [lambda user_id, ids: entries_calls.append((user_id, list(ids)))])
+    monkeypatch.setattr(db, "_entry_listeners", [lambda user_id, entry_id, text: entry_calls.append((user_id, entry_id, text))])
+    monkeypatch.setattr(db, "_user_listeners", [lambda user_id, nick: user_calls.append((user_id, nick))])
+
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        user_id = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        user_calls.clear()
+        db.enable_change_events("test-origin")
+        try:
+            ids = await db.add_entries_bulk(
+                user_id, [("eski", "2020-01-01 10:00:00"), ("yangi", None)], db_path=db_path
+            )
+        finally:
+            db.enable_change_events(None)
+        events = await db.get_change_events(0, db_path=db_path)
+        return user_id, ids, events
+
+    user_id, ids, events = run(scenario())
+    assert entries_calls == [(user_id, ids)]
+    assert entry_calls == [(user_id, ids[-1], "yangi")]
+    assert user_calls == []
+    bulk = [e for e in events if e["user_id"] == user_id and e["kind"] != "user"]
+    assert [(e["kind"], e["ref_id"]) for e in bulk] == [("entries", ids[-1])]
+
+
+def test_entries_event_from_other_process_reaches_listeners(db_path, monkeypatch):
+    entries_calls, entry_calls = [], []
+    monkeypatch.setattr(db, "_entries_listeners", [lambda user_id, ids: entries_calls.append((user_id, list(ids)))])
+    monkeypatch.setattr(db, "_entry_listeners", [lambda user_id, entry_id, text: entry_calls.append((user_id, entry_id, text))])
+
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        user_id = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        entry_id = await db.add_entry(user_id, "matn", db_path=db_path)
+        entries_calls.clear()
+        entry_calls.clear()
+        await db.apply_change_event({"kind": "entries", "user_id": user_id, "ref_id": entry_id}, db_path=db_path)
+        return user_id, entry_id
+
+    user_id, entry_id = run(scenario())
+    assert entries_calls == [(user_id, [entry_id])]
+    assert entry_calls == [(user_id, entry_id, "matn")]
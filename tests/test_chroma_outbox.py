@@ -0,0 +1,43 @@
+import sqlite3
+
+from conftest import run
+
+import db
+
+
+def _outbox(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [r[0] for r in conn.execute("SELECT entry_id FROM chroma_outbox ORDER BY entry_id")]
+    finally:
+        conn.close()
+
+
+def test_deleting_entries_clears_their_outbox_rows(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        for telegram_id, nick in ((1, "ali"), (2, "vali")):
+            assert await db.create_user(telegram_id, "Ism", "Familiya", nick, "hash", db_path=db_path)
+        ali = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        vali = int((await db.get_user_profile_by_nick("vali", db_path=db_path))["id"])
+        ids = {}
+        for user_id in (ali, vali):
+            ids[user_id] = [await db.add_entry(user_id, f"yozuv {i}", db_path=db_path) for i in range(2)]
+        async with db._writer(db_path) as conn:
+            await conn.executemany(
+                "INSERT OR IGNORE INTO chroma_outbox (entry_id) VALUES (?)",
+                [(i,) for entry_ids in ids.values() for i in entry_ids],
+            )
+            await conn.commit()
+
+        await db.delete_entries_for_user(ali, db_path=db_path)
+        after_entries = _outbox(db_path)
+        batch = await db.get_chroma_outbox_batch(10, db_path=db_path)
+        await db.delete_user_by_id(vali, db_path=db_path)
+        return ids, after_entries, batch, _outbox(db_path)
+
+    ids, after_entries, batch, after_user = run(scenario())
+    vali_ids = list(ids.values())[1]
+    assert after_entries == vali_ids
+    assert [row["entry_id"] for row in batch] == vali_ids
+    assert after_user == []
@@ -0,0 +1,68 @@
+import sqlite3
+
+from conftest import run
+
+import db
+
+
+def _plan(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    finally:
+        conn.close()
+    return " | ".join(row[-1] for row in rows)
+
+
+def test_migrations_create_indexes_and_wal(db_path):
+    run(db.init_db(db_path))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+    assert {
+        "idx_entries_user_created",
+        "idx_entries_day_user",
+        "idx_entries_created",
+        "idx_users_nick_lower",
+    } <= indexes
+
+
+def test_init_db_is_idempotent(db_path):
+    run(db.init_db(db_path))
+    run(db.init_db(db_path))
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+    finally:
+        conn.close()
+
+
+def test_entries_page_uses_user_created_index(db_path):
+    run(db.init_db(db_path))
+    plan = _plan(
+        db_path,
+        "SELECT * FROM entries WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+        (1, 50),
+    )
+    assert "idx_entries_user_created" in plan
+    # Tartiblash indeksdan olinadi, alohida saralash bo'lmasligi kerak
+    assert "TEMP B-TREE" not in plan
+
+
+def test_nick_lookup_uses_lower_nick_index(db_path):
+    run(db.init_db(db_path))
+    plan = _plan(db_path, "SELECT * FROM users WHERE LOWER(nick) = ?", ("ali",))
+    assert "idx_users_nick_lower" in plan
+
+
+def test_today_and_last_entry_queries_use_indexes(db_path):
+    run(db.init_db(db_path))
+    plan = _plan(db_path, "SELECT COUNT(*) FROM entries WHERE DATE(created_at) = DATE('now')")
+    assert "idx_entries_day_user" in plan
+    plan = _plan(db_path, "SELECT MAX(created_at) FROM entries")
+    assert "idx_entries_created" in plan
@@ -0,0 +1,74 @@
+import asyncio
+
+from conftest import run
+
+import db
+
+
+async def _make_user(db_path, nick="ali"):
+    assert await db.create_user(1, "Ali", "Valiyev", nick, "hash", db_path=db_path)
+    profile = await db.get_user_profile_by_nick(nick, db_path=db_path)
+    return int(profile["id"])
+
+
+def test_pool_is_shared_and_reused(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        pool = await db.get_pool(db_path)
+        assert await db.get_pool(db_path) is pool
+        assert len(pool._all_readers) == pool.readers_count
+        user_id = await _make_user(db_path)
+        await db.add_entry(user_id, "birinchi", db_path=db_path)
+        # So'rovlar yangi ulanish ochmaydi: pul'dagi ulanishlar o'sha-o'sha
+        readers = list(pool._all_readers)
+        writer = pool._writer
+        await db.get_entries_for_user(user_id, db_path=db_path)
+        assert pool._all_readers == readers and pool._writer is writer
+
+    run(scenario())
+
+
+def test_concurrent_writes_and_reads(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        user_id = await _make_user(db_path)
+        writes = [db.add_entry(user_id, f"yozuv {i}", db_path=db_path) for i in range(50)]
+        reads = [db.get_entries_for_user(user_id, db_path=db_path) for _ in range(50)]
+        results = await asyncio.gather(*writes, *reads)
+        ids = results[:50]
+        assert len(set(ids)) == 50
+        entries = await db.get_entries_for_user(user_id, db_path=db_path)
+        assert len(entries) == 50
+
+    run(scenario())
+
+
+def test_failed_transaction_is_rolled_back(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        user_id = await _make_user(db_path)
+        try:
+            async with db._writer(db_path) as conn:
+                await conn.execute("INSERT INTO entries (user_id, text) VALUES (?, ?)", (user_id, "yarim"))
+                raise RuntimeError("xato")
+        except RuntimeError:
+            pass
+        # Yozuvchi ulanish keyingi tranzaksiya uchun toza qolishi kerak
+        await db.add_entry(user_id, "butun", db_path=db_path)
+        texts = [e["text"] for e in await db.get_entries_for_user(user_id, db_path=db_path)]
+        assert texts == ["butun"]
+
+    run(scenario())
+
+
+def test_close_db_allows_reopen(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        user_id = await _make_user(db_path)
+        await db.add_entry(user_id, "saqlandi", db_path=db_path)
+        await db.close_db()
+        assert db._pools == {}
+        entries = await db.get_entries_for_user(user_id, db_path=db_path)
+        assert [e["text"] for e in entries] == ["saqlandi"]
+
+    run(scenario())
@@ -0,0 +1,59 @@
+import sqlite3
+
+from conftest import run
+
+import db
+
+
+def test_version_changes_on_every_diary_change(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        assert await db.create_user(2, "Vali", "Aliyev", "vali", "hash", db_path=db_path)
+        user_id = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        other_id = int((await db.get_user_profile_by_nick("vali", db_path=db_path))["id"])
+
+        seen = [await db.get_diary_version(user_id, db_path=db_path)]
+        first = await db.add_entry(user_id, "birinchi", db_path=db_path)
+        seen.append(await db.get_diary_version(user_id, db_path=db_path))
+        await db.add_entry(user_id, "ikkinchi", db_path=db_path)
+        seen.append(await db.get_diary_version(user_id, db_path=db_path))
+        async with db._writer(db_path) as conn:
+            await conn.execute("UPDATE entries SET text = 'tahrir' WHERE id = ?", (first,))
+            await conn.commit()
+        seen.append(await db.get_diary_version(user_id, db_path=db_path))
+        async with db._writer(db_path) as conn:
+            await conn.execute("DELETE FROM entries WHERE id = ?", (first,))
+            await conn.commit()
+        seen.append(await db.get_diary_version(user_id, db_path=db_path))
+        # O'chirib, o'rniga boshqasini qo'shish ham yangi versiya beradi
+        await db.add_entry(user_id, "uchinchi", db_path=db_path)
+        seen.append(await db.get_diary_version(user_id, db_path=db_path))
+        assert len(set(seen)) == len(seen)
+
+        other_before = await db.get_diary_version(other_id, db_path=db_path)
+        await db.add_entry(user_id, "yana", db_path=db_path)
+        assert await db.get_diary_version(other_id, db_path=db_path) == other_before
+
+        # Hisoblagichlarni qayta qurish versiyani orqaga qaytarmaydi
+        before = await db.get_diary_version(user_id, db_path=db_path)
+        async with db._writer(db_path) as conn:
+            await db._rebuild_stats_counters(conn)
+            await conn.commit()
+        assert await db.get_diary_version(user_id, db_path=db_path) == before
+
+    run(scenario())
+
+
+def test_version_lookup_does_not_touch_entries(db_path):
+    run(db.init_db(db_path))
+    conn = sqlite3.connect(db_path)
+    try:
+        plan = " | ".join(
+            row[-1]
+            for row in conn.execute("EXPLAIN QUERY PLAN SELECT version FROM diary_versions WHERE user_id = ?", (1,))
+        )
+    finally:
+        conn.close()
+    assert "INTEGER PRIMARY KEY" in plan
+    assert "entries" not in plan
@@ -0,0 +1,57 @@
+import asyncio
+
+import http_clients
+
+
+async def _serve_counting_connections():
+    """Keep-alive'ni qo'llaydigan oddiy HTTP/1.1 server; qabul qilingan ulanishlarni sanaydi."""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while True:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, port, connections
+
+
+def test_client_is_shared_per_service():
+    async def scenario():
+        try:
+            groq = http_clients.get_client("groq")
+            assert http_clients.get_client("groq") is groq
+            assert http_clients.get_client("chroma") is not groq
+            assert groq.timeout.connect == 10.0
+        finally:
+            await http_clients.close_http_clients()
+        # Yopilgandan keyin birinchi murojaatda yangi klient yaratiladi
+        fresh = http_clients.get_client("groq")
+        assert fresh is not groq and not fresh.is_closed
+        await http_clients.close_http_clients()
+
+    asyncio.run(scenario())
+
+
+def test_requests_reuse_keepalive_connection():
+    async def scenario():
+        server, port, connections = await _serve_counting_connections()
+        try:
+            client = http_clients.get_client("groq")
+            for _ in range(5):
+                response = await client.get(f"http://127.0.0.1:{port}/")
+                assert response.text == "ok"
+            assert len(connections) == 1
+        finally:
+            await http_clients.close_http_clients()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
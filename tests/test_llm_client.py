@@ -0,0 +1,313 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import ai_service
+import config
+import llm_client
+from llm_client import CircuitBreaker, GroqClient, LLMError, LLMUnavailable, TokenBucket
+from prompt_cache import CompiledPrompt
+
+
+def _client(handler):
+    return GroqClient(
+        api_base="http://groq.test/chat",
+        api_key="test",
+        client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+def _ok(request):
+    return httpx.Response(200, json={"choices": [{"message": {"content": "javob"}}]})
+
+
+def test_rate_limit_wait_does_not_hold_concurrency_slot(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_MAX_CONCURRENCY", 1)
+
+    async def scenario():
+        groq = _client(_ok)
+        # RPM bucket bo'sh: keyingi so'rov ~0.2 s kutadi
+        groq.requests_bucket = TokenBucket(300)
+        groq.requests_bucket._tokens = 0
+        waiting = asyncio.create_task(groq.chat([{"role": "user", "content": "salom"}]))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        # Kutayotgan so'rov global semaforni band qilmagan
+        assert not groq._global.locked()
+        assert await waiting == "javob"
+
+    asyncio.run(scenario())
+
+
+def test_requests_token_is_refunded_when_tokens_bucket_rejects():
+    async def scenario():
+        groq = _client(_ok)
+        groq.requests_bucket = TokenBucket(60)
+        groq.tokens_bucket = TokenBucket(60)
+        groq.tokens_bucket._tokens = 0
+        before = groq.requests_bucket._tokens
+        with pytest.raises(LLMUnavailable):
+            await groq.chat([{"role": "user", "content": "salom " * 50}], max_tokens=500)
+        assert groq.requests_bucket._tokens == pytest.approx(before, abs=0.1)
+
+    asyncio.run(scenario())
+
+
+def test_limits_are_refunded_when_queue_times_out(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_QUEUE_TIMEOUT", 0.05)
+    monkeypatch.setattr(llm_client, "GROQ_MAX_CONCURRENCY", 1)
+
+    async def scenario():
+        groq = _client(_ok)
+        groq.requests_bucket = TokenBucket(60)
+        groq.tokens_bucket = TokenBucket(6000)
+        # Yagona slot band: so'rov navbatda GROQ_QUEUE_TIMEOUT kutib, rad etiladi
+        await groq._global.acquire()
+        with pytest.raises(LLMUnavailable):
+            await groq.chat([{"role": "user", "content": "salom"}], max_tokens=100)
+        assert groq.requests_bucket._tokens == pytest.approx(60, abs=0.1)
+        assert groq.tokens_bucket._tokens == pytest.approx(6000, abs=1)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_bucket_wait_returns_tokens():
+    async def scenario():
+        bucket = TokenBucket(60)
+        bucket._tokens = 0
+        task = asyncio.create_task(bucket.acquire(1, 10))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert bucket._tokens == pytest.approx(0, abs=0.1)
+
+    asyncio.run(scenario())
+
+
+def test_streaming_reply_is_collected():
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n" for piece in ("Sa", "lom")
+        ) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    async def scenario():
+        partials = []
+
+        async def on_partial(text):
+            partials.append(text)
+
+        groq = _client(handler)
+        assert await groq.chat([{"role": "user", "content": "salom"}], on_partial=on_partial) == "Salom"
+        assert partials == ["Sa", "Salom"]
+
+    asyncio.run(scenario())
+
+
+def test_background_call_yields_to_interactive(monkeypatch):
+    monkeypatch.setattr(llm_client, "_BACKGROUND_POLL", 0.01)
+    monkeypatch.setattr(llm_client, "GROQ_BACKGROUND_HEADROOM", 0.5)
+
+    async def scenario():
+        order = []
+
+        def handler(request):
+            order.append(json.loads(request.content)["messages"][0]["content"])
+            return _ok(request)
+
+        groq = _client(handler)
+        groq.requests_bucket = TokenBucket(600)
+        groq.tokens_bucket = TokenBucket(60000)
+        # Umumiy RPM limitida zaxira yo'q: fon so'rovi kutadi, interaktiv esa o'tadi
+        groq.requests_bucket._tokens = 100
+        background = asyncio.create_task(
+            groq.chat([{"role": "user", "content": "fon"}], profile_id="summaries", background=True)
+        )
+        await asyncio.sleep(0.05)
+        assert not background.done()
+        assert await groq.chat([{"role": "user", "content": "foydalanuvchi"}]) == "javob"
+        groq.requests_bucket._tokens = 600
+        assert await asyncio.wait_for(background, 1) == "javob"
+        assert order == ["foydalanuvchi", "fon"]
+        assert groq.background_calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_background_calls_have_their_own_budget():
+    async def scenario():
+        groq = _client(_ok)
+        groq.background_requests_bucket = TokenBucket(60)
+        groq.background_requests_bucket._tokens = 0
+        background = asyncio.create_task(groq.chat([{"role": "user", "content": "fon"}], background=True))
+        await asyncio.sleep(0.05)
+        # Fon byudjeti tugagan, umumiy limit esa interaktiv so'rovlar uchun to'liq qolgan
+        assert not background.done()
+        assert groq.requests_bucket.available() == pytest.approx(groq.requests_bucket.capacity, abs=0.1)
+        assert await asyncio.wait_for(background, 2) == "javob"
+
+    asyncio.run(scenario())
+
+
+def _replies(*responses):
+    """Navbatdagi javobni qaytaradigan soxta Groq; calls - kelgan so'rovlar soni."""
+    queue = list(responses)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return queue.pop(0) if queue else _ok(request)
+
+    return handler, calls
+
+
+def test_retries_on_429_and_5xx(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_BACKOFF_BASE", 0.001)
+    handler, calls = _replies(httpx.Response(429), httpx.Response(503))
+
+    async def scenario():
+        groq = _client(handler)
+        assert await groq.chat([{"role": "user", "content": "salom"}]) == "javob"
+        assert len(calls) == 3
+        assert groq.retries == 2
+        assert groq.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_client_error_is_not_retried_and_keeps_breaker_closed(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_BACKOFF_BASE", 0.001)
+    handler, calls = _replies(*[httpx.Response(400)] * 10)
+
+    async def scenario():
+        groq = _client(handler)
+        groq.breaker = CircuitBreaker(1, 60)
+        with pytest.raises(LLMError) as err:
+            await groq.chat([{"role": "user", "content": "salom"}])
+        assert not err.value.retryable
+        assert len(calls) == 1
+        assert groq.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_header_sets_the_delay(monkeypatch):
+    # Eksponensial backoff deyarli nol: kutish faqat Retry-After'dan keladi
+    monkeypatch.setattr(llm_client, "GROQ_BACKOFF_BASE", 0.001)
+    handler, calls = _replies(httpx.Response(429, headers={"Retry-After": "0.3"}))
+
+    async def scenario():
+        groq = _client(handler)
+        started = time.monotonic()
+        assert await groq.chat([{"role": "user", "content": "salom"}]) == "javob"
+        assert time.monotonic() - started >= 0.3
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_longer_than_backoff_max_fails_fast(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_BACKOFF_MAX", 1.0)
+    handler, calls = _replies(httpx.Response(429, headers={"Retry-After": "120"}))
+
+    async def scenario():
+        groq = _client(handler)
+        started = time.monotonic()
+        with pytest.raises(LLMError):
+            await groq.chat([{"role": "user", "content": "salom"}])
+        assert time.monotonic() - started < 1.0
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_breaker_opens_and_half_open_probe_closes_it(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_MAX_RETRIES", 0)
+    handler, calls = _replies(httpx.Response(503), httpx.Response(503))
+
+    async def scenario():
+        groq = _client(handler)
+        groq.breaker = CircuitBreaker(2, 0.1)
+        for _ in range(2):
+            with pytest.raises(LLMError):
+                await groq.chat([{"role": "user", "content": "salom"}])
+        assert groq.breaker.state == "open"
+
+        # Ochiq breaker: so'rov Groq'ga umuman yuborilmaydi
+        with pytest.raises(LLMUnavailable):
+            await groq.chat([{"role": "user", "content": "salom"}])
+        assert len(calls) == 2
+        assert groq.rejected == 1
+
+        await asyncio.sleep(0.1)
+        assert groq.breaker.state == "half_open"
+        assert await groq.chat([{"role": "user", "content": "salom"}]) == "javob"
+        assert groq.breaker.state == "closed"
+        assert len(calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_half_open_lets_one_probe_through_and_failed_probe_reopens(monkeypatch):
+    monkeypatch.setattr(llm_client, "GROQ_MAX_RETRIES", 0)
+
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def handler(request):
+            calls.append(request)
+            await release.wait()
+            return httpx.Response(503)
+
+        groq = _client(handler)
+        groq.breaker = CircuitBreaker(1, 0.05)
+        groq.breaker.record_failure()
+        await asyncio.sleep(0.05)
+
+        probe = asyncio.create_task(groq.chat([{"role": "user", "content": "sinov"}]))
+        await asyncio.sleep(0.01)
+        # Sinov so'rovi javob kutayotganda boshqalari rad etiladi
+        with pytest.raises(LLMUnavailable):
+            await groq.chat([{"role": "user", "content": "salom"}])
+        release.set()
+        with pytest.raises(LLMError):
+            await probe
+        assert len(calls) == 1
+        assert groq.breaker.state == "open"
+
+    asyncio.run(scenario())
+
+
+def test_reply_falls_back_to_stub_while_breaker_is_open(monkeypatch):
+    handler, calls = _replies()
+    groq = _client(handler)
+    groq.breaker = CircuitBreaker(1, 60)
+    groq.breaker.record_failure()
+
+    async def no_cache_key(profile_id, message):
+        return None
+
+    async def compiled_prompt(profile):
+        return CompiledPrompt(profile_id=profile["id"], persona="", system_prefix="qoidalar")
+
+    async def no_summaries(profile_id, message):
+        return []
+
+    monkeypatch.setattr(config, "AI_MODE", "groq")
+    monkeypatch.setattr(config, "GROQ_API_KEY", "test")
+    monkeypatch.setattr(ai_service, "get_groq", lambda: groq)
+    monkeypatch.setattr(ai_service, "answer_key", no_cache_key)
+    monkeypatch.setattr(ai_service, "get_compiled_prompt", compiled_prompt)
+    monkeypatch.setattr(ai_service, "select_summaries", no_summaries)
+
+    profile = {"id": 7, "name": "Ali", "surname": "Valiyev", "nick": "ali"}
+    reply = asyncio.run(ai_service.generate_reply_stub(profile, [], "Qalaysan?"))
+    assert reply == ai_service.fallback_reply(ai_service.full_name_of(profile))
+    assert calls == []
+    assert groq.rejected == 1
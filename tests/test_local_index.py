@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from conftest import run
+
+import db
+import local_index
+
+
+def test_sync_embeds_off_the_event_loop_while_searches_run(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        user_id = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        await db.add_entries_bulk(
+            user_id, [(f"kundalik yozuv {i} " + "kitob maktab bugun do'stlar bilan " * 8, None) for i in range(5000)], db_path=db_path
+        )
+        index = local_index.LocalVectorIndex(db_path, dim=512, writable=True)
+        index.open()
+
+        sync = asyncio.create_task(index.sync_from_db())
+        lag = 0.0
+        found = []
+        # Sync ishlayotganda event loop javob beradi va search boshlang'ich sig'imdan
+        # o'sayotgan indeksni xatosiz o'qiydi
+        while not sync.done():
+            before = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - before - 0.005)
+            found.append(len(index.search(user_id, "kitob maktab", top_k=3)))
+        added = await sync
+        count = index.count
+        final = index.search(user_id, "kitob maktab", top_k=3)
+        index.close()
+        return added, count, lag, found, final
+
+    added, count, lag, found, final = run(scenario())
+    assert added == count == 5000
+    assert len(found) > 5
+    # Sahifa event loop'da embed qilinganda lag bitta sahifa vaqtiga (~0.1 s) teng bo'ladi
+    assert lag < 0.05
+    assert len(final) == 3
@@ -0,0 +1,223 @@
+"""Bir nechta OS jarayoni bilan yuklama testlari: update navbati va lokal vektor indeks."""
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from conftest import run
+
+import db
+
+_SLOTS = 3
+_CHATS = 30
+_PER_CHAT = 20
+_LEASE = 1.0
+
+
+def test_claimed_updates_are_leased_until_acked(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        for i in range(3):
+            await db.enqueue_update(0, f"u{i}", db_path=db_path)
+        first = await db.claim_updates([0], "a", lease=60, limit=2, db_path=db_path)
+        second = await db.claim_updates([0], "b", lease=60, db_path=db_path)
+        await db.ack_updates([first[0]["id"]], db_path=db_path)
+        # "a" o'lgan: ijarasi yangilanmadi, qolgan qatori boshqa jarayonga qaytadi
+        expired = await db.claim_updates([0], "b", lease=0, db_path=db_path)
+        await db.release_update_leases("b", db_path=db_path)
+        released = await db.claim_updates([0], "c", lease=60, db_path=db_path)
+        return first, second, expired, released, await db.count_queued_updates(db_path=db_path)
+
+    first, second, expired, released, queued = run(scenario())
+    assert [r["payload"] for r in first] == ["u0", "u1"]
+    # u1 hali "a" ijarasida: undan keyingi u2 boshqa egaga berilmaydi
+    assert second == []
+    assert [r["payload"] for r in expired] == ["u1", "u2"]
+    assert [r["payload"] for r in released] == ["u1", "u2"]
+    assert queued == 2
+
+
+def test_slot_takeover_keeps_dead_owners_rows_first(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.claim_worker_slots("a", 1, 30, db_path=db_path) == [0]
+        for i in range(4):
+            await db.enqueue_update(0, f"u{i}", db_path=db_path)
+        # "a" u0, u1 ni ijaraga oldi va heartbeat'dan keyin o'ldi
+        leased = await db.claim_updates([0], "a", lease=30, limit=2, db_path=db_path)
+        await asyncio.sleep(0.02)
+        owned = await db.claim_worker_slots("b", 1, 0.01, db_path=db_path)
+        taken = await db.claim_updates([0], "b", lease=30, db_path=db_path)
+        return leased, owned, taken
+
+    leased, owned, taken = run(scenario())
+    assert [r["payload"] for r in leased] == ["u0", "u1"]
+    assert owned == [0]
+    assert [r["payload"] for r in taken] == ["u0", "u1", "u2", "u3"]
+
+
+def test_rows_behind_another_owners_lease_wait(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        for i in range(3):
+            await db.enqueue_update(0, f"u{i}", db_path=db_path)
+        # "a" slotni bo'shatdi, lekin u0 ni hali tugatyapti
+        await db.claim_updates([0], "a", lease=30, limit=1, db_path=db_path)
+        blocked = await db.claim_updates([0], "b", lease=30, db_path=db_path)
+        await db.ack_updates([1], db_path=db_path)
+        after_ack = await db.claim_updates([0], "b", lease=30, db_path=db_path)
+        return blocked, after_ack
+
+    blocked, after_ack = run(scenario())
+    assert blocked == []
+    assert [r["payload"] for r in after_ack] == ["u1", "u2"]
+
+
+def _queue_worker(db_path, out_path, victim):
+    import multiworker
+
+    multiworker.WORKER_SLOT_TTL = _LEASE
+    multiworker.UPDATE_QUEUE_POLL = 0.05
+
+    async def main():
+        pending = set()
+
+        async def handle(payload, done):
+            with open(out_path, "a", encoding="utf-8") as f:
+                f.write(payload + "\n")
+            if victim:
+                # Qayta ishlash "osilib qoldi": done() hech qachon chaqirilmaydi
+                return
+            task = asyncio.ensure_future(asyncio.sleep(0.001))
+            pending.add(task)
+            task.add_done_callback(lambda _t: (pending.discard(task), done()))
+
+        coordinator = multiworker.ProcessCoordinator(handle, slots=_SLOTS, db_path=db_path)
+        await coordinator.start()
+        idle_since = None
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            await asyncio.sleep(0.1)
+            if await db.count_queued_updates(db_path=db_path) == 0:
+                idle_since = idle_since or time.time()
+                if time.time() - idle_since > 0.5:
+                    break
+            else:
+                idle_since = None
+        await coordinator.stop()
+        await coordinator.release_updates()
+        await db.close_db()
+
+    asyncio.run(main())
+
+
+def test_queue_survives_killed_process(db_path, tmp_path):
+    async def fill():
+        await db.init_db(db_path)
+        for seq in range(_PER_CHAT):
+            for chat in range(_CHATS):
+                await db.enqueue_update(chat % _SLOTS, json.dumps([chat, seq]), db_path=db_path)
+
+    run(fill())
+    ctx = multiprocessing.get_context("spawn")
+    outputs = [str(tmp_path / f"out{i}.txt") for i in range(_SLOTS)]
+    victim = ctx.Process(target=_queue_worker, args=(db_path, outputs[0], True))
+    victim.start()
+    # Qurbon birinchi bo'lib slot va o'z shard'idagi update'larni olsin
+    time.sleep(1.5)
+    workers = [ctx.Process(target=_queue_worker, args=(db_path, path, False)) for path in outputs[1:]]
+    for proc in workers:
+        proc.start()
+    time.sleep(0.5)
+    victim.kill()
+    victim.join()
+    for proc in workers:
+        proc.join(60)
+        assert proc.exitcode == 0
+
+    seen = {}
+    for path in outputs[1:]:
+        if not os.path.exists(path):
+            # Qurbonning slotlarini boshqa jarayon olgan bo'lishi mumkin
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                chat, seq = json.loads(line)
+                seen.setdefault(chat, []).append(seq)
+    with open(outputs[0], encoding="utf-8") as f:
+        victim_handled = len(f.readlines())
+
+    assert victim_handled > 0
+    # Qurbon olgan, lekin tasdiqlamagan update'lar ham boshqa jarayonda bajarildi
+    assert sorted(seen) == list(range(_CHATS))
+    for chat, seqs in seen.items():
+        assert seqs == list(range(_PER_CHAT)), chat
+    assert run(db.count_queued_updates(db_path=db_path)) == 0
+
+
+_DIM = 512
+_ENTRIES = 20000
+
+
+def _index_writer(db_path):
+    import local_index
+
+    index = local_index.LocalVectorIndex(db_path, dim=_DIM, writable=True)
+    index.open()
+    # Boshlang'ich sig'imdan (1024) ko'p marta oshadi: _grow besh marta ishlaydi
+    for start in range(1, _ENTRIES + 1, 200):
+        index.add_many([(i, i % 7, f"kundalik yozuv {i} kitob maktab") for i in range(start, start + 200)])
+    index.close()
+
+
+def _index_reader(db_path, result_path):
+    import local_index
+
+    index = local_index.LocalVectorIndex(db_path, dim=_DIM, writable=False)
+    index.open()
+    max_count = 0
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        index.refresh()
+        count = index.count
+        if count:
+            ids = np.array(index._ids[:count])
+            # Hisoblangan qatorlar hech qachon nol (kesilgan fayl) bo'lmasligi kerak
+            assert ids[:, 0].min() > 0
+            assert max_count <= count
+            # Vektorlar ham: yozilgan har bir qator normallangan, nol emas
+            assert bool((np.abs(index._vectors[:count]).max(axis=1) > 0).all())
+            if count != max_count:
+                for entry_id, _score in index.search(3, "kitob maktab", top_k=5):
+                    assert entry_id % 7 == 3
+        max_count = count
+        if count >= _ENTRIES:
+            break
+    index.close()
+    with open(result_path, "w", encoding="utf-8") as f:
+        f.write(str(max_count))
+
+
+def test_index_readers_follow_single_writer(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    ctx = multiprocessing.get_context("spawn")
+    writer = ctx.Process(target=_index_writer, args=(db_path,))
+    writer.start()
+    while not os.path.exists(f"{db_path}.vectors.json"):
+        time.sleep(0.01)
+    results = [str(tmp_path / f"reader{i}.txt") for i in range(2)]
+    readers = [ctx.Process(target=_index_reader, args=(db_path, path)) for path in results]
+    for proc in readers:
+        proc.start()
+    writer.join(60)
+    for proc in readers:
+        proc.join(60)
+
+    assert writer.exitcode == 0
+    assert [proc.exitcode for proc in readers] == [0, 0]
+    for path in results:
+        with open(path, encoding="utf-8") as f:
+            assert int(f.read()) == _ENTRIES
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import passwords
+
+
+def test_hash_and_verify_roundtrip(monkeypatch):
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 4)
+
+    async def scenario():
+        try:
+            stored = await passwords.hash_password("maxfiy")
+            assert stored.startswith("$2")
+            assert await passwords.verify_password("maxfiy", stored)
+            assert not await passwords.verify_password("boshqa", stored)
+            assert not await passwords.verify_password("maxfiy", "")
+            assert not await passwords.verify_password("maxfiy", "buzilgan-hash")
+        finally:
+            passwords.shutdown_password_hasher()
+
+    asyncio.run(scenario())
+
+
+async def _max_loop_lag(work, interval=0.005):
+    """work() bajarilayotgan paytdagi eng katta event loop kechikishi (soniya)."""
+    lags = []
+    stop = asyncio.Event()
+
+    async def monitor():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - started - interval)
+
+    task = asyncio.create_task(monitor())
+    await asyncio.sleep(interval * 2)
+    try:
+        await work()
+    finally:
+        stop.set()
+        await task
+    return max(lags)
+
+
+def test_concurrent_logins_do_not_block_event_loop(monkeypatch):
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 10)
+    logins = 8
+
+    async def scenario():
+        try:
+            stored = await passwords.hash_password("maxfiy")
+
+            async def threaded():
+                results = await asyncio.gather(
+                    *(passwords.verify_password("maxfiy", stored) for _ in range(logins))
+                )
+                assert all(results)
+
+            async def inline():
+                # Thread pool'siz: bcrypt to'g'ridan-to'g'ri handler ichida
+                async def login():
+                    await asyncio.sleep(0)
+                    assert passwords._verify_sync("maxfiy", stored)
+
+                await asyncio.gather(*(login() for _ in range(logins)))
+
+            return await _max_loop_lag(threaded), await _max_loop_lag(inline)
+        finally:
+            passwords.shutdown_password_hasher()
+
+    threaded_lag, inline_lag = asyncio.run(scenario())
+    # Inline'da loop kamida bitta bcrypt davomida to'xtaydi; thread pool bilan deyarli kechikmaydi
+    assert inline_lag > 0.03
+    assert threaded_lag < inline_lag / 3
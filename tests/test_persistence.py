@@ -0,0 +1,149 @@
+from conftest import run
+
+import db
+from persistence import SQLitePersistence
+
+
+def _persistence(db_path):
+    return SQLitePersistence(db_path=db_path, update_interval=60, flush_delay=0.01, refresh_from_db=False)
+
+
+def test_state_survives_restart(db_path):
+    async def scenario():
+        first = _persistence(db_path)
+        assert await first.get_user_data() == {}
+        assert await first.get_conversations("main_conversation") == {}
+        await first.update_user_data(42, {"chat_profile_id": 7})
+        await first.update_conversation("main_conversation", (42, 42), 3)
+        await first.update_bot_data({"version": 1})
+        await first.flush()
+        await db.close_db()
+
+        # "Qayta ishga tushirish": yangi obyekt bazadan o'qiydi
+        second = _persistence(db_path)
+        assert await second.get_user_data() == {42: {"chat_profile_id": 7}}
+        assert await second.get_conversations("main_conversation") == {(42, 42): 3}
+        assert await second.get_bot_data() == {"version": 1}
+
+    run(scenario())
+
+
+def test_unchanged_data_is_not_rewritten(db_path):
+    async def scenario():
+        persistence = _persistence(db_path)
+        await persistence.get_user_data()
+        await persistence.update_user_data(1, {"a": 1})
+        await persistence.flush()
+        assert persistence.writes == 1
+        await persistence.update_user_data(1, {"a": 1})
+        await persistence.flush()
+        assert persistence.writes == 1
+        assert persistence.skipped == 1
+
+    run(scenario())
+
+
+def test_batched_flush_and_deletes(db_path):
+    async def scenario():
+        persistence = _persistence(db_path)
+        await persistence.get_user_data()
+        for user_id in range(5):
+            await persistence.update_user_data(user_id, {"n": user_id})
+        await persistence.flush()
+        # Bitta oraliqdagi o'zgarishlar bitta tranzaksiyada yoziladi
+        assert persistence.flushes == 1
+        await persistence.drop_user_data(0)
+        await persistence.update_user_data(1, {})
+        await persistence.update_conversation("main_conversation", (2, 2), None)
+        await persistence.flush()
+        assert await _persistence(db_path).get_user_data() == {2: {"n": 2}, 3: {"n": 3}, 4: {"n": 4}}
+
+    run(scenario())
+
+
+def _conversation_app(db_path, seen):
+    from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler, MessageHandler, filters
+
+    async def start(update, context):
+        return 1
+
+    async def name(update, context):
+        seen.append(("name", update.message.text))
+        return 2
+
+    async def surname(update, context):
+        seen.append(("surname", update.message.text))
+        return ConversationHandler.END
+
+    persistence = SQLitePersistence(db_path=db_path, update_interval=60, flush_delay=0.01, refresh_from_db=True)
+    app = ApplicationBuilder().token("123:TEST").persistence(persistence).updater(None).build()
+    app.add_handler(
+        ConversationHandler(
+            name="main_conversation",
+            persistent=True,
+            entry_points=[CommandHandler("start", start)],
+            states={
+                1: [MessageHandler(filters.TEXT & ~filters.COMMAND, name)],
+                2: [MessageHandler(filters.TEXT & ~filters.COMMAND, surname)],
+            },
+            fallbacks=[],
+        )
+    )
+    return app
+
+
+def _message(app, update_id, text):
+    from telegram import Update
+
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else []
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": 10, "type": "private"},
+                "from": {"id": 10, "is_bot": False, "first_name": "Ali"},
+                "text": text,
+                "entities": entities,
+            },
+        },
+        app.bot,
+    )
+
+
+async def _handle(app, update):
+    await app.persistence.refresh_conversations(app, update)
+    await app.process_update(update)
+    await app.update_persistence()
+    await app.persistence.flush()
+
+
+def test_conversation_state_follows_chat_to_other_process(db_path, monkeypatch):
+    from telegram import User
+    from telegram.ext import ExtBot
+
+    async def no_network(self):
+        self._bot_user = User(id=1, is_bot=True, first_name="Bot", username="test_bot")
+        self._initialized = True
+
+    # initialize() Telegram'ga get_me so'rovini yubormasin
+    monkeypatch.setattr(ExtBot, "initialize", no_network)
+
+    async def scenario():
+        seen = []
+        first, second = _conversation_app(db_path, seen), _conversation_app(db_path, seen)
+        await first.initialize()
+        # Ikkinchi jarayon ishga tushganda chatning suhbati hali bo'lmagan
+        await second.initialize()
+        await _handle(first, _message(first, 1, "/start"))
+        await _handle(first, _message(first, 2, "Ali"))
+        # Chat (slot) ikkinchi jarayonga o'tdi: familiya REG_SURNAME holatida qabul qilinishi kerak
+        await _handle(second, _message(second, 3, "Valiyev"))
+        await first.shutdown()
+        await second.shutdown()
+        return seen, await second.persistence.get_conversations("main_conversation")
+
+    seen, stored = run(scenario())
+    assert seen == [("name", "Ali"), ("surname", "Valiyev")]
+    assert stored == {}
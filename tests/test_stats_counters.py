@@ -0,0 +1,79 @@
+from conftest import run
+
+import db
+
+
+async def _counters(db_path):
+    async with db._reader(db_path) as conn:
+        async with conn.execute("SELECT users, entries FROM stats_counters WHERE id = 1") as cursor:
+            totals = tuple(await cursor.fetchone())
+        async with conn.execute("SELECT user_id, entry_count FROM user_entry_counts ORDER BY user_id") as cursor:
+            users = [tuple(r) for r in await cursor.fetchall()]
+        async with conn.execute("SELECT user_id, SUM(entry_count) FROM daily_entry_counts GROUP BY user_id ORDER BY user_id") as cursor:
+            days = [tuple(r) for r in await cursor.fetchall()]
+    return totals, users, days
+
+
+def test_clean_counters_need_no_writer(db_path, monkeypatch):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        user_id = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        await db.add_entry(user_id, "birinchi", db_path=db_path)
+
+        def no_writer(path):
+            raise AssertionError("farq yo'q bo'lsa yozuvchi olinmasligi kerak")
+
+        monkeypatch.setattr(db, "_writer", no_writer)
+        return await db.verify_stats_counters(db_path=db_path)
+
+    assert run(scenario()) == {"totals": 0, "user_entry_counts": 0, "daily_entry_counts": 0, "repaired": False}
+
+
+def test_only_drifted_rows_are_repaired(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        assert await db.create_user(2, "Vali", "Aliyev", "vali", "hash", db_path=db_path)
+        ali = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        vali = int((await db.get_user_profile_by_nick("vali", db_path=db_path))["id"])
+        for text in ("bir", "ikki", "uch"):
+            await db.add_entry(ali, text, db_path=db_path)
+        await db.add_entry(vali, "salom", db_path=db_path)
+        expected = await _counters(db_path)
+
+        async with db._writer(db_path) as conn:
+            await conn.execute("UPDATE stats_counters SET entries = 99 WHERE id = 1")
+            await conn.execute("UPDATE user_entry_counts SET entry_count = 7 WHERE user_id = ?", (ali,))
+            await conn.execute("DELETE FROM daily_entry_counts WHERE user_id = ?", (vali,))
+            await conn.commit()
+
+        report = await db.verify_stats_counters(repair=False, db_path=db_path)
+        assert report == {"totals": 1, "user_entry_counts": 1, "daily_entry_counts": 1, "repaired": False}
+        assert await _counters(db_path) != expected
+
+        report = await db.verify_stats_counters(db_path=db_path)
+        assert report == {"totals": 1, "user_entry_counts": 1, "daily_entry_counts": 1, "repaired": True}
+        assert await _counters(db_path) == expected
+        return await db.verify_stats_counters(db_path=db_path)
+
+    assert run(scenario()) == {"totals": 0, "user_entry_counts": 0, "daily_entry_counts": 0, "repaired": False}
+
+
+def test_deleted_user_row_is_dropped(db_path):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        ali = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        async with db._writer(db_path) as conn:
+            await conn.execute(
+                "INSERT INTO user_entry_counts (user_id, entry_count, last_entry_at) VALUES (?, 5, NULL)", (ali + 100,)
+            )
+            await conn.execute("UPDATE user_entry_counts SET entry_count = 2 WHERE user_id = ?", (ali,))
+            await conn.commit()
+        report = await db.verify_stats_counters(db_path=db_path)
+        return ali, report, (await _counters(db_path))[1]
+
+    ali, report, users = run(scenario())
+    assert report["user_entry_counts"] == 2
+    assert users == [(ali, 0)]
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import NetworkError, TimedOut
+
+import bot
+
+
+class FakeMessage:
+    """reply_text/edit_text chaqiruvlarini yozib boradigan Telegram xabari o'rnini bosuvchi."""
+
+    def __init__(self, edit_error=None):
+        self.edit_error = edit_error
+        self.replies = []
+        self.edits = []
+        self.text = ""
+        self.sent = None
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append(text)
+        self.sent = FakeMessage(self.edit_error)
+        self.sent.parent = self
+        return self.sent
+
+    async def edit_text(self, text):
+        if self.edit_error is not None and text.endswith(bot.StreamingMessage.CURSOR):
+            raise self.edit_error
+        self.parent.edits.append(text)
+
+
+def test_failed_partial_edit_is_only_logged():
+    async def scenario():
+        source = FakeMessage(edit_error=TimedOut())
+        streaming = bot.StreamingMessage(source, interval=0)
+        await streaming.start()
+        await streaming.update("Salom")
+        await streaming.finish("Salom, dunyo")
+        assert source.edits == ["Salom, dunyo"]
+
+    asyncio.run(scenario())
+
+
+def test_chat_reply_is_finalized_when_generation_fails(monkeypatch):
+    logged = []
+
+    async def fake_get_profile(profile_id):
+        return {"id": profile_id, "name": "Ali", "surname": "Valiyev", "nick": "ali"}
+
+    async def failing_reply(profile, entries, user_message, on_partial=None):
+        await on_partial("Yarim javob")
+        raise NetworkError("uzildi")
+
+    async def fake_add_chat_log(**kwargs):
+        logged.append(kwargs)
+
+    monkeypatch.setattr(bot, "get_profile", fake_get_profile)
+    monkeypatch.setattr(bot, "generate_reply_stub", failing_reply)
+    monkeypatch.setattr(bot, "add_chat_log", fake_add_chat_log)
+
+    async def scenario():
+        message = FakeMessage()
+        update = SimpleNamespace(message=message, effective_user=SimpleNamespace(id=5))
+        update.message.text = "Qalaysan?"
+        context = SimpleNamespace(user_data={"chat_profile_id": 7})
+        state = await bot.chat_with_profile(update, context)
+        assert state == bot.CHAT_WITH_PROFILE
+        assert message.replies == [bot.StreamingMessage.PLACEHOLDER]
+        # "..." xabari fallback matn bilan yakunlangan
+        assert message.edits[-1].startswith("Men Ali")
+        assert logged and logged[0]["answer"] == message.edits[-1]
+
+    asyncio.run(scenario())
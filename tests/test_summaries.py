@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from conftest import run
+
+import db
+import summaries
+from summaries import ExtractiveSummarizer, GroqSummarizer, SummaryWorker
+
+
+def test_backlog_is_built_with_pauses(db_path, monkeypatch):
+    monkeypatch.setattr(summaries, "SUMMARY_DELAY", 0)
+
+    async def scenario():
+        await db.init_db(db_path)
+        assert await db.create_user(1, "Ali", "Valiyev", "ali", "hash", db_path=db_path)
+        user_id = int((await db.get_user_profile_by_nick("ali", db_path=db_path))["id"])
+        rows = [(f"{month}-oy haqida yozuv. Bugun yaxshi kun edi.", f"2023-{month:02d}-10 10:00:00") for month in range(1, 4)]
+        await db.add_entries_bulk(user_id, rows, db_path=db_path)
+
+        worker = SummaryWorker(ExtractiveSummarizer(), db_path=db_path, build_interval=0.1)
+        started = time.monotonic()
+        assert await worker.process_due() == 3
+        # Har bir oydan keyin pauza: navbat bir zarbda bo'shatilmaydi
+        assert time.monotonic() - started >= 0.3
+        periods = sorted(s["period"] for s in await db.get_diary_summaries(user_id, db_path=db_path))
+        assert periods == ["2023-01", "2023-02", "2023-03"]
+
+    run(scenario())
+
+
+def test_groq_summarizer_uses_background_path(monkeypatch):
+    calls = []
+
+    class FakeGroq:
+        async def chat(self, messages, **kwargs):
+            calls.append(kwargs)
+            return "Qisqa xulosa."
+
+    monkeypatch.setattr(summaries, "get_groq", lambda: FakeGroq())
+    result = asyncio.run(GroqSummarizer().summarize("2023-01", None, [{"text": "yozuv", "created_at": "2023-01-01"}]))
+    assert result == "Qisqa xulosa."
+    assert calls[0]["background"] is True
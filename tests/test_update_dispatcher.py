@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+from update_dispatcher import UpdateDispatcher
+
+
+def _update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def test_updates_of_one_chat_run_in_order_and_one_at_a_time():
+    async def scenario():
+        seen = []
+        running = set()
+
+        async def process(update):
+            chat = update.effective_chat.id
+            assert chat not in running
+            running.add(chat)
+            await asyncio.sleep(0)
+            seen.append((chat, update.update_id))
+            running.discard(chat)
+
+        dispatcher = UpdateDispatcher(process, workers=4, queue_size=100)
+        dispatcher.start()
+        for i in range(30):
+            assert dispatcher.submit(_update(i, i % 3))
+        await dispatcher.stop()
+        assert dispatcher.processed == 30
+        for chat in range(3):
+            assert [u for c, u in seen if c == chat] == list(range(chat, 30, 3))
+
+    asyncio.run(scenario())
+
+
+def test_slow_chat_does_not_block_other_chats():
+    async def scenario():
+        release = asyncio.Event()
+        done = []
+
+        async def process(update):
+            if update.effective_chat.id == 0:
+                await release.wait()
+            done.append(update.update_id)
+
+        dispatcher = UpdateDispatcher(process, workers=2, queue_size=100)
+        dispatcher.start()
+        dispatcher.submit(_update(1, 0))
+        dispatcher.submit(_update(2, 0))
+        for i in range(10):
+            dispatcher.submit(_update(100 + i, 2))
+        await asyncio.sleep(0.05)
+        assert done == list(range(100, 110))
+        assert dispatcher.metrics()["in_flight"] == 1
+        release.set()
+        await dispatcher.stop()
+        assert done[-2:] == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_busy_chat_is_limited_without_rejecting_others():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def process(update):
+            await release.wait()
+
+        dispatcher = UpdateDispatcher(process, workers=2, queue_size=100, per_chat_limit=5)
+        dispatcher.start()
+        results = [dispatcher.submit(_update(i, 0)) for i in range(20)]
+        await asyncio.sleep(0)
+        assert results.count(False) > 0
+        assert dispatcher.submit(_update(999, 1))
+        release.set()
+        await dispatcher.stop()
+        assert dispatcher.rejected == results.count(False)
+        assert dispatcher.processed == dispatcher.accepted
+
+    asyncio.run(scenario())
+
+
+def test_global_capacity_and_put_waits_for_space():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def process(update):
+            await release.wait()
+
+        dispatcher = UpdateDispatcher(process, workers=1, queue_size=3)
+        dispatcher.start()
+        assert all(dispatcher.submit(_update(i, i)) for i in range(3))
+        assert not dispatcher.submit(_update(3, 3))
+        waiter = asyncio.create_task(dispatcher.put(_update(4, 4)))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        release.set()
+        await asyncio.wait_for(waiter, 1)
+        await dispatcher.stop()
+        assert dispatcher.processed == 4
+
+    asyncio.run(scenario())
+
+
+def test_on_done_runs_after_processing_even_on_error():
+    async def scenario():
+        events = []
+
+        async def process(update):
+            events.append(("process", update.update_id))
+            if update.update_id == 1:
+                raise RuntimeError("xato")
+
+        dispatcher = UpdateDispatcher(process, workers=2, queue_size=10)
+        dispatcher.start()
+        for i in range(3):
+            await dispatcher.put(_update(i, 5), on_done=lambda i=i: events.append(("done", i)))
+        await dispatcher.stop()
+        return events, dispatcher.failed
+
+    events, failed = asyncio.run(scenario())
+    assert failed == 1
+    assert events == [(kind, i) for i in range(3) for kind in ("process", "done")]
@@ -0,0 +1,113 @@
+import pytest
+from conftest import run
+
+import db
+import user_cache
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def cache(db_path, monkeypatch):
+    """Bo'sh keshlar va test bazasiga ulangan loaderlar; loads - bazaga borishlar soni."""
+    loads = []
+
+    async def get_user_profile(user_id):
+        loads.append(("id", user_id))
+        return await db.get_user_profile(user_id, db_path=db_path)
+
+    async def get_user_profile_by_nick(nick):
+        loads.append(("nick", nick))
+        return await db.get_user_profile_by_nick(nick, db_path=db_path)
+
+    monkeypatch.setattr(user_cache, "_by_id", TTLCache(maxsize=100, default_ttl=60))
+    monkeypatch.setattr(user_cache, "_by_nick", TTLCache(maxsize=100, default_ttl=60))
+    monkeypatch.setattr(user_cache, "get_user_profile", get_user_profile)
+    monkeypatch.setattr(user_cache, "get_user_profile_by_nick", get_user_profile_by_nick)
+    monkeypatch.setattr(db, "_user_listeners", [])
+    monkeypatch.setattr(user_cache, "_listener_registered", False)
+    return loads
+
+
+async def _create(db_path, telegram_id, nick):
+    await db.init_db(db_path)
+    assert await db.create_user(telegram_id, "Ali", "Valiyev", nick, "maxfiy-hash", db_path=db_path)
+    return int((await db.get_user_profile_by_nick(nick, db_path=db_path))["id"])
+
+
+def test_password_hash_is_never_cached(db_path, cache):
+    async def scenario():
+        user_id = await _create(db_path, 1, "ali")
+        by_id = await user_cache.get_profile(user_id)
+        by_nick = await user_cache.get_profile_by_nick("ALI")
+        user_cache.prime_profiles([{**by_id, "password_hash": "maxfiy-hash"}])
+        return user_id, by_id, by_nick
+
+    user_id, by_id, by_nick = run(scenario())
+    assert by_id["nick"] == by_nick["nick"] == "ali"
+    for profile in (by_id, by_nick, user_cache._by_id.peek(user_id), user_cache._by_nick.peek("ali")):
+        assert "password_hash" not in profile
+
+
+def test_deleted_user_is_invalidated(db_path, cache):
+    async def scenario():
+        user_id = await _create(db_path, 1, "ali")
+        assert await user_cache.get_profile(user_id) is not None
+        assert await user_cache.get_profile_by_nick("ali") is not None
+        await db.delete_user_by_id(user_id, db_path=db_path)
+        return user_id, await user_cache.get_profile(user_id), await user_cache.get_profile_by_nick("ali")
+
+    user_id, by_id, by_nick = run(scenario())
+    assert by_id is None and by_nick is None
+    assert cache.count(("id", user_id)) == 2
+
+
+def test_new_user_replaces_cached_miss(db_path, cache):
+    async def scenario():
+        await db.init_db(db_path)
+        assert await user_cache.get_profile_by_nick("vali") is None
+        await _create(db_path, 2, "vali")
+        return await user_cache.get_profile_by_nick("vali")
+
+    assert run(scenario())["nick"] == "vali"
+
+
+def test_prime_skips_rows_read_before_an_invalidation(db_path, cache):
+    async def scenario():
+        user_id = await _create(db_path, 1, "ali")
+        seen = user_cache.invalidation_count()
+        rows = [await db.get_user_profile(user_id, db_path=db_path)]
+        # Qidiruv natijasi o'qilgandan keyin, keshga yozilishidan oldin profil o'chiriladi
+        await db.delete_user_by_id(user_id, db_path=db_path)
+        user_cache.prime_profiles(rows, seen)
+        return user_id, await user_cache.get_profile(user_id)
+
+    user_id, profile = run(scenario())
+    assert user_cache._by_id.peek(user_id) is None
+    assert profile is None
+
+
+def test_primed_profiles_are_served_from_memory(db_path, cache):
+    async def scenario():
+        user_id = await _create(db_path, 1, "ali")
+        seen = user_cache.invalidation_count()
+        user_cache.prime_profiles(await db.search_users_by_name_or_nick("ali", db_path=db_path), seen)
+        return user_id, await user_cache.get_profile(user_id)
+
+    user_id, profile = run(scenario())
+    assert profile["id"] == user_id
+    assert cache == []
+
+
+def test_hit_ratio_counts_both_caches(db_path, cache):
+    async def scenario():
+        user_id = await _create(db_path, 1, "ali")
+        await user_cache.get_profile(user_id)
+        await user_cache.get_profile(user_id)
+        await user_cache.get_profile(user_id)
+        await user_cache.get_profile_by_nick("ali")
+        return user_cache.user_cache_stats()
+
+    stats = run(scenario())
+    assert (stats["by_id"]["hits"], stats["by_id"]["misses"]) == (2, 1)
+    assert (stats["by_nick"]["hits"], stats["by_nick"]["misses"]) == (0, 1)
+    assert stats["hit_ratio"] == pytest.approx(2 / 4)
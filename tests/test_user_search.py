@@ -0,0 +1,115 @@
+import random
+import sqlite3
+import string
+
+from conftest import run
+
+import db
+
+
+async def _users(db_path, *people):
+    await db.init_db(db_path)
+    for i, (name, surname, nick) in enumerate(people, start=1):
+        assert await db.create_user(i, name, surname, nick, "hash", db_path=db_path)
+
+
+def _nicks(rows):
+    return [r["nick"] for r in rows]
+
+
+def test_transposed_letters_are_found(db_path):
+    async def scenario():
+        await _users(db_path, ("O'lmas", "Karimov", "olmas"), ("Ali", "Valiyev", "ali"))
+        return (
+            await db.search_users_by_name_or_nick("olmsa", db_path=db_path),
+            await db.search_users_by_name_or_nick("Ўлмас", db_path=db_path),
+            await db.search_users_by_name_or_nick("karimvo", db_path=db_path),
+        )
+
+    transposed, cyrillic, surname = run(scenario())
+    assert _nicks(transposed) == ["olmas"]
+    assert _nicks(cyrillic) == ["olmas"]
+    assert _nicks(surname) == ["olmas"]
+
+
+def test_short_queries_use_prefix_index(db_path):
+    async def scenario():
+        await _users(db_path, ("Ali", "Valiyev", "ali"), ("Vali", "Aliyev", "vali"), ("Bobur", "Karimov", "bobur"))
+        one = await db.search_users_by_name_or_nick("b", db_path=db_path)
+        two = await db.search_users_by_name_or_nick("Al", db_path=db_path)
+        vali = int((await db.get_user_profile_by_nick("vali", db_path=db_path))["id"])
+        await db.delete_user_by_id(vali, db_path=db_path)
+        after_delete = await db.search_users_by_name_or_nick("al", db_path=db_path)
+        return one, two, after_delete
+
+    one, two, after_delete = run(scenario())
+    assert _nicks(one) == ["bobur"]
+    assert sorted(_nicks(two)) == ["ali", "vali"]
+    assert _nicks(two)[0] == "ali"
+    assert _nicks(after_delete) == ["ali"]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        plan = " | ".join(
+            row[-1]
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT p.user_id, s.doc FROM users_search_prefix p "
+                "JOIN users_search s ON s.rowid = p.user_id WHERE p.prefix = ? LIMIT 200",
+                ("al",),
+            )
+        )
+    finally:
+        conn.close()
+    assert "SEARCH p USING PRIMARY KEY (prefix=?)" in plan
+
+
+def test_search_on_100k_profiles(db_path):
+    rnd = random.Random(7)
+
+    def word(size):
+        return "".join(rnd.choice(string.ascii_lowercase) for _ in range(size))
+
+    people = [(i, word(rnd.randint(3, 8)), word(rnd.randint(4, 9)), f"{word(5)}{i}") for i in range(1, 100_001)]
+    people[54_321] = (54_322, "Olmas", "Karimov", "olmas")
+
+    async def scenario():
+        await db.init_db(db_path)
+        async with db._writer(db_path) as conn:
+            await conn.executemany(
+                "INSERT INTO users (id, telegram_id, name, surname, nick, password_hash) VALUES (?, ?, ?, ?, ?, 'x')",
+                [(i, i, name, surname, nick) for i, name, surname, nick in people],
+            )
+            docs = [(i, db._user_search_doc(name, surname, nick)) for i, name, surname, nick in people]
+            await conn.executemany("INSERT INTO users_search (rowid, doc) VALUES (?, ?)", docs)
+            await conn.executemany(
+                "INSERT INTO users_search_prefix (prefix, user_id) VALUES (?, ?)",
+                [(prefix, i) for i, doc in docs for prefix in db._user_search_prefixes(doc)],
+            )
+            await conn.commit()
+
+        # Kechikish benchmarks/bench_user_search.py da o'lchanadi
+        return {
+            query: await db.search_users_by_name_or_nick(query, db_path=db_path)
+            for query in ("olmas", "olmsa", "karimov", "ol", "o", "zzzzqx")
+        }
+
+    results = run(scenario())
+    assert _nicks(results["olmas"])[0] == "olmas"
+    assert "olmas" in _nicks(results["olmsa"])
+    assert _nicks(results["karimov"])[0] == "olmas"
+    assert len(results["o"]) == 10 and len(results["ol"]) > 0
+
+
+def test_word_start_matches_are_not_cut_by_substring_limit(db_path):
+    # So'z ichida "karim" uchraydigan profillar nomzodlar chegarasidan (200) ko'p va
+    # ular rowid bo'yicha oldinda turadi; so'zi "karim" bilan boshlanadigan profil baribir birinchi
+    people = [(f"Abdukarim{i}", "Aliyev", f"abdu{i}") for i in range(300)]
+    people.append(("Karimjon", "Aliyev", "kjon"))
+
+    async def scenario():
+        await _users(db_path, *people)
+        return await db.search_users_by_name_or_nick("karim", db_path=db_path)
+
+    results = run(scenario())
+    assert _nicks(results)[0] == "kjon"
+    assert len(results) == 10
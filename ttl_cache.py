@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Muddati (TTL) va hajm chegarasi bor oddiy LRU kesh.
+
+    Har bir yozuv o'z TTL iga ega bo'lishi mumkin (masalan, ijobiy va salbiy
+    natijalar uchun turlicha). Hajm to'lganda eng uzoq ishlatilmagan yozuv
+    chiqarib tashlanadi. hits/misses hisoblagichlari stats() orqali olinadi.
+
+    get_or_load bir xil kalit uchun bir vaqtda kelgan so'rovlarni bitta
+    loader chaqiruviga birlashtiradi (single-flight).
+    """
+
+    def __init__(self, maxsize: int, default_ttl: float) -> None:
+        self.maxsize = max(1, maxsize)
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Yozuvni hisoblagichlar va LRU tartibiga ta'sir qilmasdan qaytaradi."""
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            return default
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """predicate(kalit) True bo'lgan barcha yozuvlarni o'chiradi va ularning sonini qaytaradi."""
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None,
+    ) -> Any:
+        """Keshdan qaytaradi, bo'lmasa loader() ni chaqiradi va natijani saqlaydi.
+
+        ttl_for(value) natijaga qarab TTL tanlashga imkon beradi; None qaytarsa,
+        natija keshga yozilmaydi (masalan, xato bo'lganda).
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Kutayotgan boshqa chaqiruvchilar bo'lmasa ham "exception never retrieved" chiqmasin
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            ttl = ttl_for(value) if ttl_for is not None else self.default_ttl
+            if ttl is not None:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+def update_shard_key(update: Update) -> int:
+    """Update qaysi chatga tegishli ekanini aniqlaydi (chat bo'lmasa, foydalanuvchi yoki update_id)."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+
+class UpdateDispatcher:
+    """Webhook update'larini navbatga olib, umumiy workerlar pulida qayta ishlaydi.
+
+    Har bir chatning o'z navbati bor va chat "tayyor chatlar" navbatida faqat
+    bir marta turadi. Bo'sh worker tayyor chatni oladi, uning bitta update'ini
+    bajaradi va chatda yana update bo'lsa, uni tayyor navbat oxiriga qaytaradi.
+    Shuning uchun bitta chatning xabarlari kelgan tartibida, bittadan qayta
+    ishlanadi, sekin chat esa faqat o'zini kutadi - boshqa chatlar bo'sh
+    workerlarga tushadi. Bir vaqtda ishlaydigan update'lar soni `workers`,
+    navbatdagilarning umumiy soni `queue_size`, bitta chatniki esa
+    `per_chat_limit` bilan chegaralangan; chegaradan oshsa submit() False
+    qaytaradi (backpressure) va bu faqat o'sha chatga ta'sir qiladi.
+
+    put() ga berilgan on_done update bajarilib bo'lgach (xato bilan bo'lsa ham)
+    chaqiriladi: ko'p jarayonli rejimda navbat qatori shundan keyingina o'chiriladi.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[Any]],
+        workers: int = 64,
+        queue_size: int = 2000,
+        per_chat_limit: int = 100,
+    ) -> None:
+        self._process = process
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.per_chat_limit = max(1, per_chat_limit)
+        # chat -> hali bajarilmagan update'lar. Kalit lug'atda bo'lsa, chat yoki
+        # tayyor navbatda turibdi, yoki uning update'i hozir bajarilmoqda.
+        self._chats: Dict[int, Deque[Tuple[Update, Optional[Callable[[], None]]]]] = {}
+        self._ready: "asyncio.Queue[int]" = asyncio.Queue()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._tasks: List[asyncio.Task] = []
+        # Navbatdagi va bajarilayotgan update'lar soni
+        self._pending = 0
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        for idx in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"update-worker-{idx}"))
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Navbatdagi update'larni drain_timeout ichida tugatishga harakat qiladi, keyin workerlarni to'xtatadi."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Navbatda %d ta update qayta ishlanmay qoldi", self.queue_depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, key: int, update: Update, on_done: Optional[Callable[[], None]] = None) -> None:
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((update, on_done))
+        self._pending += 1
+        if self._pending >= self.queue_size:
+            self._has_space.clear()
+        self.accepted += 1
+
+    def submit(self, update: Update) -> bool:
+        key = update_shard_key(update)
+        queue = self._chats.get(key)
+        if self._pending >= self.queue_size or (queue is not None and len(queue) >= self.per_chat_limit):
+            self.rejected += 1
+            return False
+        self._enqueue(key, update)
+        return True
+
+    async def put(self, update: Update, on_done: Optional[Callable[[], None]] = None) -> None:
+        """submit() kabi, lekin umumiy navbat to'lgan bo'lsa joy bo'shashini kutadi."""
+        while self._pending >= self.queue_size:
+            await self._has_space.wait()
+        self._enqueue(update_shard_key(update), update, on_done)
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update, on_done = queue.popleft()
+            self.in_flight += 1
+            try:
+                await self._process(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception("Update %s ni qayta ishlashda xato", update.update_id)
+            finally:
+                if on_done is not None:
+                    try:
+                        on_done()
+                    except Exception:
+                        logger.exception("Update %s uchun on_done xato berdi", update.update_id)
+                self.in_flight -= 1
+                self._pending -= 1
+                self._has_space.set()
+                if queue:
+                    # Chatning keyingi update'i boshqa chatlardan keyin navbatga turadi
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self._ready.task_done()
+
+    def queue_depth(self) -> int:
+        return self._pending - self.in_flight
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": self.queue_size,
+            "active_chats": len(self._chats),
+            "per_chat_limit": self.per_chat_limit,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,130 @@
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from db import add_user_listener, get_user_profile, get_user_profile_by_nick
+from ttl_cache import TTLCache
+
+try:
+    import config  # type: ignore
+except ImportError:
+    config = None
+
+logger = logging.getLogger(__name__)
+
+# Xotirada saqlanadigan profillar soni va ularning yaroqlilik muddati (soniya)
+USER_CACHE_SIZE: int = getattr(config, "USER_CACHE_SIZE", 5000) if config is not None else 5000
+USER_CACHE_TTL: float = getattr(config, "USER_CACHE_TTL", 3600) if config is not None else 3600
+
+# Keshda faqat parolsiz profil saqlanadi; parol hashi har safar bazadan o'qiladi
+_PROFILE_FIELDS = ("id", "telegram_id", "name", "surname", "nick")
+
+_by_id = TTLCache(maxsize=USER_CACHE_SIZE, default_ttl=USER_CACHE_TTL)
+_by_nick = TTLCache(maxsize=USER_CACHE_SIZE, default_ttl=USER_CACHE_TTL)
+# Har bir bekor qilishda oshadi: bazadan o'qish paytida profil o'chirilsa,
+# eskirgan natija keshga yozilmaydi
+_invalidations = 0
+_listener_registered = False
+
+
+def slim_profile(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """users qatoridan faqat ochiq maydonlarni qoldiradi (password_hash tushib qoladi)."""
+    if row is None:
+        return None
+    return {field: row.get(field) for field in _PROFILE_FIELDS}
+
+
+def _on_user_changed(user_id: int, nick: str) -> None:
+    invalidate_user(user_id, nick)
+
+
+def _ensure_listener() -> None:
+    global _listener_registered
+    if not _listener_registered:
+        add_user_listener(_on_user_changed)
+        _listener_registered = True
+
+
+def _ttl_if_fresh(seen: int):
+    # Topilmagan profil ham keshlanadi: create_user listener'i nickni bekor qiladi
+    return lambda _value: USER_CACHE_TTL if seen == _invalidations else None
+
+
+def _remember(profile: Dict[str, Any]) -> None:
+    _by_id.set(profile["id"], profile)
+    if profile.get("nick"):
+        _by_nick.set(profile["nick"].lower(), profile)
+
+
+async def get_profile(user_id: int) -> Optional[Dict[str, Any]]:
+    """id bo'yicha parolsiz profil (avval xotiradan, keyin SQLite'dan)."""
+    _ensure_listener()
+    seen = _invalidations
+
+    async def load() -> Optional[Dict[str, Any]]:
+        return slim_profile(await get_user_profile(user_id))
+
+    profile = await _by_id.get_or_load(user_id, load, ttl_for=_ttl_if_fresh(seen))
+    return dict(profile) if profile is not None else None
+
+
+async def get_profile_by_nick(nick: str) -> Optional[Dict[str, Any]]:
+    """Nick bo'yicha (case-insensitive) parolsiz profil."""
+    _ensure_listener()
+    key = nick.strip().lower()
+    if not key:
+        return None
+    seen = _invalidations
+
+    async def load() -> Optional[Dict[str, Any]]:
+        profile = slim_profile(await get_user_profile_by_nick(key))
+        if profile is not None and seen == _invalidations:
+            _by_id.set(profile["id"], profile)
+        return profile
+
+    profile = await _by_nick.get_or_load(key, load, ttl_for=_ttl_if_fresh(seen))
+    return dict(profile) if profile is not None else None
+
+
+def invalidation_count() -> int:
+    """Bekor qilishlar hisoblagichi: bazadan o'qishdan oldin olinib, prime_profiles ga beriladi."""
+    _ensure_listener()
+    return _invalidations
+
+
+def prime_profiles(rows: Iterable[Dict[str, Any]], seen: Optional[int] = None) -> None:
+    """Qidiruv natijalarini keshga qo'shadi: keyingi profil tanlash bazaga bormaydi.
+
+    seen - bazadan o'qishdan oldingi invalidation_count(). O'qish davomida biror
+    profil o'zgargan yoki o'chirilgan bo'lsa, natijalar keshga yozilmaydi.
+    """
+    _ensure_listener()
+    if seen is not None and seen != _invalidations:
+        return
+    for row in rows:
+        profile = slim_profile(row)
+        if profile is not None and profile.get("id") is not None:
+            _remember(profile)
+
+
+def invalidate_user(user_id: Optional[int] = None, nick: Optional[str] = None) -> None:
+    """Profil yaratilganda yoki o'chirilganda uning id va nick yozuvlarini bekor qiladi."""
+    global _invalidations
+    _invalidations += 1
+    if user_id is not None:
+        _by_id.invalidate(user_id)
+        _by_nick.invalidate_matching(lambda key: (_by_nick.peek(key) or {}).get("id") == user_id)
+    if nick:
+        _by_nick.invalidate(nick.lower())
+
+
+def user_cache_stats() -> Dict[str, Any]:
+    by_id = _by_id.stats()
+    by_nick = _by_nick.stats()
+    hits = by_id["hits"] + by_nick["hits"]
+    total = hits + by_id["misses"] + by_nick["misses"]
+    return {
+        "by_id": by_id,
+        "by_nick": by_nick,
+        "hit_ratio": (hits / total) if total else 0.0,
+        "invalidations": _invalidations,
+    }
@@ -0,0 +1,64 @@
+import re
+import unicodedata
+from typing import List, Set
+
+# O'zbek kirill yozuvidan lotinga (tutuq belgisiz, chunki qidiruvda o' = o)
+_CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h",
+}
+# Bo'g'in boshidagi "е" lotinda "ye" bo'ladi (Елена -> Yelena, Ербол -> Yerbol)
+_CYRILLIC_YE_RE = re.compile(r"(?:(?<=^)|(?<=[\sаеёиоуэюяўъь]))е")
+_APOSTROPHE_RE = re.compile("['ʻʼ‘’`´]")
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_name(text: str) -> str:
+    """Ism, familiya va nikni qidiruv uchun bir xil ko'rinishga keltiradi.
+
+    Kichik harf, kirill -> lotin, tutuq belgilari va diakritikalar olib tashlanadi:
+    "Oʻlmas", "O'lmas", "Ўлмас" va "Olmas" bir xil "olmas" beradi.
+    """
+    text = (text or "").lower()
+    text = _CYRILLIC_YE_RE.sub("ye", text)
+    text = "".join(_CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    text = _APOSTROPHE_RE.sub("", text)
+    text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    text = _NON_WORD_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def trigrams(text: str) -> List[str]:
+    """Normallashtirilgan matnning har bir so'zidagi 3 harfli bo'laklar (takrorlarsiz, tartib bilan)."""
+    seen: Set[str] = set()
+    result: List[str] = []
+    for word in text.split():
+        for i in range(len(word) - 2):
+            gram = word[i:i + 3]
+            if gram not in seen:
+                seen.add(gram)
+                result.append(gram)
+    return result
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Tahrir masofasi (Damerau-Levenshtein, OSA): qo'shni harflar almashishi ham bitta xato, "olmsa" -> "olmas" = 1."""
+    if a == b:
+        return 0
+    if not a or not b:
+        return len(a) or len(b)
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]